@@ -0,0 +1,41 @@
+"""
+Gunicorn settings for the `web` process (see Procfile). Values come from the environment,
+so they can be tuned per deployment without a code change.
+
+Each worker thread keeps its own persistent database connection (DATABASE_CONN_MAX_AGE),
+so the database sees up to WEB_CONCURRENCY * GUNICORN_THREADS connections per instance.
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+# Threads overlap the time requests spend waiting on the database and the cache
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Import Django once in the master; workers fork with the app loaded and share its memory pages
+preload_app = True
+
+# Recycle workers after a jittered number of requests, so slow leaks are bounded and the
+# workers do not all restart at once. Workers get graceful_timeout seconds to finish
+# their in-flight requests on restart or shutdown
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+accesslog = None
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def pre_fork(server, worker):
+    # A connection opened while preloading would be shared by every forked worker;
+    # close it in the master so each worker thread opens its own
+    from django.db import connections
+
+    connections.close_all()
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MingxMediaAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mingx_media_app'
+
+    def ready(self):
+        from . import checks  # noqa: F401
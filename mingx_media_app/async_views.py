@@ -0,0 +1,141 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .authentication import cached_principal, remember_principal
+from .comments import aadd_comment_previews
+from .models import Notification, Post
+from .pagination import KeysetPagination
+from .performance import timed
+from .realtime import format_event, get_hub, user_channel
+from .serializers import UserSerializer, fast_notification_serializer, fast_post_serializer
+from .views import feed_queryset
+
+# Native async read views for ASGI servers. They return the same JSON as their DRF
+# counterparts, awaiting the database through the async ORM instead of holding a worker
+# thread for the whole request.
+
+
+def json_response(data, status=200):
+    # Same bytes as the DRF views, through the first configured renderer
+    return HttpResponse(api_settings.DEFAULT_RENDERER_CLASSES[0]().render(data), status=status,
+                        content_type='application/json')
+
+
+async def authenticate(request, token_param=False):
+    # SimpleJWT authentication for async views; returns (user, None) or (None, error response)
+    with timed('auth'):
+        return await _authenticate(request, token_param)
+
+
+async def _authenticate(request, token_param):
+    authentication = JWTAuthentication()
+    try:
+        raw_token = request.GET.get('token') if token_param else None
+        if not raw_token:
+            header = authentication.get_header(request)
+            raw_token = authentication.get_raw_token(header) if header else None
+        if not raw_token:
+            return None, json_response({"detail": "Authentication credentials were not provided."}, status=401)
+        user_id = authentication.get_validated_token(raw_token)[jwt_settings.USER_ID_CLAIM]
+    except (AuthenticationFailed, KeyError):
+        return None, json_response({"detail": "Given token not valid for any token type"}, status=401)
+    user = cached_principal(user_id)
+    if user is None:
+        user = await User.objects.filter(**{jwt_settings.USER_ID_FIELD: user_id, 'is_active': True}).afirst()
+        if user is None:
+            return None, json_response({"detail": "User not found"}, status=401)
+        remember_principal(user)
+    return user, None
+
+
+async def afast_page(fast_serializer, queryset, request, ordering, extend=None):
+    # extend: optional coroutine function that adds fields to the serialized page in place
+    paginator = KeysetPagination()
+    rows = fast_serializer.values(queryset, *(field.lstrip('-') for field in ordering))
+    page = await paginator.apaginate_queryset(rows, Request(request), ordering=ordering)
+    results = fast_serializer.serialize(page)
+    if extend is not None:
+        await extend(results)
+    return json_response(paginator.get_paginated_response(results).data)
+
+
+async def feed(request):
+    user, error = await authenticate(request)
+    if error:
+        return error
+    posts, ordering = await sync_to_async(feed_queryset)(user, request.GET)
+    return await afast_page(fast_post_serializer, posts, request, ordering, extend=aadd_comment_previews)
+
+
+async def post_detail(request, pk):
+    user, error = await authenticate(request)
+    if error:
+        return error
+    row = await fast_post_serializer.values(Post.objects.filter(pk=pk)).afirst()
+    if row is None:
+        return json_response({"detail": "No Post matches the given query."}, status=404)
+    return json_response(fast_post_serializer.to_representation(row))
+
+
+async def user_detail(request, pk):
+    user, error = await authenticate(request)
+    if error:
+        return error
+    # Only allow users to see their own information
+    if not user.is_superuser and str(user.pk) != str(pk):
+        return json_response({"detail": "No User matches the given query."}, status=404)
+    try:
+        profile_user = await User.objects.select_related('profile__profile_picture_asset').aget(pk=pk)
+    except User.DoesNotExist:
+        return json_response({"detail": "No User matches the given query."}, status=404)
+    return json_response(UserSerializer(profile_user).data)
+
+
+async def notifications(request):
+    user, error = await authenticate(request)
+    if error:
+        return error
+    queryset = Notification.objects.filter(recipient=user)
+    return await afast_page(fast_notification_serializer, queryset, request, ('-created_at', '-id'))
+
+
+async def event_stream(request):
+    # Server-Sent Events: pushes new notifications and messages to the authenticated user.
+    # Browsers' EventSource cannot set headers, so the access token may also be passed as ?token=
+    if not isinstance(request, ASGIRequest):
+        # Under WSGI the open stream would hold a worker thread for as long as the client stays
+        return json_response({"error": "The event stream is only served by the ASGI server"}, status=501)
+    user, error = await authenticate(request, token_param=True)
+    if error:
+        return error
+    keepalive = settings.REALTIME.get('KEEPALIVE', 15)
+
+    async def events():
+        hub, channel = get_hub(), user_channel(user.pk)
+        queue = hub.subscribe(channel)
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                yield format_event(message)
+        finally:
+            hub.unsubscribe(channel, queue)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # disable proxy buffering (nginx)
+    return response
@@ -0,0 +1,80 @@
+import copy
+import functools
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.signals import setting_changed
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .caching import LocMemLRUBackend
+from .performance import timed
+
+
+def _config():
+    return getattr(settings, 'AUTH_PRINCIPAL_CACHE', {})
+
+
+@functools.lru_cache(maxsize=None)
+def principal_cache():
+    # Per process: a user saved in another process is seen here after at most TIMEOUT seconds
+    return LocMemLRUBackend(max_entries=_config().get('MAX_ENTRIES', 10000))
+
+
+@receiver(setting_changed)
+def _reset_principal_cache(setting, **kwargs):
+    if setting == 'AUTH_PRINCIPAL_CACHE':
+        principal_cache.cache_clear()
+
+
+def cached_principal(user_id):
+    # A private copy, so attributes set on request.user never leak into other requests
+    user = principal_cache().get(user_id)
+    return copy.copy(user) if user is not None else None
+
+
+def remember_principal(user):
+    timeout = _config().get('TIMEOUT', 60)
+    if timeout and user.is_active:
+        principal_cache().set(getattr(user, jwt_settings.USER_ID_FIELD), copy.copy(user), timeout)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_principal(sender, instance, **kwargs):
+    # Saves cover deactivation and password changes
+    principal_cache().delete(getattr(instance, jwt_settings.USER_ID_FIELD))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves the user from the token's user id claim through a
+    short-TTL in-process cache of User instances, so most requests skip the User query.
+    Inactive and missing users are never cached and fail as before.
+    """
+
+    def authenticate(self, request):
+        with timed('auth'):
+            return super().authenticate(request)
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = cached_principal(user_id)
+        if user is None:
+            user = super().get_user(validated_token)
+            remember_principal(user)
+            return user
+
+        if jwt_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(jwt_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
@@ -0,0 +1,224 @@
+import functools
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.utils.module_loading import import_string
+from rest_framework.response import Response
+
+from .renderers import dumps
+from .routers import replica_may_lag
+
+STAT_KEYS = ('hits', 'misses', 'not_modified')
+
+
+class BaseCacheBackend:
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, timeout):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def incr(self, key, delta=1):
+        raise NotImplementedError
+
+    def get_counter(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class LocMemLRUBackend(BaseCacheBackend):
+    # Per-process LRU with TTL, for single-node deployments
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        expires_at = time.monotonic() + timeout if timeout is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key, delta=1):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + delta
+            return self._counters[key]
+
+    def get_counter(self, key):
+        return self._counters.get(key, 0)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._counters.clear()
+
+
+class DjangoCacheBackend(BaseCacheBackend):
+    # Stores entries in a configured Django cache (Redis, Memcached, database...) so all
+    # gunicorn workers share responses, invalidations and counters
+    def __init__(self, alias='default', key_prefix='response'):
+        self.alias = alias
+        self.key_prefix = key_prefix
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _key(self, key):
+        return f'{self.key_prefix}:{key}'
+
+    def get(self, key):
+        return self.cache.get(self._key(key))
+
+    def set(self, key, value, timeout):
+        self.cache.set(self._key(key), value, timeout)
+
+    def delete(self, key):
+        self.cache.delete(self._key(key))
+
+    def incr(self, key, delta=1):
+        try:
+            return self.cache.incr(self._key(key), delta)
+        except ValueError:
+            if self.cache.add(self._key(key), delta, None):
+                return delta
+            return self.cache.incr(self._key(key), delta)
+
+    def get_counter(self, key):
+        return self.cache.get(self._key(key), 0)
+
+    def clear(self):
+        self.cache.clear()
+
+
+@functools.lru_cache(maxsize=None)
+def get_backend():
+    config = settings.RESPONSE_CACHE
+    return import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+
+
+@receiver(setting_changed)
+def _reset_backend(setting, **kwargs):
+    if setting == 'RESPONSE_CACHE':
+        get_backend.cache_clear()
+
+
+def _timeout():
+    return settings.RESPONSE_CACHE.get('TIMEOUT', 300)
+
+
+def _version_key(resource, identifier):
+    return f'version:{resource}:{identifier}'
+
+
+def current_version(resource, identifier):
+    # The version of a resource is the time it was last invalidated; it doubles as Last-Modified
+    backend = get_backend()
+    version = backend.get(_version_key(resource, identifier))
+    if version is None:
+        version = time.time()
+        backend.set(_version_key(resource, identifier), version, None)
+    return version
+
+
+def invalidate(resource, identifier):
+    # Bumped once the write commits: bumped earlier, a concurrent miss could read the
+    # uncommitted old row and cache it under the new version until the entry expires
+    transaction.on_commit(lambda: _bump_version(resource, identifier))
+
+
+def _bump_version(resource, identifier):
+    backend = get_backend()
+    previous = backend.get(_version_key(resource, identifier)) or 0
+    backend.set(_version_key(resource, identifier), max(time.time(), previous + 1e-6), None)
+
+
+def stats():
+    backend = get_backend()
+    counters = {name: backend.get_counter(f'stats:{name}') for name in STAT_KEYS}
+    lookups = counters['hits'] + counters['misses']
+    counters['hit_ratio'] = counters['hits'] / lookups if lookups else 0.0
+    return counters
+
+
+def _etag(data):
+    return '"%s"' % hashlib.md5(dumps(data, sort_keys=True), usedforsecurity=False).hexdigest()
+
+
+def cached_response(resource, lookup='pk'):
+    """
+    Cache a viewset method's 200 responses per resource and requesting user, with
+    ETag/Last-Modified headers and 304 handling for If-None-Match. Entries are keyed by the resource's
+    current version, so invalidate(resource, identifier) expires every variant at once.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return method(self, request, *args, **kwargs)
+
+            backend = get_backend()
+            identifier = kwargs[lookup]
+            version = current_version(resource, identifier)
+            user_id = request.user.pk if request.user.is_authenticated else 'anon'
+            path = hashlib.md5(request.get_full_path().encode('utf-8'), usedforsecurity=False).hexdigest()
+            key = f'response:{resource}:{identifier}:{version}:{user_id}:{path}'
+
+            entry = backend.get(key)
+            if entry is None:
+                backend.incr('stats:misses')
+                response = method(self, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                entry = (response.data, _etag(response.data))
+                # A replica may not have the change yet, so do not cache what it returned
+                if not replica_may_lag(version):
+                    backend.set(key, entry, _timeout())
+            else:
+                backend.incr('stats:hits')
+
+            data, etag = entry
+            response = Response(data)
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(int(version))
+            # Only the ETag is checked: Last-Modified has whole-second precision, so an
+            # If-Modified-Since would also match a change made later in the same second
+            conditional = get_conditional_response(request, etag=etag, response=response)
+            if conditional is not response:
+                backend.incr('stats:not_modified')
+            return conditional
+        return wrapper
+    return decorator
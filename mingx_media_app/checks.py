@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+from .models import Comment
+
+
+@register()
+def check_comment_depth(app_configs, **kwargs):
+    # A comment at COMMENT_MAX_DEPTH has that many ancestors, and each adds a path segment
+    max_length = Comment._meta.get_field('path').max_length
+    if (settings.COMMENT_MAX_DEPTH + 1) * Comment.PATH_WIDTH > max_length:
+        return [Error(
+            f"COMMENT_MAX_DEPTH={settings.COMMENT_MAX_DEPTH} does not fit Comment.path",
+            hint=f"Keep it at most {max_length // Comment.PATH_WIDTH - 1}, or widen Comment.path.",
+            id='mingx_media_app.E001',
+        )]
+    return []
@@ -0,0 +1,84 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from rest_framework import serializers
+
+from .models import Comment, NotificationEvent, Post
+from .notifications import enqueue
+from .serializers import fast_comment_serializer
+
+
+def create_comment(serializer, author):
+    # Save a new comment or reply and bump the post's and the parent's counters. The parent row
+    # is locked first: a reply waits for a delete of its thread and fails if the parent is gone
+    with transaction.atomic():
+        parent = serializer.validated_data.get('parent')
+        if parent is not None and not Comment.objects.select_for_update().filter(pk=parent.pk).exists():
+            raise serializers.ValidationError({"parent": "The parent comment was deleted"})
+        comment = serializer.save(author=author)
+        Post.objects.filter(pk=comment.post_id).update(comment_count=F('comment_count') + 1)
+        if comment.parent_id:
+            Comment.objects.filter(pk=comment.parent_id).update(reply_count=F('reply_count') + 1)
+        enqueue(comment.post.author_id, comment.author_id, NotificationEvent.COMMENT, comment.post_id)
+    return comment
+
+
+def delete_comment(comment):
+    # Replies are deleted with their parent, so the post loses the whole thread. The thread is
+    # locked so no reply is added under it meanwhile, and the post's counter drops by the rows
+    # the delete actually removed (none when a concurrent request got there first)
+    with transaction.atomic():
+        list(thread_queryset(comment).select_for_update().values_list('pk', flat=True))
+        _, deleted = comment.delete()
+        removed = deleted.get(Comment._meta.label, 0)
+        if removed:
+            Post.objects.filter(pk=comment.post_id).update(comment_count=F('comment_count') - removed)
+            if comment.parent_id:
+                Comment.objects.filter(pk=comment.parent_id).update(reply_count=F('reply_count') - 1)
+
+
+def thread_queryset(comment):
+    # The comment and all of its replies, at any depth; order by 'path' for depth-first. Paths
+    # are digits, so the replies sort between the comment's path and that path + '~'; a range
+    # rather than LIKE 'path%' lets the (post, path) index seek to the thread
+    return Comment.objects.filter(post_id=comment.post_id, path__gte=comment.path, path__lt=comment.path + '~')
+
+
+def preview_queryset(post_ids, size=None):
+    """
+    The `size` latest top-level comments of each post, for all posts in one query: rows
+    are numbered per post with ROW_NUMBER() and filtered on that number.
+    """
+    size = settings.FEED_COMMENT_PREVIEWS if size is None else size
+    ranked = Comment.objects.filter(post_id__in=post_ids, parent__isnull=True).annotate(
+        preview_rank=Window(RowNumber(), partition_by=F('post_id'), order_by=(F('created_at').desc(), F('id').desc())),
+    )
+    return fast_comment_serializer.values(ranked.filter(preview_rank__lte=size), 'preview_rank') \
+        .order_by('post_id', 'preview_rank')
+
+
+def attach_previews(posts, rows):
+    # Add 'comment_preview' (newest first) to serialized posts, from preview_queryset rows
+    by_post = defaultdict(list)
+    for row in rows:
+        by_post[row['post']].append(row)
+    for post in posts:
+        post['comment_preview'] = fast_comment_serializer.serialize(by_post.get(post['id'], []))
+    return posts
+
+
+def add_comment_previews(posts):
+    if settings.FEED_COMMENT_PREVIEWS and posts:
+        attach_previews(posts, preview_queryset([post['id'] for post in posts]))
+    return posts
+
+
+async def aadd_comment_previews(posts):
+    # add_comment_previews with the async ORM
+    if settings.FEED_COMMENT_PREVIEWS and posts:
+        rows = [row async for row in preview_queryset([post['id'] for post in posts])]
+        attach_previews(posts, rows)
+    return posts
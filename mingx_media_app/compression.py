@@ -0,0 +1,83 @@
+import gzip
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip is offered
+    brotli = None
+
+
+def config():
+    return getattr(settings, 'RESPONSE_COMPRESSION', {})
+
+
+def available_encodings():
+    # In order of preference when the client accepts several with the same weight
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def choose_encoding(accept_encoding, encodings=None):
+    """
+    The encoding to use for an Accept-Encoding header, or None. The highest q-value wins;
+    ties go to the first of `encodings`. A '*' covers encodings not listed explicitly.
+    """
+    encodings = encodings or available_encodings()
+    weights = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        name, quality = name.strip().lower(), 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            weights[name] = quality
+    best, best_quality = None, 0.0
+    for encoding in encodings:
+        quality = weights.get(encoding, weights.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(content, encoding):
+    if encoding == 'br':
+        return brotli.compress(content, quality=config().get('BROTLI_QUALITY', 4))
+    return gzip.compress(content, compresslevel=config().get('GZIP_LEVEL', 6), mtime=0)
+
+
+def compress_response(request, response):
+    """
+    Compress a response with the best encoding the client accepts, when it has a
+    compressible content type and at least MIN_SIZE bytes. Streaming responses (the SSE
+    stream) and responses that are already encoded are left alone.
+    """
+    if response.streaming or response.has_header('Content-Encoding'):
+        return response
+    content_type = response.get('Content-Type', '').split(';', 1)[0].strip().lower()
+    if content_type not in config().get('CONTENT_TYPES', ('application/json',)):
+        return response
+    if len(response.content) < config().get('MIN_SIZE', 1024):
+        return response
+
+    # Caches must keep the encodings apart, whichever one this client gets
+    patch_vary_headers(response, ('Accept-Encoding',))
+    encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    if encoding is None:
+        return response
+    compressed = compress(response.content, encoding)
+    if len(compressed) >= len(response.content):
+        return response
+
+    response.content = compressed
+    response['Content-Length'] = str(len(compressed))
+    response['Content-Encoding'] = encoding
+    # The bytes differ from the uncompressed representation, so a strong ETag becomes weak
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+        response['ETag'] = 'W/' + etag
+    return response
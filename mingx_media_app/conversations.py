@@ -0,0 +1,44 @@
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, When
+
+from .models import Conversation, ConversationMember, Message
+
+
+def conversation_key(*user_ids):
+    return ':'.join(str(user_id) for user_id in sorted(set(user_ids)))
+
+
+def get_or_create_conversation(sender_id, recipient_id):
+    conversation, created = Conversation.objects.get_or_create(key=conversation_key(sender_id, recipient_id))
+    if created:
+        ConversationMember.objects.bulk_create(
+            [ConversationMember(conversation=conversation, user_id=user_id, last_message_at=conversation.last_message_at)
+             for user_id in {sender_id, recipient_id}],
+            ignore_conflicts=True,
+        )
+    return conversation
+
+
+def record_message(message):
+    # Bump the thread to the top of both inboxes and count it as unread for the recipient
+    Conversation.objects.filter(pk=message.conversation_id).update(
+        last_message=message, last_message_at=message.created_at,
+    )
+    unread = F('unread_count')
+    if message.recipient_id != message.sender_id:
+        unread = Case(
+            When(user_id=message.recipient_id, then=F('unread_count') + 1),
+            default=F('unread_count'),
+            output_field=PositiveIntegerField(),
+        )
+    ConversationMember.objects.filter(conversation_id=message.conversation_id).update(
+        last_message_at=message.created_at, unread_count=unread,
+    )
+
+
+def mark_conversation_read(conversation_id, user_id):
+    with transaction.atomic():
+        marked = Message.objects.filter(conversation_id=conversation_id, recipient_id=user_id, is_read=False) \
+            .update(is_read=True)
+        ConversationMember.objects.filter(conversation_id=conversation_id, user_id=user_id).update(unread_count=0)
+    return marked
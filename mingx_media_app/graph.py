@@ -0,0 +1,286 @@
+import heapq
+import logging
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# User ids are 32-bit AutoField values, so 4-byte signed ints are enough
+TYPECODE = 'i'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class Adjacency:
+    """
+    Compressed sparse row adjacency: the neighbours of nodes[i] are the sorted slice
+    targets[offsets[i]:offsets[i + 1]]. Built from (node, target) pairs sorted by node,
+    then target; consecutive duplicates are dropped.
+    """
+
+    def __init__(self, pairs=()):
+        self.nodes = array(TYPECODE)
+        self.offsets = array('q', [0])
+        self.targets = array(TYPECODE)
+        previous = None
+        for node, target in pairs:
+            if (node, target) == previous:
+                continue
+            if previous is None or node != previous[0]:
+                if previous is not None:
+                    self.offsets.append(len(self.targets))
+                self.nodes.append(node)
+            self.targets.append(target)
+            previous = (node, target)
+        if previous is not None:
+            self.offsets.append(len(self.targets))
+
+    def _bounds(self, node):
+        index = bisect_left(self.nodes, node)
+        if index < len(self.nodes) and self.nodes[index] == node:
+            return self.offsets[index], self.offsets[index + 1]
+        return 0, 0
+
+    def neighbors(self, node):
+        start, end = self._bounds(node)
+        return self.targets[start:end]
+
+    def degree(self, node):
+        start, end = self._bounds(node)
+        return end - start
+
+    def contains(self, node, target):
+        start, end = self._bounds(node)
+        index = bisect_left(self.targets, target, start, end)
+        return index < end and self.targets[index] == target
+
+    def nbytes(self):
+        return sum(part.itemsize * len(part) for part in (self.nodes, self.offsets, self.targets))
+
+
+class Overlay:
+    # Edges added or removed since the CSR arrays were built
+    def __init__(self):
+        self.added = defaultdict(set)
+        self.removed = defaultdict(set)
+        self.size = 0
+
+    def add(self, node, target):
+        self.removed[node].discard(target)
+        self.added[node].add(target)
+        self.size += 1
+
+    def remove(self, node, target):
+        self.added[node].discard(target)
+        self.removed[node].add(target)
+        self.size += 1
+
+
+class FollowGraph:
+    """
+    The follow graph held in memory as two CSR adjacencies (following and followers)
+    plus an overlay of the edges changed since they were built. Reads never hit the
+    database; the arrays are rebuilt every GRAPH_RELOAD_INTERVAL seconds (picking up
+    writes made by other processes) or once the overlay holds GRAPH_MAX_OVERLAY edges.
+    """
+
+    def __init__(self, following=None, followers=None):
+        self.following = following or Adjacency()
+        self.followers = followers or Adjacency()
+        self._following_delta = Overlay()
+        self._followers_delta = Overlay()
+        self.loaded_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls):
+        from .models import Follow
+
+        def pairs(*order):
+            return Follow.objects.order_by(*order).values_list(*order).iterator(chunk_size=10000)
+
+        following = Adjacency(pairs('follower_id', 'following_id'))
+        followers = Adjacency(pairs('following_id', 'follower_id'))
+        return cls(following, followers)
+
+    def add_edge(self, follower_id, following_id):
+        with self._lock:
+            self._following_delta.add(follower_id, following_id)
+            self._followers_delta.add(following_id, follower_id)
+
+    def remove_edge(self, follower_id, following_id):
+        with self._lock:
+            self._following_delta.remove(follower_id, following_id)
+            self._followers_delta.remove(following_id, follower_id)
+
+    def overlay_size(self):
+        return self._following_delta.size
+
+    def _merged(self, adjacency, delta, node):
+        base = adjacency.neighbors(node)
+        with self._lock:
+            added = delta.added.get(node)
+            removed = delta.removed.get(node)
+            if not added and not removed:
+                return base
+            merged = set(base)
+            merged -= removed or set()
+            merged |= added or set()
+        return array(TYPECODE, sorted(merged))
+
+    def following_ids(self, user_id):
+        return self._merged(self.following, self._following_delta, user_id)
+
+    def follower_ids(self, user_id):
+        return self._merged(self.followers, self._followers_delta, user_id)
+
+    def follower_count(self, user_id):
+        with self._lock:
+            changed = user_id in self._followers_delta.added or user_id in self._followers_delta.removed
+        if changed:
+            return len(self.follower_ids(user_id))
+        return self.followers.degree(user_id)
+
+    def is_following(self, follower_id, following_id):
+        with self._lock:
+            if following_id in self._following_delta.added.get(follower_id, ()):
+                return True
+            if following_id in self._following_delta.removed.get(follower_id, ()):
+                return False
+        return self.following.contains(follower_id, following_id)
+
+    def mutuals(self, user_id, other_id):
+        # Accounts user_id follows that also follow other_id: a merge of two sorted lists
+        left, right = self.following_ids(user_id), self.follower_ids(other_id)
+        result, i, j = [], 0, 0
+        while i < len(left) and j < len(right):
+            if left[i] == right[j]:
+                result.append(left[i])
+                i += 1
+                j += 1
+            elif left[i] < right[j]:
+                i += 1
+            else:
+                j += 1
+        return result
+
+    def suggestions(self, user_id, limit=20):
+        """
+        Friends-of-friends ranking: accounts followed by the most of the people user_id
+        follows, ties broken by follower count. Returns [(user_id, mutual_count)].
+        Work is capped by GRAPH_SUGGESTION_FANOUT followees and accounts per followee.
+        """
+        fanout = _setting('GRAPH_SUGGESTION_FANOUT', 200)
+        followed = self.following_ids(user_id)
+        scores = defaultdict(int)
+        for followee in followed[:fanout]:
+            for candidate in self.following_ids(followee)[:fanout]:
+                scores[candidate] += 1
+
+        followed = set(followed)
+        candidates = (
+            (count, self.follower_count(candidate), -candidate)
+            for candidate, count in scores.items()
+            if candidate != user_id and candidate not in followed
+        )
+        return [(-candidate, count) for count, _, candidate in heapq.nlargest(limit, candidates)]
+
+    def nbytes(self):
+        return self.following.nbytes() + self.followers.nbytes()
+
+
+_graph = None
+_graph_lock = threading.Lock()  # guards _graph and _journal
+_reload_lock = threading.Lock()  # one rebuild at a time
+# Follow changes recorded while a rebuild reads the Follow table, replayed onto it before the swap
+_journal = None
+
+
+def get_graph():
+    """
+    The process-wide graph. The first call loads it; once stale, it is rebuilt in a
+    background thread while requests keep reading the current snapshot.
+    """
+    graph = _graph
+    if graph is None:
+        with _reload_lock:
+            if _graph is None:
+                reload_graph()  # nothing to serve yet
+            return _graph
+    if _is_stale(graph) and _reload_lock.acquire(blocking=False):
+        if _graph is graph:
+            threading.Thread(target=_reload_in_background, name='graph-reload', daemon=True).start()
+        else:
+            _reload_lock.release()  # rebuilt since this request read it
+    return graph
+
+
+def reload_graph():
+    # Read the Follow table into a new graph and swap it in. Changes committed meanwhile may be
+    # missing from what was read, so the ones recorded since the read began are replayed first
+    global _graph, _journal
+    with _graph_lock:
+        _journal = []
+    try:
+        graph = FollowGraph.load()
+        with _graph_lock:
+            for follow, follower_id, following_id in _journal:
+                if follow:
+                    graph.add_edge(follower_id, following_id)
+                else:
+                    graph.remove_edge(follower_id, following_id)
+            _graph = graph
+    finally:
+        with _graph_lock:
+            _journal = None
+    return graph
+
+
+def _reload_in_background():
+    try:
+        reload_graph()
+    except Exception:
+        logger.exception("Rebuilding the follow graph failed; serving the previous snapshot")
+    finally:
+        connections.close_all()  # this thread's own
+        _reload_lock.release()
+
+
+def _is_stale(graph):
+    return (time.monotonic() - graph.loaded_at > _setting('GRAPH_RELOAD_INTERVAL', 300)
+            or graph.overlay_size() > _setting('GRAPH_MAX_OVERLAY', 100000))
+
+
+def reset_graph():
+    global _graph
+    with _graph_lock:
+        _graph = None
+
+
+def _record(follow, follower_id, following_id):
+    # Only touches a graph that is already loaded; a load in progress replays it from the journal
+    with _graph_lock:
+        if _journal is not None:
+            _journal.append((follow, follower_id, following_id))
+        graph = _graph
+    if graph is not None:
+        if follow:
+            graph.add_edge(follower_id, following_id)
+        else:
+            graph.remove_edge(follower_id, following_id)
+
+
+def record_follow(follower_id, following_id):
+    _record(True, follower_id, following_id)
+
+
+def record_unfollow(follower_id, following_id):
+    _record(False, follower_id, following_id)
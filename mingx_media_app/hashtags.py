@@ -0,0 +1,58 @@
+import re
+
+from .models import Hashtag, Post
+
+HASHTAG_RE = re.compile(r'(?<![\w#])#(\w+)')
+MAX_LENGTH = Hashtag._meta.get_field('name').max_length
+
+PostHashtag = Post.hashtags.through
+
+
+def normalize(name):
+    return name.lstrip('#').lower()
+
+
+def extract_hashtags(content):
+    # Unique, lowercased tags in order of appearance; tags too long to store are ignored
+    names = []
+    for name in HASHTAG_RE.findall(content or ''):
+        name = normalize(name)
+        if len(name) <= MAX_LENGTH and name not in names:
+            names.append(name)
+    return names
+
+
+def sync_post_hashtags(posts):
+    """
+    Link each post to the hashtags in its content and unlink the ones it no longer
+    mentions. Runs a fixed number of queries however many posts and tags there are,
+    and returns the names of the hashtags whose post lists changed.
+    """
+    wanted = {post.id: set(extract_hashtags(post.content)) for post in posts}
+    names = set().union(*wanted.values()) if wanted else set()
+
+    tag_ids = {}
+    if names:
+        Hashtag.objects.bulk_create([Hashtag(name=name) for name in names], ignore_conflicts=True)
+        tag_ids = dict(Hashtag.objects.filter(name__in=names).values_list('name', 'id'))
+
+    existing = {}
+    for link_id, post_id, tag_id, name in PostHashtag.objects.filter(post_id__in=wanted).values_list(
+        'id', 'post_id', 'hashtag_id', 'hashtag__name'
+    ):
+        existing[(post_id, tag_id)] = link_id
+        tag_ids.setdefault(name, tag_id)
+
+    desired = {(post_id, tag_ids[name]) for post_id, tag_names in wanted.items() for name in tag_names}
+    stale = {key: link_id for key, link_id in existing.items() if key not in desired}
+    if stale:
+        PostHashtag.objects.filter(id__in=stale.values()).delete()
+    missing = desired - existing.keys()
+    if missing:
+        PostHashtag.objects.bulk_create(
+            [PostHashtag(post_id=post_id, hashtag_id=tag_id) for post_id, tag_id in missing],
+            ignore_conflicts=True,
+        )
+    # Names of the hashtags whose post lists changed
+    changed = {tag_id for _, tag_id in missing} | {tag_id for _, tag_id in stale}
+    return {name for name, tag_id in tag_ids.items() if tag_id in changed}
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from mingx_media_app.hashtags import sync_post_hashtags
+from mingx_media_app.models import Post
+
+
+class Command(BaseCommand):
+    help = "Extract #hashtags from existing posts and link them, in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="Number of posts processed per batch.")
+        parser.add_argument('--start-id', type=int, default=0,
+                            help="Resume after this post id.")
+
+    def handle(self, *args, **options):
+        last_id = options['start_id']
+        processed = 0
+        while True:
+            posts = list(
+                Post.objects.filter(id__gt=last_id).order_by('id').only('id', 'content')[:options['chunk_size']]
+            )
+            if not posts:
+                break
+            sync_post_hashtags(posts)
+            processed += len(posts)
+            last_id = posts[-1].id
+            self.stdout.write(f"Processed {processed} posts (last id {last_id})")
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {processed} posts"))
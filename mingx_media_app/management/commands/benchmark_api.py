@@ -0,0 +1,233 @@
+import json
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from mingx_media_app.models import Follow, Like, Post, Repost
+from social_media_api.urls import router
+
+# Query strings for GET routes that need one, by route name
+QUERY_PARAMS = {
+    'post-batch': lambda sample: {'ids': ','.join(map(str, sample['post_ids']))},
+    'post-search': lambda sample: {'q': 'coffee'},
+    'comment-list': lambda sample: {'post': sample['post_id']},
+    'post-comments': lambda sample: {'threaded': 1},
+}
+
+# Bodies for the POST routes that are benchmarked, by route name; other writes are skipped
+PAYLOADS = {
+    'post-list': lambda sample: {'content': "Benchmark post #benchmark"},
+    'like-list': lambda sample: {'post': sample['post_id']},
+    'like-batch': lambda sample: {'like': sample['post_ids'][:10], 'unlike': sample['post_ids'][10:]},
+    'repost-list': lambda sample: {'post_id': sample['post_id']},
+    'follow-list': lambda sample: {'following': sample['other'].username},
+    'follow-bulk-import': lambda sample: {'usernames': sample['usernames']},
+    'message-list': lambda sample: {'recipient': sample['other'].id, 'content': "Benchmark message"},
+    'notification-mark-all-read': lambda sample: {},
+    'conversation-read': lambda sample: {},
+    'post-comments': lambda sample: {'content': "Benchmark comment"},
+}
+
+
+class Command(BaseCommand):
+    help = ("Drive every endpoint registered on the API router in-process, as one authenticated user, and "
+            "report throughput, p50/p95/p99 latency and queries per request. Writes run in a transaction "
+            "that is rolled back. Results can be saved as a baseline and compared against later runs. "
+            "Run it against data made by generate_data.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help="Benchmark as this user (default: the user following the most accounts).")
+        parser.add_argument('--requests', type=int, default=100, help="Measured requests per endpoint.")
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--endpoint', action='append', dest='endpoints',
+                            help="Only run endpoints whose name contains this text (repeatable).")
+        parser.add_argument('--no-writes', action='store_true', help="Only benchmark GET routes.")
+        parser.add_argument('--save', metavar='PATH', help="Write the results to this JSON file.")
+        parser.add_argument('--compare', metavar='PATH', help="Compare with a baseline saved by --save.")
+        parser.add_argument('--threshold', type=float, default=20.0,
+                            help="Percent p50 slowdown reported as a regression (default 20).")
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help="Exit with an error when a regression is found, e.g. in CI.")
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['username'])
+        sample = self.sample(user)
+        client = APIClient(raise_request_exception=False)
+        host = settings.ALLOWED_HOSTS[0].lstrip('.').replace('*', 'localhost')
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}', HTTP_HOST=host)
+
+        results, skipped = {}, []
+        for name, method, path, data in self.endpoints(client, sample, skipped):
+            if options['no_writes'] and method != 'GET':
+                continue
+            if options['endpoints'] and not any(text in name for text in options['endpoints']):
+                continue
+            results[name] = self.measure(client, method, path, data, options)
+
+        baseline = self.load_baseline(options['compare']) if options['compare'] else {}
+        regressions = self.report(results, baseline, options['threshold'])
+        if skipped:
+            self.stdout.write(f"Not benchmarked (no request body defined or nothing to look up): {', '.join(skipped)}")
+
+        if options['save']:
+            with open(options['save'], 'w') as file:
+                json.dump({
+                    'created_at': timezone.now().isoformat(),
+                    'database': connection.vendor,
+                    'username': user.username,
+                    'requests': options['requests'],
+                    'results': results,
+                }, file, indent=2, sort_keys=True)
+            self.stdout.write(f"Saved results to {options['save']}")
+        if regressions:
+            message = f"{len(regressions)} regression(s): {', '.join(regressions)}"
+            if options['fail_on_regression']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+
+    def get_user(self, username):
+        users = User.objects.filter(is_active=True)
+        if username:
+            user = users.filter(username=username).first()
+        else:
+            user = users.order_by('-profile__following_count', 'id').first()
+        if user is None:
+            raise CommandError("No user to benchmark as; run generate_data first")
+        return user
+
+    def sample(self, user):
+        # Ids the endpoints are called with; write targets are chosen so each write really creates a row
+        posts = Post.objects.order_by('-created_at', '-id')
+        untouched = posts.exclude(id__in=Like.objects.filter(user=user).values('post_id')) \
+            .exclude(id__in=Repost.objects.filter(user=user).values('original_post_id'))
+        others = User.objects.exclude(id=user.id).exclude(
+            id__in=Follow.objects.filter(follower=user).values('following_id'))
+        return {
+            'post_id': untouched.values_list('id', flat=True).first(),
+            'post_ids': list(posts.values_list('id', flat=True)[:20]),
+            'other': others.order_by('id').first(),
+            'usernames': list(others.order_by('id').values_list('username', flat=True)[:20]),
+        }
+
+    def endpoints(self, client, sample, skipped):
+        """
+        Yield (name, method, path, data) for every route of the router: list and create,
+        retrieve, and the extra actions. Detail routes use the first item of the list.
+        Updates and deletes are not benchmarked.
+        """
+        for prefix, viewset, basename in router.registry:
+            lookup = None
+            if hasattr(viewset, 'list'):
+                path = f'/{prefix}/'
+                yield f'{basename}-list', 'GET', path, QUERY_PARAMS.get(f'{basename}-list', dict)(sample)
+                lookup = self.first_lookup(client, path, viewset)
+                if hasattr(viewset, 'create'):
+                    yield from self.write(f'{basename}-list', path, sample, skipped)
+            if hasattr(viewset, 'retrieve'):
+                if lookup is None:
+                    skipped.append(f'{basename}-detail')
+                else:
+                    yield f'{basename}-detail', 'GET', f'/{prefix}/{lookup}/', {}
+
+            for action in viewset.get_extra_actions():
+                name = f'{basename}-{action.url_name}'
+                if action.detail and lookup is None:
+                    skipped.append(name)
+                    continue
+                path = f'/{prefix}/{lookup}/{action.url_path}/' if action.detail else f'/{prefix}/{action.url_path}/'
+                if 'get' in action.mapping:
+                    yield name, 'GET', path, QUERY_PARAMS.get(name, dict)(sample)
+                if 'post' in action.mapping:
+                    yield from self.write(name, path, sample, skipped)
+
+    def write(self, name, path, sample, skipped):
+        if name in PAYLOADS:
+            yield f'{name} POST', 'POST', path, PAYLOADS[name](sample)
+        else:
+            skipped.append(f'{name} POST')
+
+    def first_lookup(self, client, path, viewset):
+        response = client.get(path)
+        if response.status_code != 200:
+            return None
+        data = response.data
+        items = data.get('results', []) if isinstance(data, dict) else data
+        if not items:
+            return None
+        lookup_field = getattr(viewset, 'lookup_field', 'pk')
+        return items[0].get(lookup_field, items[0].get('id'))
+
+    def request(self, client, method, path, data):
+        if method == 'GET':
+            return client.get(path, data)
+        # Writes are rolled back, so every request sees the same data
+        with transaction.atomic():
+            response = client.generic(method, path, json.dumps(data), content_type='application/json')
+            transaction.set_rollback(True)
+        return response
+
+    def measure(self, client, method, path, data, options):
+        for _ in range(options['warmup']):
+            self.request(client, method, path, data)
+        # Counted with an execute wrapper: it survives the reconnect after each request
+        queries = []
+        with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+            status = self.request(client, method, path, data).status_code
+
+        latencies, errors = [], 0
+        for _ in range(options['requests']):
+            start = time.perf_counter()
+            response = self.request(client, method, path, data)
+            latencies.append(time.perf_counter() - start)
+            errors += response.status_code >= 400
+        percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        return {
+            'path': path,
+            'status': status,
+            'errors': errors,
+            'rps': len(latencies) / sum(latencies),
+            'p50': statistics.median(latencies) * 1000,
+            'p95': percentiles[94] * 1000,
+            'p99': percentiles[98] * 1000,
+            'queries': len(queries),
+        }
+
+    def load_baseline(self, path):
+        try:
+            with open(path) as file:
+                return json.load(file)['results']
+        except (OSError, ValueError, KeyError) as exc:
+            raise CommandError(f"Cannot read baseline {path}: {exc}")
+
+    def report(self, results, baseline, threshold):
+        # Single client, sequential requests: req/s is the inverse of the mean latency
+        header = f"{'endpoint':<34}{'status':>7}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}"
+        if baseline:
+            header += f"{'p50 vs base':>13}{'queries vs base':>17}"
+        self.stdout.write(header)
+
+        regressions = []
+        for name, result in results.items():
+            line = (f"{name:<34}{result['status']:>7}{result['rps']:>9.0f}{result['p50']:>9.2f}"
+                    f"{result['p95']:>9.2f}{result['p99']:>9.2f}{result['queries']:>9}")
+            base = baseline.get(name)
+            if base:
+                # The median is compared: tail percentiles of a short in-process run are too noisy
+                change = (result['p50'] / base['p50'] - 1) * 100 if base['p50'] else 0.0
+                query_change = result['queries'] - base['queries']
+                regressed = change > threshold or query_change > 0
+                line += f"{change:>+12.0f}%{query_change:>+17d}"
+                if regressed:
+                    regressions.append(name)
+                    line = self.style.ERROR(line)
+            elif baseline:
+                line += f"{'new':>13}"
+            self.stdout.write(line)
+        return regressions
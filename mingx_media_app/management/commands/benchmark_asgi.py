@@ -0,0 +1,144 @@
+import http.client
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from mingx_media_app.models import Follow, Notification, Post
+from mingx_media_app.timeline import rebuild_timeline
+
+ENDPOINTS = {
+    'feed': ('/feed/', '/async/feed/'),
+    'post': ('/posts/{post_id}/', '/async/posts/{post_id}/'),
+    'user': ('/users/{user_id}/', '/async/users/{user_id}/'),
+    'notifications': ('/notifications/', '/async/notifications/'),
+}
+
+
+class Command(BaseCommand):
+    help = ("Compare throughput and latency of the sync views under gunicorn (WSGI) with the async "
+            "views under uvicorn (ASGI), at the same worker count. Runs against the configured database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', choices=sorted(ENDPOINTS), default='feed')
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds of load per server.")
+        parser.add_argument('--posts', type=int, default=500)
+        parser.add_argument('--port', type=int, default=8701)
+
+    def handle(self, *args, **options):
+        # The servers run in other processes, so the data has to be committed; it is deleted afterwards
+        reader = User.objects.create(username='__benchmark_asgi_reader__')
+        author = User.objects.create(username='__benchmark_asgi_author__')
+        try:
+            Follow.objects.create(follower=reader, following=author)
+            Post.objects.bulk_create(
+                (Post(author=author, content=f"benchmark post {i}") for i in range(options['posts'])),
+                batch_size=1000,
+            )
+            Notification.objects.bulk_create(
+                Notification(recipient=reader, message=f"benchmark {i}") for i in range(options['posts'])
+            )
+            rebuild_timeline(reader.id)
+            post_id = Post.objects.filter(author=author).values_list('id', flat=True).first()
+            token = str(AccessToken.for_user(reader))
+
+            sync_path, async_path = (
+                path.format(post_id=post_id, user_id=reader.id) for path in ENDPOINTS[options['endpoint']]
+            )
+            servers = [
+                ('WSGI gunicorn (sync)', sync_path, [
+                    sys.executable, '-m', 'gunicorn', 'social_media_api.wsgi', '--workers', str(options['workers']),
+                    '--bind', f"127.0.0.1:{options['port']}", '--log-level', 'warning',
+                ]),
+                ('ASGI uvicorn (async)', async_path, [
+                    sys.executable, '-m', 'uvicorn', 'social_media_api.asgi:application',
+                    '--workers', str(options['workers']), '--host', '127.0.0.1', '--port', str(options['port']),
+                    '--log-level', 'warning', '--no-access-log',
+                ]),
+            ]
+            results = [(name, path, self.run_server(command, path, token, options)) for name, path, command in servers]
+        finally:
+            User.objects.filter(id__in=[reader.id, author.id]).delete()
+
+        self.stdout.write(f"{options['workers']} workers, {options['concurrency']} concurrent clients, "
+                          f"{options['duration']:.0f}s per server")
+        self.stdout.write(f"{'server':<24}{'path':<26}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}")
+        for name, path, (count, latencies, errors, elapsed) in results:
+            p50 = statistics.median(latencies) * 1000 if latencies else 0
+            p99 = statistics.quantiles(latencies, n=100)[98] * 1000 if len(latencies) > 1 else p50
+            self.stdout.write(f"{name:<24}{path:<26}{count / elapsed:>9.0f}{p50:>9.1f}{p99:>9.1f}{errors:>8}")
+
+    def run_server(self, command, path, token, options):
+        process = subprocess.Popen(command, env=os.environ.copy())
+        try:
+            headers = {
+                'Host': next((host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*'), 'localhost'),
+                'Authorization': f'Bearer {token}',
+            }
+            self.wait_until_ready(options['port'], path, headers, process)
+            return self.load(options['port'], path, headers, options['concurrency'], options['duration'])
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    def wait_until_ready(self, port, path, headers, process, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f"Server exited with status {process.returncode}")
+            try:
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+                connection.request('GET', path, headers=headers)
+                status = connection.getresponse().status
+                connection.close()
+                if status != 200:
+                    raise CommandError(f"GET {path} returned {status}")
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError("Server did not start in time")
+
+    def load(self, port, path, headers, concurrency, duration):
+        latencies, errors = [], [0]
+        lock = threading.Lock()
+        stop_at = time.monotonic() + duration
+
+        def client():
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            local, failed = [], 0
+            while time.monotonic() < stop_at:
+                start = time.perf_counter()
+                try:
+                    connection.request('GET', path, headers=headers)
+                    response = connection.getresponse()
+                    response.read()
+                    if response.status != 200:
+                        failed += 1
+                        continue
+                except (OSError, http.client.HTTPException):
+                    failed += 1
+                    connection.close()
+                    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                    continue
+                local.append(time.perf_counter() - start)
+            connection.close()
+            with lock:
+                latencies.extend(local)
+                errors[0] += failed
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=client) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return len(latencies), latencies, errors[0], time.perf_counter() - start
@@ -0,0 +1,51 @@
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+from mingx_media_app.authentication import CachedJWTAuthentication, principal_cache
+
+
+class Command(BaseCommand):
+    help = "Measure per-request authentication cost of JWTAuthentication and CachedJWTAuthentication."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        total, repeat = options['requests'], options['repeat']
+
+        # Seed inside a transaction that is rolled back, so the benchmark leaves no data behind
+        with transaction.atomic():
+            user = User.objects.create(username='__benchmark_auth__')
+            request = APIRequestFactory().get('/feed/', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+            principal_cache().clear()
+
+            results = []
+            for name, authentication in [('JWTAuthentication', JWTAuthentication()),
+                                         ('CachedJWTAuthentication', CachedJWTAuthentication())]:
+                authentication.authenticate(request)  # warm the principal cache
+                with CaptureQueriesContext(connection) as queries:
+                    authentication.authenticate(request)
+                timings = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    for _ in range(total):
+                        authentication.authenticate(request)
+                    timings.append(time.perf_counter() - start)
+                results.append((name, statistics.median(timings) / total, len(queries)))
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"{total} authentications, median of {repeat} runs")
+        self.stdout.write(f"{'class':<26}{'us/request':>12}{'queries':>9}")
+        for name, per_request, queries in results:
+            self.stdout.write(f"{name:<26}{per_request * 1e6:>12.1f}{queries:>9}")
+        self.stdout.write("Timings exclude network round trips; each query saved also saves one round "
+                          "trip to the database server.")
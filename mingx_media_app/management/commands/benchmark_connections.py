@@ -0,0 +1,79 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+
+# (name, CONN_MAX_AGE, CONN_HEALTH_CHECKS); None is replaced by --max-age
+MODES = [
+    ('new connection per request', 0, False),
+    ('persistent', None, False),
+    ('persistent + health checks', None, True),
+]
+
+
+class Command(BaseCommand):
+    help = ("Measure the per-request cost of database connections: a new connection per request "
+            "(CONN_MAX_AGE=0) against persistent connections, with and without health checks. Each "
+            "simulated request goes through Django's request_started/request_finished signals, which "
+            "open and close connections as in a real request, and runs --queries trivial queries.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--queries', type=int, default=1, help="Queries per request.")
+        parser.add_argument('--max-age', type=int, default=600, help="CONN_MAX_AGE of the persistent modes.")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        original = {key: connection.settings_dict[key] for key in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')}
+        opened = []
+
+        def count(sender, connection, **kwargs):
+            if connection.alias == options['database']:
+                opened.append(connection.alias)
+
+        results = []
+        connection_created.connect(count)
+        try:
+            for name, max_age, health_checks in MODES:
+                # close_at is computed when connecting, so the new settings apply from the next connection
+                connection.close()
+                connection.settings_dict['CONN_MAX_AGE'] = options['max_age'] if max_age is None else max_age
+                connection.settings_dict['CONN_HEALTH_CHECKS'] = health_checks
+                self.request(connection, options['queries'])  # warm up
+                opened.clear()
+                latencies = []
+                for _ in range(options['requests']):
+                    start = time.perf_counter()
+                    self.request(connection, options['queries'])
+                    latencies.append(time.perf_counter() - start)
+                results.append((name, latencies, len(opened)))
+        finally:
+            connection_created.disconnect(count)
+            connection.close()
+            connection.settings_dict.update(original)
+
+        self.stdout.write(f"{options['requests']} requests of {options['queries']} query(ies) on "
+                          f"{options['database']} ({connection.vendor})")
+        self.stdout.write(f"{'mode':<30}{'connections':>12}{'mean ms':>9}{'p50 ms':>9}{'p95 ms':>9}")
+        for name, latencies, connects in results:
+            p95 = statistics.quantiles(latencies, n=20)[18] if len(latencies) > 1 else latencies[0]
+            self.stdout.write(f"{name:<30}{connects:>12}{statistics.mean(latencies) * 1000:>9.3f}"
+                              f"{statistics.median(latencies) * 1000:>9.3f}{p95 * 1000:>9.3f}")
+        persistent = statistics.mean(results[1][1])
+        self.stdout.write(f"Connection overhead per request: "
+                          f"{(statistics.mean(results[0][1]) - persistent) * 1000:.3f} ms, health checks: "
+                          f"{(statistics.mean(results[2][1]) - persistent) * 1000:.3f} ms")
+
+    def request(self, connection, queries):
+        request_started.send(sender=self.__class__)
+        try:
+            with connection.cursor() as cursor:
+                for _ in range(queries):
+                    cursor.execute('SELECT 1')
+                    cursor.fetchone()
+        finally:
+            request_finished.send(sender=self.__class__)
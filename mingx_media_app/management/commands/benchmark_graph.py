@@ -0,0 +1,70 @@
+import random
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from mingx_media_app.graph import Adjacency, FollowGraph
+
+
+class Command(BaseCommand):
+    help = ("Build the in-memory follow graph from a synthetic power-law follow graph (or the Follow "
+            "table with --from-db) and report memory per million edges and query latency.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--edges', type=int, default=1000000)
+        parser.add_argument('--queries', type=int, default=1000)
+        parser.add_argument('--from-db', action='store_true', help="Load the Follow table instead.")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        tracemalloc.start()
+        start = time.perf_counter()
+        if options['from_db']:
+            graph = FollowGraph.load()
+        else:
+            edges = self.synthetic_edges(rng, options['users'], options['edges'])
+            graph = FollowGraph(Adjacency(sorted(edges)), Adjacency(sorted((b, a) for a, b in edges)))
+            del edges
+        build_time = time.perf_counter() - start
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        edge_count = len(graph.following.targets)
+        user_ids = list(graph.following.nodes) or [0]
+        self.stdout.write(f"{edge_count} edges, {len(graph.following.nodes)} following lists, "
+                          f"{len(graph.followers.nodes)} follower lists, built in {build_time:.1f}s")
+        per_million = graph.nbytes() / max(edge_count, 1) * 1_000_000 / 2 ** 20
+        self.stdout.write(f"arrays: {graph.nbytes() / 2 ** 20:.1f} MiB ({per_million:.1f} MiB per million edges), "
+                          f"resident after build {current / 2 ** 20:.1f} MiB, peak while building {peak / 2 ** 20:.1f} MiB")
+
+        samples = [(rng.choice(user_ids), rng.choice(user_ids)) for _ in range(options['queries'])]
+        for name, func in [
+            ('is_following', lambda a, b: graph.is_following(a, b)),
+            ('mutuals', lambda a, b: graph.mutuals(a, b)),
+            ('suggestions(20)', lambda a, b: graph.suggestions(a, 20)),
+        ]:
+            timings = []
+            for a, b in samples:
+                begin = time.perf_counter()
+                func(a, b)
+                timings.append(time.perf_counter() - begin)
+            p99 = statistics.quantiles(timings, n=100)[98] if len(timings) > 1 else timings[0]
+            self.stdout.write(f"{name:<16} median {statistics.median(timings) * 1e6:>9.1f} us   "
+                              f"p99 {p99 * 1e6:>9.1f} us")
+
+    def synthetic_edges(self, rng, users, edges):
+        # Preferential targets: a few accounts get most of the followers, like a real social graph
+        weights = [1 / (rank + 1) ** 0.8 for rank in range(users)]
+        cumulative = []
+        total = 0.0
+        for weight in weights:
+            total += weight
+            cumulative.append(total)
+        ids = list(range(1, users + 1))
+        followers = rng.choices(ids, k=edges)
+        following = rng.choices(ids, cum_weights=cumulative, k=edges)
+        return list({(a, b) for a, b in zip(followers, following) if a != b})
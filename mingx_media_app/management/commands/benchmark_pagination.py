@@ -0,0 +1,85 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from mingx_media_app.models import Post
+from mingx_media_app.pagination import KeysetPagination
+
+
+class Command(BaseCommand):
+    help = "Compare OFFSET (page number) and keyset pagination cost at page 1 and a deep page."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page', type=int, default=1000, help="Deep page number to measure.")
+        parser.add_argument('--page-size', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        page, page_size, repeat = options['page'], options['page_size'], options['repeat']
+        total = page * page_size
+
+        # Seed inside a transaction that is rolled back, so the benchmark leaves no data behind
+        with transaction.atomic():
+            self.seed(total)
+            results = [
+                ('offset', 1, self.measure_offset(1, page_size, repeat)),
+                ('offset', page, self.measure_offset(page, page_size, repeat)),
+                ('keyset', 1, self.measure_keyset(None, page_size, repeat)),
+                ('keyset', page, self.measure_keyset((page - 1) * page_size - 1, page_size, repeat)),
+            ]
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"{total} posts, page size {page_size}, median of {repeat} runs")
+        self.stdout.write(f"{'paginator':<10}{'page':>8}{'ms':>10}{'queries':>9}")
+        for name, number, (elapsed, queries) in results:
+            self.stdout.write(f"{name:<10}{number:>8}{elapsed * 1000:>10.3f}{queries:>9}")
+
+    def seed(self, total):
+        author = User.objects.create(username='__benchmark_pagination__')
+        Post.objects.bulk_create(
+            (Post(author=author, content=f"benchmark post {i}") for i in range(total)),
+            batch_size=1000,
+        )
+
+    def request(self, **params):
+        host = settings.ALLOWED_HOSTS[0].lstrip('.').replace('*', 'localhost')
+        return Request(APIRequestFactory().get('/posts/', params, HTTP_HOST=host))
+
+    def time(self, paginate, repeat):
+        timings = []
+        with CaptureQueriesContext(connection) as ctx:
+            paginate()
+        for _ in range(repeat):
+            start = time.perf_counter()
+            paginate()
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings), len(ctx.captured_queries)
+
+    def measure_offset(self, page, page_size, repeat):
+        request = self.request(page=page)
+
+        def paginate():
+            paginator = PageNumberPagination()
+            paginator.page_size = page_size
+            list(paginator.paginate_queryset(Post.objects.order_by('-created_at', '-id'), request))
+        return self.time(paginate, repeat)
+
+    def measure_keyset(self, offset, page_size, repeat):
+        params = {'page_size': page_size}
+        if offset is not None:
+            # Build the cursor a client would hold after walking to this page
+            last = Post.objects.order_by('-created_at', '-id')[offset]
+            params['cursor'] = KeysetPagination().make_cursor([last.created_at.isoformat(), last.id])
+        request = self.request(**params)
+
+        def paginate():
+            KeysetPagination().paginate_queryset(Post.objects.all(), request)
+        return self.time(paginate, repeat)
@@ -0,0 +1,83 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from mingx_media_app import compression
+from mingx_media_app.renderers import ORJSONRenderer, orjson
+
+from .benchmark_api import Command as ApiBenchmark
+
+
+class Command(BaseCommand):
+    help = ("For every GET endpoint of the API router, measure the time to encode its response with DRF's "
+            "JSONRenderer and with ORJSONRenderer, and the bytes on the wire uncompressed, gzipped and, when "
+            "the brotli package is installed, Brotli-compressed, with the compression time. Run it against "
+            "data made by generate_data.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help="Fetch responses as this user (default: as benchmark_api).")
+        parser.add_argument('--repeat', type=int, default=200, help="Encodings timed per endpoint and renderer.")
+        parser.add_argument('--endpoint', action='append', dest='endpoints',
+                            help="Only endpoints whose name contains this text (repeatable).")
+
+    def handle(self, *args, **options):
+        api = ApiBenchmark(stdout=self.stdout)
+        user = api.get_user(options['username'])
+        sample = api.sample(user)
+        client = APIClient(raise_request_exception=False)
+        host = settings.ALLOWED_HOSTS[0].lstrip('.').replace('*', 'localhost')
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}', HTTP_HOST=host)
+
+        if orjson is None:
+            self.stdout.write(self.style.WARNING("orjson is not installed; ORJSONRenderer falls back to json"))
+        encodings = compression.available_encodings()
+        header = f"{'endpoint':<32}{'bytes':>9}{'json us':>10}{'orjson us':>11}{'speedup':>9}"
+        for encoding in encodings:
+            header += f"{encoding + ' bytes':>12}{encoding + ' us':>10}"
+        self.stdout.write(header)
+
+        totals = {'bytes': 0, 'json': 0.0, 'orjson': 0.0, **{encoding: 0 for encoding in encodings}}
+        for name, method, path, data in api.endpoints(client, sample, []):
+            if method != 'GET' or (options['endpoints'] and not any(text in name for text in options['endpoints'])):
+                continue
+            response = client.get(path, data)
+            if response.status_code != 200 or getattr(response, 'data', None) is None:
+                continue
+            payload = response.data
+            content = JSONRenderer().render(payload)
+            stdlib = self.time(JSONRenderer().render, payload, options['repeat'])
+            fast = self.time(ORJSONRenderer().render, payload, options['repeat'])
+            line = f"{name:<32}{len(content):>9}{stdlib * 1e6:>10.1f}{fast * 1e6:>11.1f}{stdlib / fast:>8.1f}x"
+            totals['bytes'] += len(content)
+            totals['json'] += stdlib
+            totals['orjson'] += fast
+            for encoding in encodings:
+                compressed = compression.compress(content, encoding)
+                elapsed = self.time(compression.compress, (content, encoding), max(options['repeat'] // 10, 1))
+                line += f"{len(compressed):>12}{elapsed * 1e6:>10.1f}"
+                totals[encoding] += len(compressed)
+            self.stdout.write(line)
+
+        if totals['orjson']:
+            summary = (f"Total: {totals['bytes']} bytes, encoding {totals['json'] / totals['orjson']:.1f}x faster "
+                       f"with orjson")
+            for encoding in encodings:
+                summary += f", {encoding} {totals[encoding] / totals['bytes']:.0%} of the bytes"
+            self.stdout.write(summary)
+        self.stdout.write(f"Responses under {compression.config().get('MIN_SIZE', 1024)} bytes are sent "
+                          f"uncompressed by CompressionMiddleware.")
+
+    def time(self, function, arguments, repeat):
+        # Median seconds per call
+        arguments = arguments if isinstance(arguments, tuple) else (arguments,)
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function(*arguments)
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings)
@@ -0,0 +1,79 @@
+import itertools
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from mingx_media_app.models import Post
+from mingx_media_app.search import search_posts
+
+VOCABULARY_SIZE = 20000
+
+
+class Command(BaseCommand):
+    help = "Compare full-text post search against the old content__icontains scan on a synthetic corpus."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=1_000_000, help="Size of the synthetic corpus.")
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--page-size', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # Suffixed so no word is a substring of another and both paths match the same posts
+        vocabulary = [f"w{i}x" for i in range(VOCABULARY_SIZE)]
+        # A frequent, a medium and a rare word, plus a two-word query
+        queries = [vocabulary[1], vocabulary[100], vocabulary[5000], f"{vocabulary[10]} {vocabulary[200]}"]
+
+        # Seed inside a transaction that is rolled back, so the benchmark leaves no data behind
+        with transaction.atomic():
+            start = time.perf_counter()
+            self.seed(options['posts'], vocabulary, rng)
+            self.stdout.write(f"Seeded {options['posts']} posts in {time.perf_counter() - start:.1f}s")
+
+            # "ranked" orders by relevance (/posts/search), "by date" is the feed keyword filter
+            self.stdout.write(f"{'query':<16}{'icontains ms':>14}{'ranked ms':>12}{'by date ms':>12}")
+            for query in queries:
+                scan = self.measure(lambda: self.icontains_page(query, options['page_size']), options['repeat'])
+                ranked = self.measure(lambda: self.search_page(query, options['page_size'], '-search_rank'),
+                                      options['repeat'])
+                by_date = self.measure(lambda: self.search_page(query, options['page_size'], '-created_at'),
+                                       options['repeat'])
+                self.stdout.write(f"{query:<16}{scan * 1000:>14.2f}{ranked * 1000:>12.2f}{by_date * 1000:>12.2f}")
+            transaction.set_rollback(True)
+
+    def seed(self, total, vocabulary, rng):
+        author = User.objects.create(username='__benchmark_search__')
+        # Zipf-like word frequencies, as in natural text
+        cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+        batch = []
+        for _ in range(total):
+            words = rng.choices(vocabulary, cum_weights=cum_weights, k=rng.randint(5, 30))
+            batch.append(Post(author=author, content=' '.join(words)))
+            if len(batch) == 5000:
+                Post.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Post.objects.bulk_create(batch)
+
+    def icontains_page(self, query, page_size):
+        # The previous feed keyword filter
+        posts = Post.objects.all()
+        for word in query.split():
+            posts = posts.filter(content__icontains=word)
+        return list(posts.order_by('-created_at', '-id')[:page_size])
+
+    def search_page(self, query, page_size, order):
+        return list(search_posts(Post.objects.all(), query).order_by(order, '-id')[:page_size])
+
+    def measure(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings)
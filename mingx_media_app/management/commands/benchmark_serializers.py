@@ -0,0 +1,60 @@
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from mingx_media_app.models import Post
+from mingx_media_app.serializers import PostSerializer, fast_post_serializer
+
+
+class Command(BaseCommand):
+    help = "Compare PostSerializer with the values()-based fast path on a batch of posts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        total, repeat = options['posts'], options['repeat']
+
+        # Seed inside a transaction that is rolled back, so the benchmark leaves no data behind
+        with transaction.atomic():
+            author = User.objects.create(username='__benchmark_serializers__')
+            Post.objects.bulk_create(
+                (Post(author=author, content=f"benchmark post {i}", media='https://example.com/image.png')
+                 for i in range(total)),
+                batch_size=1000,
+            )
+            queryset = Post.objects.filter(author=author).select_related('author').order_by('-created_at', '-id')
+
+            instances = list(queryset)
+            rows = list(fast_post_serializer.values(queryset))
+            if JSONRenderer().render(PostSerializer(instances, many=True).data) != \
+                    JSONRenderer().render(fast_post_serializer.serialize(rows)):
+                raise CommandError("Fast path output differs from PostSerializer")
+
+            results = [
+                ('ModelSerializer', self.measure(lambda: PostSerializer(instances, many=True).data, repeat)),
+                ('ValuesSerializer', self.measure(lambda: fast_post_serializer.serialize(rows), repeat)),
+                ('ModelSerializer + fetch',
+                 self.measure(lambda: PostSerializer(list(queryset.all()), many=True).data, repeat)),
+                ('ValuesSerializer + fetch',
+                 self.measure(lambda: fast_post_serializer.serialize(fast_post_serializer.values(queryset)), repeat)),
+            ]
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"{total} posts, median of {repeat} runs (output is byte-identical)")
+        self.stdout.write(f"{'path':<26}{'ms':>10}{'posts/s':>12}")
+        for name, elapsed in results:
+            self.stdout.write(f"{name:<26}{elapsed * 1000:>10.1f}{total / elapsed:>12.0f}")
+
+    def measure(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings)
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from mingx_media_app.trending import recompute_window, window_names
+
+
+class Command(BaseCommand):
+    help = "Incrementally recompute the precomputed trending rankings. Run it periodically (e.g. every minute)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window', action='append', dest='windows',
+                            help="Only recompute this window (repeatable). Defaults to all TRENDING_WINDOWS.")
+        parser.add_argument('--full', action='store_true',
+                            help="Rescan the whole window instead of applying an incremental update.")
+
+    def handle(self, *args, **options):
+        names = options['windows'] or window_names()
+        unknown = set(names) - set(window_names())
+        if unknown:
+            raise CommandError(f"Unknown trending window(s): {', '.join(sorted(unknown))}")
+
+        for name in names:
+            ranked = recompute_window(name, full=options['full'])
+            self.stdout.write(f"{name}: {ranked} ranked posts")
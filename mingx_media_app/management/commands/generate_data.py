@@ -0,0 +1,230 @@
+import random
+import time
+from datetime import timedelta
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import CharField, Count, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, LPad
+from django.utils import timezone
+
+from mingx_media_app.conversations import conversation_key
+from mingx_media_app.models import (
+    Comment, Conversation, ConversationMember, Follow, Like, Message, Notification, Post, Profile, Repost,
+)
+
+WORDS = (
+    "coffee morning build ship launch weekend travel music photo city night team code release "
+    "design coffee review idea today again finally great new first best friends home project"
+).split()
+HASHTAGS = ['python', 'django', 'travel', 'music', 'food', 'photography', 'startup', 'design', 'news', 'sports']
+
+
+class Command(BaseCommand):
+    help = ("Generate a synthetic data set at a given scale: users, a power-law follow graph, posts, likes, "
+            "comments, reposts, messages and notifications, written with bulk_create in chunks. Derived data "
+            "(counters, hashtags, timelines, trending) is rebuilt afterwards by the existing commands.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--follows-per-user', type=float, default=20)
+        parser.add_argument('--posts-per-user', type=float, default=10)
+        parser.add_argument('--likes-per-post', type=float, default=5)
+        parser.add_argument('--comments-per-post', type=float, default=1)
+        parser.add_argument('--reposts-per-post', type=float, default=0.2)
+        parser.add_argument('--messages-per-user', type=float, default=5)
+        parser.add_argument('--notifications-per-user', type=float, default=10)
+        parser.add_argument('--days', type=int, default=30, help="Spread timestamps over this many days.")
+        parser.add_argument('--prefix', default='user', help="Usernames are <prefix>0000001, ...")
+        parser.add_argument('--password', default='password', help="Password of every generated user.")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Rows written per bulk_create.")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith=options['prefix']).exists():
+            raise CommandError(f"Users named {options['prefix']}... already exist, choose another --prefix")
+        self.rng = random.Random(options['seed'])
+        self.chunk_size = options['chunk_size']
+        self.now = timezone.now()
+        self.start = self.now - timedelta(days=options['days'])
+        started = time.perf_counter()
+
+        with transaction.atomic():
+            user_ids = self.create_users(options)
+            self.create_follows(user_ids, round(len(user_ids) * options['follows_per_user']))
+            posts = self.create_posts(user_ids, round(len(user_ids) * options['posts_per_user']))
+            self.create_engagement(user_ids, posts, options)
+            self.create_messages(user_ids, round(len(user_ids) * options['messages_per_user']))
+            self.create_notifications(user_ids, round(len(user_ids) * options['notifications_per_user']))
+
+            # Counters, hashtags, timelines and rankings come from the same code that maintains them in production
+            for command in ('reconcile_post_counters', 'reconcile_profile_counters', 'backfill_hashtags',
+                            'rebuild_timelines'):
+                call_command(command, stdout=self.stdout)
+            call_command('compute_trending', full=True, stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {len(user_ids)} users in {time.perf_counter() - started:.1f}s; they log in with "
+            f"username {options['prefix']}0000001 ... and password {options['password']!r}"
+        ))
+
+    def popularity(self, ids, exponent=0.8):
+        # Zipf-like weights over a shuffled order: a few ids get most of the picks
+        ranked = list(ids)
+        self.rng.shuffle(ranked)
+        return ranked, list(accumulate(1 / (rank + 1) ** exponent for rank in range(len(ranked))))
+
+    def timestamp(self, after=None):
+        after = after or self.start
+        return after + (self.now - after) * self.rng.random()
+
+    def insert(self, model, rows, label):
+        # bulk_create (instance, created_at) pairs in chunks. auto_now_add stamps every row with
+        # the current time, so each chunk is then given its generated timestamps with one
+        # bulk_update; the shared field is never altered, so other writes in the process are
+        # unaffected. Returns (id, created_at) of the new rows.
+        rows = iter(rows)
+        created = []
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            instances = model.objects.bulk_create([instance for instance, _ in chunk])
+            for instance, (_, created_at) in zip(instances, chunk):
+                instance.created_at = created_at
+            model.objects.bulk_update(instances, ['created_at'], batch_size=1000)
+            created.extend((instance.pk, instance.created_at) for instance in instances)
+        self.stdout.write(f"{label}: {len(created)}")
+        return created
+
+    def create_users(self, options):
+        password = make_password(options['password'])
+        User.objects.bulk_create(
+            (User(username=f"{options['prefix']}{n:07d}", email=f"{options['prefix']}{n:07d}@example.com",
+                  password=password) for n in range(1, options['users'] + 1)),
+            batch_size=self.chunk_size,
+        )
+        user_ids = list(User.objects.filter(username__startswith=options['prefix']).order_by('id')
+                        .values_list('id', flat=True))
+        # bulk_create sends no post_save signal, so profiles are created here
+        Profile.objects.bulk_create((Profile(user_id=user_id) for user_id in user_ids), batch_size=self.chunk_size)
+        self.stdout.write(f"users: {len(user_ids)}")
+        return user_ids
+
+    def create_follows(self, user_ids, total):
+        targets, weights = self.popularity(user_ids)
+        edges = set()
+        for _ in range(3):  # duplicates and self-follows are dropped, so top up a few times
+            missing = total - len(edges)
+            if missing <= 0 or len(user_ids) < 2:
+                break
+            followers = self.rng.choices(user_ids, k=missing)
+            following = self.rng.choices(targets, cum_weights=weights, k=missing)
+            edges.update((a, b) for a, b in zip(followers, following) if a != b)
+        self.insert(Follow, ((Follow(follower_id=a, following_id=b), self.timestamp()) for a, b in edges), 'follows')
+
+    def create_posts(self, user_ids, total):
+        authors, weights = self.popularity(user_ids, exponent=0.5)
+        timestamps = sorted(self.timestamp() for _ in range(total))  # ids grow with time, as in production
+        rows = (
+            (Post(author_id=author_id, content=self.content()), created_at)
+            for author_id, created_at in zip(self.rng.choices(authors, cum_weights=weights, k=total), timestamps)
+        )
+        return self.insert(Post, rows, 'posts')
+
+    def content(self):
+        words = self.rng.choices(WORDS, k=self.rng.randint(5, 25))
+        if self.rng.random() < 0.3:
+            words.append(f"#{self.rng.choice(HASHTAGS)}")
+        return ' '.join(words).capitalize()
+
+    def create_engagement(self, user_ids, posts, options):
+        if not posts:
+            return
+        ranked, weights = self.popularity(posts)
+
+        def pairs(total, unique):
+            seen = set()
+            for post_id, posted_at in self.rng.choices(ranked, cum_weights=weights, k=total):
+                user_id = self.rng.choice(user_ids)
+                if unique:
+                    if (user_id, post_id) in seen:
+                        continue
+                    seen.add((user_id, post_id))
+                yield user_id, post_id, self.timestamp(posted_at)
+
+        self.insert(Like, ((Like(user_id=user_id, post_id=post_id), created_at) for user_id, post_id, created_at
+                           in pairs(round(len(posts) * options['likes_per_post']), unique=True)), 'likes')
+        self.insert(Comment, ((Comment(author_id=user_id, post_id=post_id, content=self.content()), created_at)
+                              for user_id, post_id, created_at
+                              in pairs(round(len(posts) * options['comments_per_post']), unique=False)), 'comments')
+        # Generated comments are all top-level; bulk_create skips the signal that sets their thread path
+        Comment.objects.filter(path='').update(path=LPad(Cast('pk', CharField()), Comment.PATH_WIDTH, Value('0')))
+        self.insert(Repost, ((Repost(user_id=user_id, original_post_id=post_id), created_at)
+                             for user_id, post_id, created_at
+                             in pairs(round(len(posts) * options['reposts_per_post']), unique=True)), 'reposts')
+
+    def create_messages(self, user_ids, total):
+        if total <= 0 or len(user_ids) < 2:
+            return
+        # About five messages per thread. Messages pick their thread first and only the picked
+        # threads are created, so every thread has messages and a real last_message_at
+        pairs = {}
+        for _ in range(max(total // 5, 1)):
+            a, b = self.rng.sample(user_ids, 2)
+            pairs[conversation_key(a, b)] = (a, b)
+        picked = self.rng.choices(list(pairs), k=total)
+        threads = {key: pairs[key] for key in dict.fromkeys(picked)}
+        Conversation.objects.bulk_create((Conversation(key=key) for key in threads), batch_size=self.chunk_size)
+        conversation_ids = dict(Conversation.objects.filter(key__in=threads).values_list('key', 'id'))
+        ConversationMember.objects.bulk_create(
+            (ConversationMember(conversation_id=conversation_ids[key], user_id=user_id, last_message_at=self.now)
+             for key, pair in threads.items() for user_id in pair),
+            batch_size=self.chunk_size,
+        )
+
+        recent = self.now - timedelta(days=1)
+
+        def rows():
+            for key in picked:
+                sender_id, recipient_id = self.rng.sample(threads[key], 2)
+                created_at = self.timestamp()
+                message = Message(sender_id=sender_id, recipient_id=recipient_id, content=self.content(),
+                                  conversation_id=conversation_ids[key], is_read=created_at < recent)
+                yield message, created_at
+        self.insert(Message, rows(), 'messages')
+
+        # Same denormalized inbox fields as record_message maintains, refreshed in chunks
+        ids = sorted(conversation_ids.values())
+        latest = Message.objects.filter(conversation=OuterRef('pk')).order_by('-created_at', '-id')
+        unread = (
+            Message.objects.filter(conversation=OuterRef('conversation'), recipient=OuterRef('user'), is_read=False)
+            .order_by().values('conversation').annotate(total=Count('pk')).values('total')
+        )
+        for start in range(0, len(ids), self.chunk_size):
+            chunk = ids[start:start + self.chunk_size]
+            Conversation.objects.filter(id__in=chunk).update(
+                last_message=Subquery(latest.values('id')[:1]),
+                last_message_at=Subquery(latest.values('created_at')[:1]),
+            )
+            ConversationMember.objects.filter(conversation_id__in=chunk).update(
+                last_message_at=Subquery(Conversation.objects.filter(pk=OuterRef('conversation'))
+                                         .values('last_message_at')),
+                unread_count=Coalesce(Subquery(unread), 0),
+            )
+
+    def create_notifications(self, user_ids, total):
+        recent = self.now - timedelta(days=1)
+
+        def rows():
+            for recipient_id in self.rng.choices(user_ids, k=total):
+                created_at = self.timestamp()
+                verb = self.rng.choice(['liked your post', 'commented on your post', 'started following you'])
+                actor = self.rng.choice(user_ids)
+                yield Notification(recipient_id=recipient_id, message=f"User {actor} {verb}",
+                                   is_read=created_at < recent), created_at
+        self.insert(Notification, rows(), 'notifications')
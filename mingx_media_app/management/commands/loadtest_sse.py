@@ -0,0 +1,98 @@
+import asyncio
+import resource
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.tokens import AccessToken
+
+from mingx_media_app.realtime import get_hub, user_channel
+
+
+class Command(BaseCommand):
+    help = ("Open many idle /stream/ connections against the ASGI application in this process, "
+            "then report memory per connection and the time to push one event to all of them.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=1000)
+        parser.add_argument('--users', type=int, default=10,
+                            help="Connections are spread over this many users (channels).")
+
+    def handle(self, *args, **options):
+        total, user_count = options['connections'], max(options['users'], 1)
+        users = [User.objects.create(username=f'__loadtest_sse_{i}__') for i in range(user_count)]
+        try:
+            report = asyncio.run(self.run(users, total))
+        finally:
+            User.objects.filter(id__in=[user.id for user in users]).delete()
+
+        self.stdout.write(f"{report['open']} of {total} connections open, hub holds {report['subscribed']}")
+        self.stdout.write(f"connect time: {report['connect']:.2f}s ({report['open'] / report['connect']:.0f} conn/s)")
+        self.stdout.write(f"memory per connection: {report['rss_growth'] / max(report['open'], 1):.1f} KiB "
+                          f"(max RSS {report['rss'] / 1024:.1f} MiB)")
+        self.stdout.write(f"broadcast to every connection: {report['broadcast'] * 1000:.1f} ms")
+        self.stdout.write("Socket buffers and server overhead are not included; under uvicorn the limit is "
+                          "usually the file descriptor limit (ulimit -n) before memory.")
+
+    async def run(self, users, total):
+        application = get_asgi_application()
+        tokens = [str(AccessToken.for_user(user)).encode('ascii') for user in users]
+        host = next((host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*'), 'localhost').encode()
+        disconnect = asyncio.Event()
+        opened, received = asyncio.Event(), asyncio.Event()
+        counts = {'open': 0, 'received': 0}
+
+        def connect(index):
+            sent_request = False
+
+            async def receive():
+                nonlocal sent_request
+                if not sent_request:
+                    sent_request = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] != 'http.response.body':
+                    return
+                if message['body'].startswith(b'retry:'):
+                    counts['open'] += 1
+                    if counts['open'] == total:
+                        opened.set()
+                elif message['body'].startswith(b'event:'):
+                    counts['received'] += 1
+                    if counts['received'] == total:
+                        received.set()
+
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': '/stream/', 'raw_path': b'/stream/', 'root_path': '',
+                'query_string': b'', 'server': ('localhost', 80), 'client': ('127.0.0.1', 10000 + index),
+                'headers': [(b'host', host), (b'authorization', b'Bearer ' + tokens[index % len(tokens)])],
+            }
+            return application(scope, receive, send)
+
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        tasks = [asyncio.create_task(connect(index)) for index in range(total)]
+        await asyncio.wait_for(opened.wait(), timeout=600)
+        connect_time = time.perf_counter() - start
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        start = time.perf_counter()
+        hub = get_hub()
+        for user in users:
+            hub.dispatch(user_channel(user.id), {'type': 'notification', 'data': {'message': 'load test'}})
+        await asyncio.wait_for(received.wait(), timeout=600)
+        broadcast = time.perf_counter() - start
+
+        subscribed = hub.connection_count()
+        disconnect.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return {
+            'open': counts['open'], 'subscribed': subscribed, 'connect': connect_time,
+            'rss': rss, 'rss_growth': rss - rss_before, 'broadcast': broadcast,
+        }
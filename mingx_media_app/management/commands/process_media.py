@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from mingx_media_app.media import process_asset
+from mingx_media_app.models import MediaAsset
+
+
+class Command(BaseCommand):
+    help = ("Generate the variants of media assets that are still pending, e.g. because the processing "
+            "queue was full or the process restarted, and retry failed ones with --retry-failed.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=int, default=60,
+                            help="Only assets uploaded at least this many seconds ago, so assets still "
+                                 "queued in a web process are left to it.")
+        parser.add_argument('--retry-failed', action='store_true')
+
+    def handle(self, *args, **options):
+        statuses = [MediaAsset.PENDING] + ([MediaAsset.FAILED] if options['retry_failed'] else [])
+        asset_ids = list(MediaAsset.objects.filter(
+            status__in=statuses, created_at__lte=timezone.now() - timedelta(seconds=options['min_age']),
+        ).order_by('id').values_list('id', flat=True))
+        for asset_id in asset_ids:
+            process_asset(asset_id)
+        ready = MediaAsset.objects.filter(id__in=asset_ids, status=MediaAsset.READY).count()
+        self.stdout.write(f"Processed {len(asset_ids)} media assets, {ready} ready")
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mingx_media_app.notifications import process_batch
+from mingx_media_app.realtime import LocalBroker, get_broker
+
+
+class Command(BaseCommand):
+    help = "Turn queued notification events into coalesced notifications. Runs until stopped unless --once is given."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help="Events per batch. Defaults to NOTIFICATION_BATCH_SIZE.")
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--once', action='store_true', help="Drain the queue once and exit.")
+        parser.add_argument('--without-stream', action='store_true',
+                            help="Run with LocalBroker anyway; /stream/ clients then get no notification events.")
+
+    def handle(self, *args, **options):
+        # LocalBroker would publish into this process, where no stream connection lives
+        if isinstance(get_broker(), LocalBroker) and not options['without_stream']:
+            raise CommandError("REALTIME_BROKER is LocalBroker, so notifications published by this worker never "
+                               "reach /stream/ clients. Use mingx_media_app.realtime.PostgresBroker, or pass "
+                               "--without-stream.")
+        total = 0
+        try:
+            while True:
+                processed = process_batch(options['batch_size'])
+                total += processed
+                if processed:
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f"Processed {total} notification events")
@@ -0,0 +1,40 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from mingx_media_app.timeline import PULL_AUTHORS_CACHE_KEY, rebuild_timeline, trim_timeline
+
+
+class Command(BaseCommand):
+    help = "Rebuild (or trim) the materialized home timelines in bulk."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help="Only rebuild the timeline of this user id (repeatable).")
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help="Number of users loaded per batch.")
+        parser.add_argument('--trim-only', action='store_true',
+                            help="Only drop entries beyond TIMELINE_MAX_LENGTH.")
+
+    def handle(self, *args, **options):
+        # Recompute the high-fan-out author set before deciding who gets pushed
+        cache.delete(PULL_AUTHORS_CACHE_KEY)
+
+        users = User.objects.order_by('id')
+        if options['user_ids']:
+            users = users.filter(id__in=options['user_ids'])
+        action = trim_timeline if options['trim_only'] else rebuild_timeline
+
+        processed = 0
+        last_id = 0
+        while True:
+            user_ids = list(users.filter(id__gt=last_id).values_list('id', flat=True)[:options['chunk_size']])
+            if not user_ids:
+                break
+            for user_id in user_ids:
+                action(user_id)
+            processed += len(user_ids)
+            last_id = user_ids[-1]
+            self.stdout.write(f"Processed {processed} timelines")
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {processed} timelines"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from mingx_media_app.models import Post
+from mingx_media_app.reconcile import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored like/comment/repost counters on posts and repair any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="Number of posts checked per batch.")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Report drifted posts without updating them.")
+
+    def handle(self, *args, **options):
+        checked, drifted = reconcile_counters(Post, options['chunk_size'], options['dry_run'])
+        verb = "drifted" if options['dry_run'] else "repaired"
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} posts, {drifted} {verb}"))
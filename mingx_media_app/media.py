@@ -0,0 +1,204 @@
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.db import connections, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .caching import invalidate
+from .models import MediaAsset, Post, Profile, invalidate_post_responses
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPES = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'GIF': 'image/gif', 'WEBP': 'image/webp'}
+
+
+def config():
+    return getattr(settings, 'MEDIA_PROCESSING', {})
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+class HashingUploadHandler(FileUploadHandler):
+    """
+    Hashes uploaded files while they stream in, before the default handlers write them
+    to memory or a temporary file, so the content hash costs no extra pass over the file.
+    Files over MAX_UPLOAD_BYTES are skipped as soon as the limit is crossed.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.digests = {}  # field name -> sha256 hex digest
+        self.too_large = set()  # field names of skipped files
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.hash = hashlib.sha256()
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > config().get('MAX_UPLOAD_BYTES', 20 * 1024 * 1024):
+            self.too_large.add(self.field_name)
+            raise SkipFile()
+        self.hash.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        self.digests[self.field_name] = self.hash.hexdigest()
+        return None  # let the next handler build the file
+
+
+def inspect_image(file):
+    # Format and size from the image header; the pixels are only decoded when processing
+    try:
+        with Image.open(file) as image:
+            image_format, width, height = image.format, image.width, image.height
+            image.verify()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError):
+        raise InvalidImage("Upload a valid JPEG, PNG, GIF or WebP image")
+    finally:
+        file.seek(0)
+    if image_format not in CONTENT_TYPES:
+        raise InvalidImage("Upload a valid JPEG, PNG, GIF or WebP image")
+    if width * height > config().get('MAX_PIXELS', 40_000_000):
+        raise InvalidImage("The image has too many pixels")
+    return image_format, width, height
+
+
+def asset_prefix(digest):
+    # Content-addressed layout, fanned out over two directory levels
+    return f'assets/{digest[:2]}/{digest[2:4]}/{digest}'
+
+
+def store_upload(file, digest, user):
+    """
+    Return the MediaAsset for an uploaded image, creating it on the first upload of this
+    content, and record `user` as one of its uploaders. Returns (asset, created). The variants are generated after the transaction
+    commits, off the request path.
+    """
+    asset = MediaAsset.objects.filter(sha256=digest).first()
+    if asset is not None:
+        asset.uploaders.add(user)
+        if asset.status == MediaAsset.FAILED:
+            transaction.on_commit(lambda: submit(asset.pk))
+        return asset, False
+
+    image_format, width, height = inspect_image(file)
+    extension = 'jpg' if image_format == 'JPEG' else image_format.lower()
+    name = f'{asset_prefix(digest)}/original.{extension}'
+    if not default_storage.exists(name):
+        name = default_storage.save(name, file)
+    asset, created = MediaAsset.objects.get_or_create(sha256=digest, defaults={
+        'uploaded_by': user, 'original': name, 'content_type': CONTENT_TYPES[image_format],
+        'size': file.size, 'width': width, 'height': height,
+    })
+    asset.uploaders.add(user)
+    if created:
+        transaction.on_commit(lambda: submit(asset.pk))
+    elif asset.original != name:
+        default_storage.delete(name)  # a concurrent upload of the same content won the race
+    return asset, created
+
+
+def render_variant(image, options):
+    # JPEG no larger than size x size (cropped to a square when crop is set); never upscaled
+    size = options['size']
+    if options.get('crop'):
+        edge = min(size, image.width, image.height)
+        variant = ImageOps.fit(image, (edge, edge), Image.LANCZOS)
+    else:
+        variant = image.copy()
+        variant.thumbnail((size, size), Image.LANCZOS)
+    buffer = io.BytesIO()
+    variant.save(buffer, 'JPEG', quality=config().get('QUALITY', 85), optimize=True, progressive=True)
+    return buffer.getvalue(), variant.width, variant.height
+
+
+def flatten(image):
+    # JPEG has no alpha channel: composite transparent images onto white
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def process_asset(asset_id):
+    """
+    Write the resized variants of an asset and mark it ready (or failed). Pillow releases
+    the GIL while resizing and encoding, so several assets are processed in parallel by
+    the pool's threads.
+    """
+    try:
+        asset = MediaAsset.objects.filter(pk=asset_id).first()
+        if asset is None or asset.status == MediaAsset.READY:
+            return
+        try:
+            with default_storage.open(asset.original) as file, Image.open(file) as original:
+                image = flatten(original)
+            variants = {}
+            for name, options in config().get('VARIANTS', {}).items():
+                content, width, height = render_variant(image, options)
+                stored = f'{asset_prefix(asset.sha256)}/{name}.jpg'
+                if default_storage.exists(stored):
+                    default_storage.delete(stored)  # left by an earlier, interrupted run
+                stored = default_storage.save(stored, ContentFile(content))
+                variants[name] = {'url': default_storage.url(stored), 'width': width, 'height': height}
+        except Exception:
+            logger.exception("Processing media asset %s failed", asset_id)
+            MediaAsset.objects.filter(pk=asset_id).update(status=MediaAsset.FAILED)
+            return
+
+        MediaAsset.objects.filter(pk=asset_id).update(status=MediaAsset.READY, variants=variants)
+        # update() sends no signals; cached responses that show this asset are expired here
+        for post_id in Post.objects.filter(media_asset=asset_id).values_list('id', flat=True):
+            invalidate_post_responses(post_id)
+        for user_id in Profile.objects.filter(profile_picture_asset=asset_id).values_list('user_id', flat=True):
+            invalidate('user', user_id)
+    finally:
+        if config().get('WORKERS', 2):
+            connections.close_all()  # the pool thread's own; inline runs keep the request's connection
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = None
+
+
+def executor():
+    # Created on first use, i.e. in each worker process after gunicorn forks
+    global _executor, _pending
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=config().get('WORKERS', 2), thread_name_prefix='media')
+            _pending = threading.BoundedSemaphore(config().get('MAX_PENDING', 100))
+        return _executor
+
+
+def submit(asset_id):
+    """
+    Queue an asset for processing. With WORKERS = 0 it is processed inline (tests and
+    development). When MAX_PENDING assets are already queued, the asset stays pending
+    for `manage.py process_media`, which also picks up work lost in a restart.
+    """
+    if not config().get('WORKERS', 2):
+        process_asset(asset_id)
+        return None
+    pool = executor()
+    if not _pending.acquire(blocking=False):
+        logger.warning("Media processing queue is full, asset %s left for process_media", asset_id)
+        return None
+    future = pool.submit(process_asset, asset_id)
+    future.add_done_callback(lambda _: _pending.release())
+    return future
@@ -0,0 +1,174 @@
+import cProfile
+import os
+import random
+import re
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.exceptions import MiddlewareNotUsed
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import compression, performance, routers
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    # WhiteNoiseMiddleware is sync-only, which makes Django run every ASGI request through
+    # a single thread; this variant serves static files the same way and awaits the rest
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
+
+
+class PerformanceMiddleware:
+    """
+    Per-request instrumentation: query count and database time (through a connection
+    execute wrapper), auth, view and render time, reported as a Server-Timing header, a
+    log line and per-endpoint histograms (GET /stats/performance/). A PROFILE_SAMPLE_RATE
+    share of sync requests is run under cProfile and dumped to PROFILE_DIR.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        options = performance.config()
+        if not options.get('ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.profile_rate = options.get('PROFILE_SAMPLE_RATE', 0.0)
+        self.profile_dir = options.get('PROFILE_DIR', 'profiles')
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # Coroutine hooks, so the ASGI handler calls them without a thread hop
+            self.process_view = self.aprocess_view
+            self.process_template_response = self.aprocess_template_response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        performance.install_query_recorders()
+        metrics, token = performance.start_request()
+        profile = cProfile.Profile() if self.profile_rate and random.random() < self.profile_rate else None
+        try:
+            if profile is not None:
+                response = profile.runcall(self.get_response, request)
+            else:
+                response = self.get_response(request)
+        finally:
+            performance.end_request(token)
+        timings = performance.report(request, response, metrics)
+        if profile is not None:
+            self.dump_profile(profile, request, timings['total'])
+        return response
+
+    async def __acall__(self, request):
+        # cProfile only sees the calling thread, so async requests are not profiled
+        metrics, token = performance.start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            performance.end_request(token)
+        performance.report(request, response, metrics)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        performance.mark_view_started()
+
+    def process_template_response(self, request, response):
+        # Called for DRF responses after the view returns and before they are rendered
+        performance.mark_view_finished()
+        return response
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        performance.mark_view_started()
+
+    async def aprocess_template_response(self, request, response):
+        performance.mark_view_finished()
+        return response
+
+    def dump_profile(self, profile, request, total):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        name = request.resolver_match.view_name if request.resolver_match else request.path
+        filename = '{}-{}-{}-{:.0f}ms-{}.prof'.format(
+            time.strftime('%Y%m%dT%H%M%S'), request.method, re.sub(r'[^\w.-]+', '_', name), total * 1000, os.getpid(),
+        )
+        profile.dump_stats(os.path.join(self.profile_dir, filename))
+
+
+class CompressionMiddleware:
+    """
+    gzip or Brotli (when the brotli package is installed) compression of API responses,
+    negotiated from Accept-Encoding, for JSON responses of at least MIN_SIZE bytes (see
+    compression.compress_response). Static files are compressed ahead of time by WhiteNoise.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not compression.config().get('ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return compression.compress_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return compression.compress_response(request, await self.get_response(request))
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Lets GET/HEAD/OPTIONS requests read from the read replicas (routers.ReplicaRouter),
+    unless the user wrote within STICKY_SECONDS; a successful write pins the user's reads
+    to the primary for that long with a signed cookie. Not installed when no replica is configured.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not routers.replica_aliases():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = routers.begin_request(request)
+        response = None
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.end_request(request, response, token)
+        return response
+
+    async def __acall__(self, request):
+        token = routers.begin_request(request)
+        response = None
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.end_request(request, response, token)
+        return response
@@ -0,0 +1,54 @@
+# Generated by Django 5.0.7 on 2026-10-17 05:55
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _count(model, fk):
+    counts = (
+        model.objects.filter(**{fk: OuterRef('pk')})
+        .order_by()
+        .values(fk)
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counts), 0)
+
+
+def backfill_counters(apps, schema_editor):
+    Post = apps.get_model('mingx_media_app', 'Post')
+    Like = apps.get_model('mingx_media_app', 'Like')
+    Comment = apps.get_model('mingx_media_app', 'Comment')
+    Repost = apps.get_model('mingx_media_app', 'Repost')
+    Post.objects.update(
+        like_count=_count(Like, 'post'),
+        comment_count=_count(Comment, 'post'),
+        repost_count=_count(Repost, 'original_post'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mingx_media_app', '0006_post_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='repost_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
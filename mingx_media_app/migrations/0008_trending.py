@@ -0,0 +1,38 @@
+# Generated by Django 5.0.7 on 2026-10-17 05:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mingx_media_app', '0007_post_engagement_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingWindow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=16, unique=True)),
+                ('computed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TrendingScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window', models.CharField(max_length=16)),
+                ('score', models.FloatField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trending_scores', to='mingx_media_app.post')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['window', '-score'], name='trending_window_score_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='trendingscore',
+            constraint=models.UniqueConstraint(fields=('window', 'post'), name='unique_trending_score'),
+        ),
+    ]
@@ -0,0 +1,75 @@
+from django.db import migrations
+
+# The search index lives outside the Django model: a generated tsvector column with a
+# GIN index on PostgreSQL, an external-content FTS5 table kept in sync by triggers on
+# SQLite. Note that SQLite table rebuilds drop triggers, so a migration that remakes
+# the post table on SQLite has to re-run the SQLITE_FORWARD statements.
+
+POSTGRES_FORWARD = [
+    """
+    ALTER TABLE mingx_media_app_post
+    ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('english', coalesce(content, ''))) STORED
+    """,
+    "CREATE INDEX post_search_vector_idx ON mingx_media_app_post USING GIN (search_vector)",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS post_search_vector_idx",
+    "ALTER TABLE mingx_media_app_post DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS mingx_media_app_post_fts USING fts5(
+        content, content='mingx_media_app_post', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS mingx_media_app_post_fts_insert AFTER INSERT ON mingx_media_app_post BEGIN
+        INSERT INTO mingx_media_app_post_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS mingx_media_app_post_fts_delete AFTER DELETE ON mingx_media_app_post BEGIN
+        INSERT INTO mingx_media_app_post_fts(mingx_media_app_post_fts, rowid, content)
+        VALUES ('delete', old.id, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS mingx_media_app_post_fts_update AFTER UPDATE OF content ON mingx_media_app_post BEGIN
+        INSERT INTO mingx_media_app_post_fts(mingx_media_app_post_fts, rowid, content)
+        VALUES ('delete', old.id, old.content);
+        INSERT INTO mingx_media_app_post_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    "INSERT INTO mingx_media_app_post_fts(mingx_media_app_post_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS mingx_media_app_post_fts_insert",
+    "DROP TRIGGER IF EXISTS mingx_media_app_post_fts_delete",
+    "DROP TRIGGER IF EXISTS mingx_media_app_post_fts_update",
+    "DROP TABLE IF EXISTS mingx_media_app_post_fts",
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mingx_media_app', '0008_trending'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'postgresql': POSTGRES_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            _run({'postgresql': POSTGRES_BACKWARD, 'sqlite': SQLITE_BACKWARD}),
+        ),
+    ]
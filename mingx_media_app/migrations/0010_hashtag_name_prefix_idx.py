@@ -0,0 +1,17 @@
+# Generated by Django 5.0.7 on 2026-10-17 06:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mingx_media_app', '0009_post_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='hashtag',
+            index=models.Index(fields=['name'], name='hashtag_name_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
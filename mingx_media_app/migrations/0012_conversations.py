@@ -0,0 +1,129 @@
+# Generated by Django 5.0.7 on 2026-10-17 06:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+CHUNK_SIZE = 1000
+
+
+def _key(sender_id, recipient_id):
+    return ':'.join(str(user_id) for user_id in sorted({sender_id, recipient_id}))
+
+
+def backfill_conversations(apps, schema_editor):
+    # Thread existing messages in id-ordered chunks so no step holds every message in memory
+    Message = apps.get_model('mingx_media_app', 'Message')
+    Conversation = apps.get_model('mingx_media_app', 'Conversation')
+    ConversationMember = apps.get_model('mingx_media_app', 'ConversationMember')
+
+    last_id = 0
+    while True:
+        chunk = list(
+            Message.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'sender_id', 'recipient_id')[:CHUNK_SIZE]
+        )
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+
+        keys = {_key(sender_id, recipient_id): {sender_id, recipient_id} for _, sender_id, recipient_id in chunk}
+        Conversation.objects.bulk_create([Conversation(key=key) for key in keys], ignore_conflicts=True)
+        conversation_ids = dict(Conversation.objects.filter(key__in=keys).values_list('key', 'id'))
+        ConversationMember.objects.bulk_create(
+            [
+                ConversationMember(conversation_id=conversation_ids[key], user_id=user_id)
+                for key, user_ids in keys.items() for user_id in user_ids
+            ],
+            ignore_conflicts=True,
+        )
+        Message.objects.bulk_update(
+            [
+                Message(id=message_id, conversation_id=conversation_ids[_key(sender_id, recipient_id)])
+                for message_id, sender_id, recipient_id in chunk
+            ],
+            ['conversation'],
+        )
+
+        # Refresh the denormalized fields of the threads touched by this chunk
+        touched = list(conversation_ids.values())
+        latest = Message.objects.filter(conversation=OuterRef('pk')).order_by('-created_at', '-id')
+        Conversation.objects.filter(id__in=touched).update(
+            last_message=Subquery(latest.values('id')[:1]),
+            last_message_at=Subquery(latest.values('created_at')[:1]),
+        )
+        unread = (
+            Message.objects.filter(conversation=OuterRef('conversation'), recipient=OuterRef('user'), is_read=False)
+            .exclude(sender=OuterRef('user'))
+            .order_by()
+            .values('conversation')
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+        ConversationMember.objects.filter(conversation_id__in=touched).update(
+            last_message_at=Subquery(Conversation.objects.filter(pk=OuterRef('conversation')).values('last_message_at')),
+            unread_count=Coalesce(Subquery(unread), 0),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mingx_media_app', '0011_notification_pipeline'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationMember',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('last_message_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('last_message_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='mingx_media_app.message')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='conversation',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='mingx_media_app.conversation'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', '-created_at', '-id'], name='message_conversation_idx'),
+        ),
+        migrations.AddField(
+            model_name='conversationmember',
+            name='conversation',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='members', to='mingx_media_app.conversation'),
+        ),
+        migrations.AddField(
+            model_name='conversationmember',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_memberships', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='participants',
+            field=models.ManyToManyField(related_name='conversations', through='mingx_media_app.ConversationMember', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='conversationmember',
+            index=models.Index(fields=['user', '-last_message_at', '-id'], name='member_inbox_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='conversationmember',
+            unique_together={('conversation', 'user')},
+        ),
+        migrations.RunPython(backfill_conversations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.0.7 on 2026-10-17 06:25
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _count(model, fk):
+    counts = (
+        model.objects.filter(**{fk: OuterRef('user_id')})
+        .order_by()
+        .values(fk)
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counts), 0)
+
+
+def backfill_counters(apps, schema_editor):
+    Profile = apps.get_model('mingx_media_app', 'Profile')
+    Follow = apps.get_model('mingx_media_app', 'Follow')
+    Post = apps.get_model('mingx_media_app', 'Post')
+    Profile.objects.update(
+        follower_count=_count(Follow, 'following'),
+        following_count=_count(Follow, 'follower'),
+        post_count=_count(Post, 'author'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mingx_media_app', '0012_conversations'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='follower_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['follower_count'], name='profile_follower_count_idx'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.0.7 on 2026-10-17 06:42
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# (model, post foreign key, counter on Post) made unique per user by this migration
+DEDUPED = (
+    ('Like', 'post', 'like_count'),
+    ('Repost', 'original_post', 'repost_count'),
+)
+
+
+def dedupe_engagement(apps, schema_editor):
+    # Keep the earliest row of each duplicated (user, post) pair so the unique constraints
+    # can be added, then recount the affected posts
+    Post = apps.get_model('mingx_media_app', 'Post')
+    for model_name, fk, counter in DEDUPED:
+        model = apps.get_model('mingx_media_app', model_name)
+        duplicates = list(
+            model.objects.order_by()
+            .values('user', fk)
+            .annotate(keep=Min('pk'), total=Count('pk'))
+            .filter(total__gt=1)
+        )
+        for group in duplicates:
+            model.objects.filter(user=group['user'], **{fk: group[fk]}).exclude(pk=group['keep']).delete()
+
+        post_ids = sorted({group[fk] for group in duplicates})
+        counts = (
+            model.objects.filter(**{fk: OuterRef('pk')})
+            .order_by()
+            .values(fk)
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+        for start in range(0, len(post_ids), 1000):
+            Post.objects.filter(pk__in=post_ids[start:start + 1000]).update(**{counter: Coalesce(Subquery(counts), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mingx_media_app', '0013_profile_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_engagement, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', '-created_at', '-id'], name='notification_recipient_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', 'is_read', '-created_at'], name='notification_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-created_at', '-id'], name='post_author_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='like',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='unique_like'),
+        ),
+        migrations.AddConstraint(
+            model_name='repost',
+            constraint=models.UniqueConstraint(fields=('user', 'original_post'), name='unique_repost'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.7 on 2026-10-17 07:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mingx_media_app', '0016_comment_threads'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-created_at', '-post'], name='timeline_user_created_post_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='timelineentry',
+            name='timeline_user_created_idx',
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.7 on 2026-10-17 07:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_uploaders(apps, schema_editor):
+    # Existing assets were attachable by their only recorded uploader
+    MediaAsset = apps.get_model('mingx_media_app', 'MediaAsset')
+    Uploader = MediaAsset.uploaders.through
+    Uploader.objects.bulk_create(
+        Uploader(mediaasset_id=asset_id, user_id=user_id)
+        for asset_id, user_id in MediaAsset.objects.filter(uploaded_by__isnull=False).values_list('id', 'uploaded_by')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mingx_media_app', '0017_timeline_seek_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='mediaasset',
+            name='uploaded_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='mediaasset',
+            name='uploaders',
+            field=models.ManyToManyField(related_name='media_assets', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_uploaders, migrations.RunPython.noop),
+    ]
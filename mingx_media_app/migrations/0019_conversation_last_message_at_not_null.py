@@ -0,0 +1,36 @@
+# Generated by Django 5.0.7 on 2026-10-17 08:05
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_last_message_at(apps, schema_editor):
+    # Threads without a message sort by the time they were started
+    Conversation = apps.get_model('mingx_media_app', 'Conversation')
+    ConversationMember = apps.get_model('mingx_media_app', 'ConversationMember')
+    Conversation.objects.filter(last_message_at__isnull=True).update(last_message_at=models.F('created_at'))
+    ConversationMember.objects.filter(last_message_at__isnull=True).update(
+        last_message_at=Subquery(Conversation.objects.filter(pk=OuterRef('conversation')).values('last_message_at')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mingx_media_app', '0018_media_asset_uploaders'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_last_message_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='conversation',
+            name='last_message_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='conversationmember',
+            name='last_message_at',
+            field=models.DateTimeField(),
+        ),
+    ]
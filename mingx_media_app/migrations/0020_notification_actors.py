@@ -0,0 +1,28 @@
+# Generated by Django 5.0.7 on 2026-10-17 07:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mingx_media_app', '0019_conversation_last_message_at_not_null'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationActor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('actor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('notification', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='actors', to='mingx_media_app.notification')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='notificationactor',
+            constraint=models.UniqueConstraint(fields=('notification', 'actor'), name='unique_notification_actor'),
+        ),
+    ]
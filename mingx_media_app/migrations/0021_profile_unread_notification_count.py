@@ -0,0 +1,34 @@
+# Generated by Django 5.0.7 on 2026-10-17 07:56
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_unread(apps, schema_editor):
+    Profile = apps.get_model('mingx_media_app', 'Profile')
+    Notification = apps.get_model('mingx_media_app', 'Notification')
+    unread = (
+        Notification.objects.filter(recipient=OuterRef('user_id'), is_read=False)
+        .order_by()
+        .values('recipient')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    Profile.objects.update(unread_notification_count=Coalesce(Subquery(unread), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mingx_media_app', '0020_notification_actors'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='unread_notification_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_unread, migrations.RunPython.noop),
+    ]
@@ -1,13 +1,29 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
+from django.utils import timezone
+
+from .caching import invalidate
+from .graph import record_follow, record_unfollow
 
 class Post(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     content = models.TextField()
     media = models.URLField(blank=True, null=True)
+    media_asset = models.ForeignKey('MediaAsset', null=True, blank=True, related_name='+', on_delete=models.SET_NULL)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Engagement counters maintained on the write path with F() updates
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    repost_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='post_created_id_idx'),
+            # An author's posts newest first (timeline backfill and pull of high-fan-out authors)
+            models.Index(fields=['author', '-created_at', '-id'], name='post_author_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.author.username}'s Post"
@@ -31,15 +47,31 @@ def create_or_update_user_profile(sender, instance, created, **kwargs):
     if created:
         Profile.objects.create(user=instance)
     else:
-        instance.profile.save()
+        instance.profile.save(update_fields=Profile.EDITABLE_FIELDS)
 
 
 class Comment(models.Model):
+    # Width of one materialized path segment: the zero-padded id of each ancestor, then the
+    # comment's own, so ordering by path lists a thread depth-first in reply order
+    PATH_WIDTH = 12
+
     post = models.ForeignKey(Post, related_name='comments', on_delete=models.CASCADE)
     author = models.ForeignKey(User, on_delete=models.CASCADE)
+    parent = models.ForeignKey('self', null=True, blank=True, related_name='replies', on_delete=models.CASCADE)
+    path = models.CharField(max_length=255, blank=True)  # set by set_comment_path once the id is known
+    depth = models.PositiveSmallIntegerField(default=0)
+    reply_count = models.PositiveIntegerField(default=0)  # direct replies, maintained with F() updates
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # A post's comments in order (GET /posts/{id}/comments/) and the feed previews
+            models.Index(fields=['post', 'created_at', 'id'], name='comment_post_created_idx'),
+            # A post's comment tree or one thread, depth-first
+            models.Index(fields=['post', 'path'], name='comment_post_path_idx'),
+        ]
+
     def __str__(self):
         return f"Comment by {self.author.username} on {self.post}"
 
@@ -48,6 +80,12 @@ class Like(models.Model):
     post = models.ForeignKey(Post, related_name='likes', on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            # Makes the get_or_create in LikeViewSet.create race-safe
+            models.UniqueConstraint(fields=['user', 'post'], name='unique_like')
+        ]
+
     def __str__(self):
         return f"{self.user.username} liked {self.post}"
 
@@ -57,18 +95,97 @@ class Notification(models.Model):
     message = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
+    # Coalescing: unread notifications with the same key are merged ("A and 12 others...")
+    group_key = models.CharField(max_length=64, blank=True)
+    event_count = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            # The notification list, newest first
+            models.Index(fields=['recipient', '-created_at', '-id'], name='notification_recipient_idx'),
+            # Unread count, mark all read and coalescing into unread notifications
+            models.Index(fields=['recipient', 'is_read', '-created_at'], name='notification_unread_idx'),
+        ]
 
     def __str__(self):
         return f"Notification for {self.recipient.username}"
 
 
+class NotificationActor(models.Model):
+    # The distinct people behind a coalesced notification, so "and N others" counts each once
+    notification = models.ForeignKey(Notification, related_name='actors', on_delete=models.CASCADE)
+    actor = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['notification', 'actor'], name='unique_notification_actor')
+        ]
+
+    def __str__(self):
+        return f"{self.actor_id} in notification {self.notification_id}"
+
+
+class NotificationEvent(models.Model):
+    # Queue of events waiting to become notifications; drained by process_notifications
+    LIKE = 'like'
+    COMMENT = 'comment'
+    FOLLOW = 'follow'
+    MESSAGE = 'message'
+    VERB_CHOICES = [(LIKE, 'Like'), (COMMENT, 'Comment'), (FOLLOW, 'Follow'), (MESSAGE, 'Message')]
+
+    recipient = models.ForeignKey(User, related_name='notification_events', on_delete=models.CASCADE)
+    actor = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    verb = models.CharField(max_length=16, choices=VERB_CHOICES)
+    post = models.ForeignKey(Post, null=True, blank=True, related_name='+', on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.verb} event for {self.recipient_id}"
+
+
+class Conversation(models.Model):
+    # A direct-message thread; the latest message is denormalized for the inbox
+    key = models.CharField(max_length=64, unique=True)  # sorted participant ids, e.g. "3:17"
+    participants = models.ManyToManyField(User, through='ConversationMember', related_name='conversations')
+    last_message = models.ForeignKey('Message', null=True, blank=True, related_name='+', on_delete=models.SET_NULL)
+    # Never null, as it is the inbox keyset: until the first message, the time the thread was started
+    last_message_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Conversation {self.key}"
+
+
+class ConversationMember(models.Model):
+    # Per-participant inbox row: one index range scan lists a user's threads by recency
+    conversation = models.ForeignKey(Conversation, related_name='members', on_delete=models.CASCADE)
+    user = models.ForeignKey(User, related_name='conversation_memberships', on_delete=models.CASCADE)
+    unread_count = models.PositiveIntegerField(default=0)
+    last_message_at = models.DateTimeField()  # copied from the conversation
+
+    class Meta:
+        unique_together = ('conversation', 'user')
+        indexes = [
+            models.Index(fields=['user', '-last_message_at', '-id'], name='member_inbox_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} in {self.conversation_id}"
+
+
 class Message(models.Model):
     sender = models.ForeignKey(User, related_name='sent_messages', on_delete=models.CASCADE)
     recipient = models.ForeignKey(User, related_name='received_messages', on_delete=models.CASCADE)
+    conversation = models.ForeignKey(Conversation, null=True, blank=True, related_name='messages', on_delete=models.CASCADE)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['conversation', '-created_at', '-id'], name='message_conversation_idx'),
+        ]
+
     def __str__(self):
         return f"Message from {self.sender} to {self.recipient}"
 
@@ -77,6 +194,11 @@ class Repost(models.Model):
     original_post = models.ForeignKey(Post, related_name='reposts', on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'original_post'], name='unique_repost')
+        ]
+
     def __str__(self):
         return f"{self.user.username} reposted {self.original_post}"
 
@@ -85,17 +207,187 @@ class Hashtag(models.Model):
     name = models.CharField(max_length=50, unique=True)
     posts = models.ManyToManyField(Post, related_name='hashtags')
 
+    class Meta:
+        indexes = [
+            # Serves LIKE 'prefix%' autocomplete lookups on PostgreSQL
+            models.Index(fields=['name'], name='hashtag_name_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ]
+
     def __str__(self):
         return self.name
 
 
+class MediaAsset(models.Model):
+    # An uploaded image, stored once per content hash; resized variants are written by media.process_asset.
+    # Only users who uploaded the content (uploaders) may attach it to their posts and profile
+    PENDING = 'pending'
+    READY = 'ready'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (READY, 'Ready'), (FAILED, 'Failed')]
+
+    sha256 = models.CharField(max_length=64, unique=True)
+    # The first uploader; the asset is shared by every uploader, so it outlives their account
+    uploaded_by = models.ForeignKey(User, null=True, blank=True, related_name='+', on_delete=models.SET_NULL)
+    uploaders = models.ManyToManyField(User, related_name='media_assets')
+    original = models.CharField(max_length=255)  # storage name of the uploaded file
+    content_type = models.CharField(max_length=32)
+    size = models.PositiveBigIntegerField()
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    # {variant name: {"url", "width", "height"}}, filled in once processed
+    variants = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.sha256
+
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     bio = models.TextField(blank=True)
     profile_picture = models.URLField(blank=True)
+    profile_picture_asset = models.ForeignKey(MediaAsset, null=True, blank=True, related_name='+',
+                                              on_delete=models.SET_NULL)
     location = models.CharField(max_length=255, blank=True)
     website = models.URLField(blank=True)
     cover_photo = models.URLField(blank=True)
+    # Counters maintained on the write path with F() updates; never saved from a loaded instance
+    follower_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    post_count = models.PositiveIntegerField(default=0)
+    unread_notification_count = models.PositiveIntegerField(default=0)  # the unread badge, read in O(1)
+
+    EDITABLE_FIELDS = ['bio', 'profile_picture', 'profile_picture_asset', 'location', 'website', 'cover_photo']
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['follower_count'], name='profile_follower_count_idx'),
+        ]
 
     def __str__(self):
         return self.user.username
+
+
+class TimelineEntry(models.Model):
+    # Materialized home timeline: one row per (reader, post), written when a post is
+    # fanned out. created_at mirrors the post's timestamp so a feed page is sought on
+    # the (user, created_at, post) index before that page of posts is fetched.
+    user = models.ForeignKey(User, related_name='timeline_entries', on_delete=models.CASCADE)
+    post = models.ForeignKey(Post, related_name='timeline_entries', on_delete=models.CASCADE)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'], name='unique_timeline_entry')
+        ]
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-post'], name='timeline_user_created_post_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.post} in {self.user.username}'s timeline"
+
+
+class TrendingWindow(models.Model):
+    # Bookkeeping for the incremental trending computation of one window ("1h", "24h", ...)
+    name = models.CharField(max_length=16, unique=True)
+    computed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.name
+
+
+class TrendingScore(models.Model):
+    # Time-decayed engagement score of a post within a trending window
+    window = models.CharField(max_length=16)
+    post = models.ForeignKey(Post, related_name='trending_scores', on_delete=models.CASCADE)
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['window', 'post'], name='unique_trending_score')
+        ]
+        indexes = [
+            models.Index(fields=['window', '-score'], name='trending_window_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.post} scores {self.score:.2f} in {self.window}"
+
+
+# Response cache invalidation
+def invalidate_post_responses(post_id):
+    invalidate('post', post_id)
+    for name in Hashtag.objects.filter(posts=post_id).values_list('name', flat=True):
+        invalidate('hashtag', name)
+
+
+@receiver(post_save, sender=Post)
+def invalidate_post_on_save(sender, instance, **kwargs):
+    invalidate('post', instance.pk)
+
+
+@receiver(pre_delete, sender=Post)
+def invalidate_post_on_delete(sender, instance, **kwargs):
+    # Before the delete, while the post's hashtag links still exist
+    invalidate_post_responses(instance.pk)
+
+
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_post_on_engagement(sender, instance, **kwargs):
+    invalidate_post_responses(instance.post_id)
+
+
+@receiver(post_delete, sender=Like)
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=Repost)
+def forget_trending_event(sender, instance, origin=None, **kwargs):
+    # Rankings of a deleted post go with it, so its cascaded engagement is skipped
+    if isinstance(origin, Post) or getattr(origin, 'model', None) is Post:
+        return
+    from .trending import forget_event  # trending imports the models
+    transaction.on_commit(lambda: forget_event(instance))
+
+
+@receiver(post_save, sender=Comment)
+def set_comment_path(sender, instance, created, **kwargs):
+    # The path ends with the comment's own id, so it is written right after the insert
+    if created and not instance.path:
+        parent = instance.parent
+        instance.depth = parent.depth + 1 if parent else 0
+        instance.path = (parent.path if parent else '') + str(instance.pk).zfill(Comment.PATH_WIDTH)
+        Comment.objects.filter(pk=instance.pk).update(path=instance.path, depth=instance.depth)
+
+
+@receiver(post_save, sender=Repost)
+@receiver(post_delete, sender=Repost)
+def invalidate_post_on_repost(sender, instance, **kwargs):
+    invalidate_post_responses(instance.original_post_id)
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_user_on_profile_change(sender, instance, **kwargs):
+    invalidate('user', instance.user_id)
+
+
+@receiver(post_save, sender=Hashtag)
+@receiver(post_delete, sender=Hashtag)
+def invalidate_hashtag(sender, instance, **kwargs):
+    invalidate('hashtag', instance.name)
+
+
+@receiver(post_save, sender=Follow)
+def add_follow_edge(sender, instance, created, **kwargs):
+    # Keep this process's in-memory follow graph current once the write commits
+    if created:
+        transaction.on_commit(lambda: record_follow(instance.follower_id, instance.following_id))
+
+
+@receiver(post_delete, sender=Follow)
+def remove_follow_edge(sender, instance, **kwargs):
+    transaction.on_commit(lambda: record_unfollow(instance.follower_id, instance.following_id))
@@ -0,0 +1,169 @@
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import Notification, NotificationActor, NotificationEvent, Profile
+from .realtime import publish
+from .serializers import NotificationSerializer
+
+# Singular and coalesced wording per verb; {actor} is the most recent actor
+MESSAGES = {
+    NotificationEvent.LIKE: ("{actor} liked your post", "{actor} and {others} others liked your post"),
+    NotificationEvent.COMMENT: ("{actor} commented on your post", "{actor} and {others} others commented on your post"),
+    NotificationEvent.FOLLOW: ("{actor} started following you", "{actor} and {others} others started following you"),
+    NotificationEvent.MESSAGE: ("{actor} sent you a message", "{actor} sent you {count} messages"),
+}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue(recipient_id, actor_id, verb, post_id=None):
+    # Cheap single-row insert on the request path; the worker turns it into a notification
+    if recipient_id == actor_id:
+        return None
+    return NotificationEvent.objects.create(recipient_id=recipient_id, actor_id=actor_id, verb=verb, post_id=post_id)
+
+
+def enqueue_many(events):
+    # Batch endpoints: one INSERT for (recipient_id, actor_id, verb, post_id) tuples
+    NotificationEvent.objects.bulk_create([
+        NotificationEvent(recipient_id=recipient_id, actor_id=actor_id, verb=verb, post_id=post_id)
+        for recipient_id, actor_id, verb, post_id in events
+        if recipient_id != actor_id
+    ])
+
+
+def group_key(event):
+    # Unread notifications sharing a key are merged into one row
+    if event.verb == NotificationEvent.MESSAGE:
+        return f'message:{event.actor_id}'
+    if event.post_id:
+        return f'{event.verb}:{event.post_id}'
+    return event.verb
+
+
+def render_message(verb, actor, count):
+    single, coalesced = MESSAGES[verb]
+    if count <= 1:
+        return single.format(actor=actor)
+    return coalesced.format(actor=actor, others=count - 1, count=count)
+
+
+def _actor_totals(notifications):
+    # {notification id: recorded actors}, in one grouped query
+    if not notifications:
+        return {}
+    return dict(NotificationActor.objects.filter(notification__in=notifications).order_by()
+                .values_list('notification').annotate(total=Count('id')))
+
+
+def process_batch(batch_size=None):
+    """
+    Turn up to `batch_size` queued events into notifications and delete them from
+    the queue. Events for the same recipient and group are coalesced with each other
+    and with the recipient's matching unread notification, which counts each person once.
+    Runs a fixed number of queries per batch; locked rows are skipped so several workers
+    can share the queue. Returns the number of events processed.
+    """
+    batch_size = batch_size or _setting('NOTIFICATION_BATCH_SIZE', 500)
+    with transaction.atomic():
+        events = list(
+            NotificationEvent.objects.select_for_update(skip_locked=True).order_by('id')[:batch_size]
+        )
+        if not events:
+            return 0
+
+        # (recipient, key) -> [verb, latest actor id, event count, distinct actor ids]
+        groups = {}
+        for event in events:
+            group = groups.setdefault((event.recipient_id, group_key(event)), [event.verb, None, 0, set()])
+            group[1] = event.actor_id
+            group[2] += 1
+            group[3].add(event.actor_id)
+
+        usernames = dict(User.objects.filter(id__in={group[1] for group in groups.values()}).values_list('id', 'username'))
+        # Locked, so two workers never grow the same notification at once
+        existing = {
+            (notification.recipient_id, notification.group_key): notification
+            for notification in Notification.objects.select_for_update().filter(
+                recipient_id__in={recipient_id for recipient_id, _ in groups},
+                group_key__in={key for _, key in groups},
+                is_read=False,
+            )
+        }
+
+        now = timezone.now()
+        created, updated = [], []
+        for (recipient_id, key), (verb, actor_id, events_count, actors) in groups.items():
+            notification = existing.get((recipient_id, key))
+            if notification is None:
+                # Messages count every event, everything else counts people
+                count = events_count if verb == NotificationEvent.MESSAGE else len(actors)
+                notification = Notification(recipient_id=recipient_id, group_key=key, event_count=count)
+                notification.message = render_message(verb, usernames.get(actor_id, 'Someone'), count)
+                created.append(notification)
+            else:
+                if verb == NotificationEvent.MESSAGE:
+                    notification.event_count += events_count
+                notification.created_at = now
+                updated.append(notification)
+        Notification.objects.bulk_create(created)
+        bump_unread(Counter(notification.recipient_id for notification in created))
+
+        # People are recorded per notification, and a grouped notification grows only by those it
+        # had not recorded yet: an actor counted in an earlier batch (say, who liked, unliked and
+        # liked again) is not counted twice
+        notifications = {(notification.recipient_id, notification.group_key): notification
+                         for notification in created + updated}
+        people = [group for group, (verb, _, _, _) in groups.items() if verb != NotificationEvent.MESSAGE]
+        grown = [existing[group] for group in people if group in existing]
+        before = _actor_totals(grown)
+        NotificationActor.objects.bulk_create([
+            NotificationActor(notification=notifications[group], actor_id=actor_id)
+            for group in people for actor_id in groups[group][3]
+        ], ignore_conflicts=True)
+        after = _actor_totals(grown)
+        for notification in grown:
+            notification.event_count += after.get(notification.pk, 0) - before.get(notification.pk, 0)
+        for notification in updated:
+            verb, actor_id, _, _ = groups[(notification.recipient_id, notification.group_key)]
+            notification.message = render_message(verb, usernames.get(actor_id, 'Someone'), notification.event_count)
+        if updated:
+            Notification.objects.bulk_update(updated, ['message', 'event_count', 'created_at'])
+        NotificationEvent.objects.filter(id__in=[event.id for event in events]).delete()
+        for notification in created + updated:
+            publish(notification.recipient_id, 'notification', NotificationSerializer(notification).data)
+    return len(events)
+
+
+def bump_unread(deltas):
+    # Move Profile.unread_notification_count by {user id: delta} with F() updates, one UPDATE
+    # per distinct delta. Callers change the counter by exactly the notifications they
+    # created, marked or deleted, so concurrent writers never overwrite each other
+    by_delta = defaultdict(list)
+    for user_id, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(user_id)
+    for delta, user_ids in by_delta.items():
+        Profile.objects.filter(user_id__in=user_ids).update(
+            unread_notification_count=F('unread_notification_count') + delta,
+        )
+
+
+def unread_count(user_id):
+    # O(1): the counter maintained on the profile, current in every process
+    return Profile.objects.filter(user_id=user_id).values_list('unread_notification_count', flat=True).first() or 0
+
+
+def mark_all_read(user_id):
+    # One UPDATE however many notifications are unread
+    with transaction.atomic():
+        marked = Notification.objects.filter(recipient_id=user_id, is_read=False).update(is_read=True)
+        bump_unread({user_id: -marked})
+    return marked
@@ -0,0 +1,198 @@
+import base64
+import datetime
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def _encode_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+def _position(item, ordering):
+    fields = [field.lstrip('-') for field in ordering]
+    if isinstance(item, dict):
+        return [_encode_value(item[name]) for name in fields]
+    return [_encode_value(getattr(item, name)) for name in fields]
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset ("seek") pagination over a unique ordering such as (created_at, id).
+
+    Each page is fetched with a WHERE clause on the last seen position instead of
+    an OFFSET, and no COUNT(*) is run, so page 1000 costs the same as page 1.
+    Cursors are opaque base64 tokens.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_ordering(self, view=None):
+        return tuple(getattr(view, 'keyset_ordering', self.ordering))
+
+    def get_page_size(self, request):
+        return self._page_size_from(request.query_params)
+
+    def _page_size_from(self, params):
+        if self.page_size_query_param:
+            try:
+                size = int(params[self.page_size_query_param])
+                if size > 0:
+                    return min(size, self.max_page_size)
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def make_cursor(self, position, reverse=False):
+        payload = json.dumps({'p': position, 'r': int(reverse)}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def encode_cursor(self, position, reverse):
+        return replace_query_param(self.base_url, self.cursor_query_param, self.make_cursor(position, reverse))
+
+    def decode_cursor(self, request, queryset):
+        return self._parse_cursor(request.query_params.get(self.cursor_query_param), queryset)
+
+    def _parse_cursor(self, token, queryset):
+        if not token:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+            position = payload['p']
+            reverse = bool(payload['r'])
+            if len(position) != len(self.ordering):
+                raise ValueError
+            return [self._to_python(queryset, field, value) for field, value in zip(self.ordering, position)], reverse
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _to_python(self, queryset, field, value):
+        # Cursors are client input: every value is converted by the field it seeks on
+        # (ValidationError, TypeError and ValueError become NotFound in _parse_cursor)
+        name = field.lstrip('-')
+        if value is None:
+            raise ValueError(f"No position on '{name}'")
+        try:
+            model_field = queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            model_field = queryset.query.annotations[name].output_field
+        return model_field.to_python(value)
+
+    def _seek(self, position, reverse):
+        # (a, b, c) after (x, y, z) in the ordering direction, expanded as
+        # a < x OR (a = x AND b < y) OR ... plus a leading range bound on the
+        # first column so the database can use the index for the seek.
+        lookups = []
+        for field in self.ordering:
+            descending = field.startswith('-') != reverse
+            lookups.append((field.lstrip('-'), 'lt' if descending else 'gt'))
+
+        condition = Q()
+        equal = {}
+        for (name, lookup), value in zip(lookups, position):
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        first_name, first_lookup = lookups[0]
+        bound = 'lte' if first_lookup == 'lt' else 'gte'
+        return Q(**{f'{first_name}__{bound}': position[0]}) & condition
+
+    def _order_by(self, reverse):
+        if not reverse:
+            return self.ordering
+        return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering)
+
+    def _page_queryset(self, queryset, request, view, ordering):
+        self.ordering = tuple(ordering) if ordering else self.get_ordering(view)
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self._page_size = self.get_page_size(request)
+        self._position, self._reverse = self.decode_cursor(request, queryset)
+        return self._bound(queryset, self._position, self._reverse, self._page_size)
+
+    def _bound(self, queryset, position, reverse, page_size):
+        queryset = queryset.order_by(*self._order_by(reverse))
+        if position is not None:
+            queryset = queryset.filter(self._seek(position, reverse))
+        # Fetch one extra row to learn whether another page exists
+        return queryset[:page_size + 1]
+
+    def bound_queryset(self, queryset, params, ordering, columns=None):
+        """
+        `queryset` narrowed to the rows of the page that `params` (a query string) asks for,
+        with the seek, ordering and LIMIT of that page; `columns` renames ordering fields.
+        Bounds an inner query the page is drawn from, such as a subquery on a table that
+        mirrors the ordering columns, so that it does not read past the page either.
+        """
+        columns = columns or {}
+        self.ordering = tuple(
+            ('-' if field.startswith('-') else '') + columns.get(field.lstrip('-'), field.lstrip('-'))
+            for field in ordering
+        )
+        position, reverse = self._parse_cursor(params.get(self.cursor_query_param), queryset)
+        return self._bound(queryset, position, reverse, self._page_size_from(params))
+
+    def paginate_queryset(self, queryset, request, view=None, ordering=None):
+        return self._set_page(list(self._page_queryset(queryset, request, view, ordering)))
+
+    async def apaginate_queryset(self, queryset, request, view=None, ordering=None):
+        # Same as paginate_queryset, fetching the page with the async ORM
+        return self._set_page([row async for row in self._page_queryset(queryset, request, view, ordering)])
+
+    def _set_page(self, rows):
+        page_size, position, reverse = self._page_size, self._position, self._reverse
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        if reverse:
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+        self.page = rows
+        return rows
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(_position(self.page[-1], self.ordering), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(_position(self.page[0], self.ordering), reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
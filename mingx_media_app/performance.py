@@ -0,0 +1,244 @@
+import contextlib
+import contextvars
+import heapq
+import itertools
+import json
+import logging
+import threading
+import time
+from bisect import bisect_right
+from collections import deque
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+_sequence = itertools.count()
+
+
+def config():
+    return getattr(settings, 'PERFORMANCE', {})
+
+
+class RequestMetrics:
+    """
+    Timings of one request. Queries are attributed through a context variable, so the
+    async ORM's worker threads (which copy the context) report to the right request.
+    """
+
+    def __init__(self, statement_limit=20):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.phases = {}
+        self.statement_limit = statement_limit
+        self.statements = []  # min-heap of the slowest (duration, sequence, sql)
+        self.view_started = None
+        self.view_finished = None
+
+    def add_phase(self, name, elapsed):
+        self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+    def add_query(self, sql, elapsed):
+        self.queries += 1
+        self.db_time += elapsed
+        item = (elapsed, next(_sequence), sql)
+        if len(self.statements) < self.statement_limit:
+            heapq.heappush(self.statements, item)
+        elif self.statement_limit:
+            heapq.heappushpop(self.statements, item)
+
+    def timings(self):
+        # Seconds per phase. DRF authenticates inside the view, so auth is taken out of view;
+        # db overlaps the other phases
+        now = time.perf_counter()
+        auth = self.phases.get('auth', 0.0)
+        timings = {'db': self.db_time, 'auth': auth}
+        if self.view_started is not None:
+            view_finished = self.view_finished or now
+            timings['view'] = max(view_finished - self.view_started - auth, 0.0)
+            timings['render'] = now - view_finished if self.view_finished else 0.0
+        timings['total'] = now - self.started
+        return timings
+
+    def slowest_statements(self):
+        return [{'ms': round(elapsed * 1000, 3), 'sql': sql} for elapsed, _, sql in sorted(self.statements, reverse=True)]
+
+
+def current_metrics():
+    return _current.get()
+
+
+def start_request():
+    metrics = RequestMetrics(config().get('SLOW_QUERY_LIMIT', 20))
+    return metrics, _current.set(metrics)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def mark_view_started():
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.view_started = time.perf_counter()
+
+
+def mark_view_finished():
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.view_finished = time.perf_counter()
+
+
+@contextlib.contextmanager
+def timed(phase):
+    # Adds the block's duration to a phase of the current request, if it is instrumented
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add_phase(phase, time.perf_counter() - start)
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query(sql, time.perf_counter() - start)
+
+
+def install_query_recorder(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@receiver(connection_created)
+def _install_on_connect(sender, connection, **kwargs):
+    # Connections opened later, e.g. in the threads that run async ORM calls
+    install_query_recorder(connection)
+
+
+def install_query_recorders():
+    # Connections of the current thread that were opened before this module was imported
+    for connection in connections.all(initialized_only=True):
+        install_query_recorder(connection)
+
+
+def report(request, response, metrics):
+    """
+    Publish the metrics of a finished request: Server-Timing header, a JSON log line
+    (WARNING with the slowest SQL for requests over SLOW_REQUEST_MS, INFO otherwise) and
+    the per-endpoint histograms.
+    """
+    timings = metrics.timings()
+    response['Server-Timing'] = ', '.join(
+        f'{name};dur={elapsed * 1000:.3f}' + (f';desc="{metrics.queries} queries"' if name == 'db' else '')
+        for name, elapsed in timings.items()
+    )
+
+    match = request.resolver_match
+    endpoint = f'{request.method} {match.view_name}' if match else None
+    total_ms = timings['total'] * 1000
+    slow = total_ms >= config().get('SLOW_REQUEST_MS', 500)
+    entry = None
+    if slow or logger.isEnabledFor(logging.INFO):
+        entry = {
+            'method': request.method,
+            'path': request.path,
+            'endpoint': endpoint,
+            'status': response.status_code,
+            'queries': metrics.queries,
+            **{f'{name}_ms': round(elapsed * 1000, 3) for name, elapsed in timings.items()},
+        }
+        if slow:
+            entry['sql'] = metrics.slowest_statements()
+            logger.warning(json.dumps(entry))
+        else:
+            logger.info(json.dumps(entry))
+    if endpoint is not None:
+        record(endpoint, metrics, total_ms, entry if slow else None)
+    return timings
+
+
+class EndpointStats:
+    # Rolling window of the latest samples of one endpoint
+    def __init__(self, window):
+        self.count = 0
+        self.samples = deque(maxlen=window)  # (total ms, db ms, queries)
+
+    def add(self, total_ms, db_ms, queries):
+        self.count += 1
+        self.samples.append((total_ms, db_ms, queries))
+
+    def summary(self):
+        totals = sorted(sample[0] for sample in self.samples)
+        size = len(totals)
+
+        def percentile(fraction):
+            return round(totals[min(int(size * fraction), size - 1)], 3)
+
+        histogram, previous = {}, 0
+        for bound in BUCKETS_MS + (None,):
+            index = bisect_right(totals, bound) if bound is not None else size
+            histogram[f'le_{bound}' if bound is not None else 'inf'] = index - previous
+            previous = index
+        return {
+            'count': self.count,
+            'window': size,
+            'p50_ms': percentile(0.5),
+            'p95_ms': percentile(0.95),
+            'p99_ms': percentile(0.99),
+            'max_ms': round(totals[-1], 3),
+            'avg_db_ms': round(sum(sample[1] for sample in self.samples) / size, 3),
+            'avg_queries': round(sum(sample[2] for sample in self.samples) / size, 2),
+            'histogram_ms': histogram,
+        }
+
+
+_lock = threading.Lock()
+_endpoints = {}
+_slow_requests = []  # min-heap of the slowest (total ms, sequence, entry)
+
+
+def record(endpoint, metrics, total_ms, slow_entry=None):
+    db_ms = metrics.db_time * 1000
+    with _lock:
+        stats = _endpoints.get(endpoint)
+        if stats is None:
+            stats = _endpoints[endpoint] = EndpointStats(config().get('HISTOGRAM_WINDOW', 1000))
+        stats.add(total_ms, db_ms, metrics.queries)
+        if slow_entry is not None:
+            item = (total_ms, next(_sequence), slow_entry)
+            if len(_slow_requests) < config().get('SLOW_LOG_SIZE', 50):
+                heapq.heappush(_slow_requests, item)
+            else:
+                heapq.heappushpop(_slow_requests, item)
+
+
+def stats():
+    # Per-process view: each worker keeps its own histograms
+    with _lock:
+        endpoints = {name: endpoint.summary() for name, endpoint in sorted(_endpoints.items())}
+        slow = [entry for _, _, entry in sorted(_slow_requests, key=lambda item: item[:2], reverse=True)]
+    return {'endpoints': endpoints, 'slow_requests': slow}
+
+
+def reset_stats():
+    with _lock:
+        _endpoints.clear()
+        _slow_requests.clear()
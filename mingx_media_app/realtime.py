@@ -0,0 +1,153 @@
+import asyncio
+import functools
+import json
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections, transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework.utils.encoders import JSONEncoder
+
+logger = logging.getLogger(__name__)
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def _offer(queue, message):
+    # A subscriber that stops reading loses its oldest events instead of growing without bound
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(message)
+
+
+class Hub:
+    """
+    In-process pub/sub for the stream endpoint. Subscribers are asyncio queues living
+    on the server's event loop; dispatch() is thread-safe, so sync views and broker
+    listeners can publish into it.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self._loop = None
+        self._listener = None
+
+    def subscribe(self, channel):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(self.queue_size)
+        with self._lock:
+            self._loop = loop
+            self._subscribers[channel].add(queue)
+            if self._listener is None or self._listener.get_loop() is not loop:
+                self._listener = loop.create_task(get_broker().listen(self))
+        return queue
+
+    def unsubscribe(self, channel, queue):
+        with self._lock:
+            queues = self._subscribers.get(channel)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[channel]
+
+    def dispatch(self, channel, message):
+        with self._lock:
+            queues = list(self._subscribers.get(channel, ()))
+            loop = self._loop
+        for queue in queues:
+            loop.call_soon_threadsafe(_offer, queue, message)
+        return len(queues)
+
+    def connection_count(self):
+        with self._lock:
+            return sum(len(queues) for queues in self._subscribers.values())
+
+
+class BaseBroker:
+    # Carries published events to the hub of every process that holds stream connections
+
+    def publish(self, channel, message):
+        raise NotImplementedError
+
+    async def listen(self, hub):
+        # Feed events published by other processes into `hub`; runs for the life of the process
+        return None
+
+
+class LocalBroker(BaseBroker):
+    # Single process: events only reach connections held by the publishing process
+    def publish(self, channel, message):
+        get_hub().dispatch(channel, message)
+
+
+class PostgresBroker(BaseBroker):
+    # Several processes: events travel through PostgreSQL LISTEN/NOTIFY (payloads up to 8000 bytes)
+    def __init__(self, alias='default', pg_channel='realtime', reconnect_delay=1.0):
+        self.alias = alias
+        self.pg_channel = pg_channel
+        self.reconnect_delay = reconnect_delay
+
+    def publish(self, channel, message):
+        payload = json.dumps({'channel': channel, 'message': message}, cls=JSONEncoder)
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.pg_channel, payload])
+
+    def conninfo(self):
+        import psycopg
+
+        db = connections[self.alias].settings_dict
+        params = {'dbname': db['NAME'], 'user': db['USER'], 'password': db['PASSWORD'],
+                  'host': db['HOST'], 'port': db['PORT']}
+        return psycopg.conninfo.make_conninfo(**{key: value for key, value in params.items() if value})
+
+    async def listen(self, hub):
+        import psycopg
+        from psycopg import sql
+
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(self.conninfo(), autocommit=True) as conn:
+                    await conn.execute(sql.SQL('LISTEN {}').format(sql.Identifier(self.pg_channel)))
+                    async for notify in conn.notifies():
+                        event = json.loads(notify.payload)
+                        hub.dispatch(event['channel'], event['message'])
+            except psycopg.Error:
+                logger.exception("Realtime listener lost its connection; reconnecting")
+                await asyncio.sleep(self.reconnect_delay)
+
+
+@functools.lru_cache(maxsize=None)
+def get_broker():
+    config = settings.REALTIME
+    return import_string(config['BROKER'])(**config.get('OPTIONS', {}))
+
+
+@functools.lru_cache(maxsize=None)
+def get_hub():
+    return Hub(settings.REALTIME.get('QUEUE_SIZE', 100))
+
+
+@receiver(setting_changed)
+def _reset_realtime(setting, **kwargs):
+    if setting == 'REALTIME':
+        get_broker.cache_clear()
+        get_hub.cache_clear()
+
+
+def publish(user_id, event_type, data):
+    # Sent once the surrounding transaction commits, so clients never see rolled-back rows
+    message = {'type': event_type, 'data': data}
+    transaction.on_commit(lambda: get_broker().publish(user_channel(user_id), message))
+
+
+def format_event(message):
+    data = json.dumps(message['data'], cls=JSONEncoder)
+    return f"event: {message['type']}\ndata: {data}\n\n"
@@ -0,0 +1,71 @@
+from django.db import transaction
+from django.db.models import Count
+
+from .caching import invalidate
+from .models import Comment, Follow, Like, Notification, Post, Profile, Repost
+
+# model -> (column the counted rows point at, cache kind to invalidate, (counter field, counted rows, fk))
+COUNTERS = {
+    Post: ('id', 'post', (
+        ('like_count', Like.objects.all(), 'post_id'),
+        ('comment_count', Comment.objects.all(), 'post_id'),
+        ('repost_count', Repost.objects.all(), 'original_post_id'),
+    )),
+    Profile: ('user_id', 'user', (
+        ('follower_count', Follow.objects.all(), 'following_id'),
+        ('following_count', Follow.objects.all(), 'follower_id'),
+        ('post_count', Post.objects.all(), 'author_id'),
+        ('unread_notification_count', Notification.objects.filter(is_read=False), 'recipient_id'),
+    )),
+}
+
+
+def reconcile_counters(model, chunk_size=1000, dry_run=False):
+    """
+    Recount the counters of `model` (Post or Profile) in id order, chunk_size rows at a time,
+    and write back the ones that drifted. Each chunk is locked with SELECT ... FOR UPDATE
+    before it is counted, so a concurrent F() increment either commits before the count sees
+    it or waits for the repair and applies on top of it; none is overwritten. Returns
+    (checked, drifted).
+    """
+    key, kind, counters = COUNTERS[model]
+    fields = [field for field, _, _ in counters]
+    checked = drifted_total = 0
+    last_id = 0
+
+    while True:
+        with transaction.atomic():
+            rows = model.objects.filter(id__gt=last_id).order_by('id').only('id', key, *fields)[:chunk_size]
+            rows = list(rows if dry_run else rows.select_for_update())
+            if not rows:
+                break
+            keys = [getattr(row, key) for row in rows]
+
+            # One grouped query per counter for the whole chunk
+            actual = {
+                field: dict(counted.filter(**{f'{fk}__in': keys}).order_by().values_list(fk)
+                            .annotate(total=Count('id')))
+                for field, counted, fk in counters
+            }
+
+            drifted = []
+            for row in rows:
+                changed = False
+                for field in fields:
+                    value = actual[field].get(getattr(row, key), 0)
+                    if getattr(row, field) != value:
+                        setattr(row, field, value)
+                        changed = True
+                if changed:
+                    drifted.append(row)
+
+            if drifted and not dry_run:
+                model.objects.bulk_update(drifted, fields)
+                for row in drifted:
+                    invalidate(kind, getattr(row, key))
+
+        checked += len(rows)
+        drifted_total += len(drifted)
+        last_id = rows[-1].id
+
+    return checked, drifted_total
@@ -0,0 +1,69 @@
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # optional: the stdlib json module is used instead
+    orjson = None
+
+# Types orjson would format differently from DRF's JSONEncoder are handed back to it
+_default = JSONEncoder().default
+if orjson is not None:
+    _OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS
+
+
+def dumps(data, sort_keys=False):
+    """
+    Compact UTF-8 JSON, the same as DRF's JSONRenderer produces with the default settings
+    (UNICODE_JSON and COMPACT_JSON): datetimes end in 'Z' for UTC, Decimals become numbers,
+    lazy strings are forced, U+2028 and U+2029 are escaped. Only floats in exponent notation
+    are spelled differently (1e20 rather than 1e+20).
+    """
+    content = None
+    if orjson is not None:
+        try:
+            content = orjson.dumps(data, default=_default,
+                                   option=_OPTIONS | (orjson.OPT_SORT_KEYS if sort_keys else 0))
+        except TypeError:
+            pass  # e.g. integers beyond 64 bits, which json handles
+    if content is None:
+        content = json.dumps(data, cls=JSONEncoder, ensure_ascii=False, allow_nan=not api_settings.STRICT_JSON,
+                             separators=(',', ':'), sort_keys=sort_keys).encode('utf-8')
+    # Keep the output a strict JavaScript subset, as JSONRenderer does
+    return content.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer backed by orjson. Falls back to DRF's renderer when orjson is not
+    installed, when indented output is requested (e.g. `Accept: application/json; indent=4`)
+    or when the non-default UNICODE_JSON/COMPACT_JSON settings are changed.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if (orjson is None or not (self.ensure_ascii is False and self.compact)
+                or self.get_indent(accepted_media_type or '', renderer_context or {})):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+class ORJSONParser(JSONParser):
+    # JSONParser backed by orjson, which only reads UTF-8; other charsets go through json
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
@@ -0,0 +1,177 @@
+import contextvars
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.dispatch import receiver
+from django.utils.connection import ConnectionDoesNotExist
+from rest_framework_simplejwt.exceptions import TokenBackendError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.state import token_backend
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# True while handling a request that may read from a replica; everything else (writes,
+# management commands, the notification worker) reads from the primary
+_replica_reads = contextvars.ContextVar('replica_reads', default=False)
+
+
+def config():
+    return getattr(settings, 'DATABASE_REPLICAS', {})
+
+
+def replica_aliases():
+    return config().get('ALIASES', [])
+
+
+# Read-your-writes pin, kept in the response cache backend under the user's id so every worker
+# sharing it (DjangoCacheBackend) sees it, whether or not the client keeps cookies. A signed,
+# short-lived cookie naming the user is set as well, for backends that are per process
+PIN_COOKIE = 'replica_pin'
+PIN_SALT = 'mingx_media_app.routers.pin'
+
+
+def _pin_key(user_id):
+    return f'replica_pin:{user_id}'
+
+
+def pin_to_primary(response, user_id):
+    # Keep the user's reads on the primary while replicas catch up
+    from .caching import get_backend  # caching imports this module
+
+    sticky = config().get('STICKY_SECONDS', 10)
+    get_backend().set(_pin_key(user_id), time.time(), sticky)
+    response.set_signed_cookie(PIN_COOKIE, str(user_id), salt=PIN_SALT, max_age=sticky,
+                               secure=settings.SESSION_COOKIE_SECURE, httponly=True, samesite='Lax')
+
+
+def is_pinned(request, user_id):
+    from .caching import get_backend
+
+    sticky = config().get('STICKY_SECONDS', 10)
+    pinned_at = get_backend().get(_pin_key(user_id))
+    if pinned_at is not None and time.time() - pinned_at < sticky:
+        return True
+    # The signature's timestamp bounds the pin even if the client keeps the cookie longer
+    pinned = request.get_signed_cookie(PIN_COOKIE, default=None, salt=PIN_SALT, max_age=sticky)
+    return pinned == str(user_id)
+
+
+def token_user_id(request):
+    # The user id claim of the bearer token, without verifying it: it only picks the database
+    # the reads go to, and DRF authenticates the request as usual
+    parts = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if len(parts) != 2 or parts[0] not in jwt_settings.AUTH_HEADER_TYPES:
+        return None
+    try:
+        return token_backend.decode(parts[1], verify=False).get(jwt_settings.USER_ID_CLAIM)
+    except TokenBackendError:
+        return None
+
+
+def begin_request(request):
+    user_id = token_user_id(request)
+    request.replica_user_id = user_id
+    reads = request.method in SAFE_METHODS and not (user_id is not None and is_pinned(request, user_id))
+    return _replica_reads.set(reads)
+
+
+def end_request(request, response, token):
+    _replica_reads.reset(token)
+    if (response is not None and response.status_code < 400 and request.method not in SAFE_METHODS
+            and request.replica_user_id is not None):
+        pin_to_primary(response, request.replica_user_id)
+
+
+def replica_may_lag(changed_at):
+    # Whether reads of the current request could still miss a write made at changed_at (epoch seconds)
+    return (_replica_reads.get() and bool(replica_aliases())
+            and time.time() - changed_at < config().get('MAX_LAG_SECONDS', 5))
+
+
+class ReplicaHealth:
+    """
+    Per-process health of the replicas, rechecked at most every HEALTH_CHECK_INTERVAL
+    seconds. A replica is unhealthy when it cannot be queried or, on PostgreSQL, when it
+    replays more than MAX_LAG_SECONDS behind the primary.
+    """
+
+    def __init__(self):
+        self._checked = {}  # alias -> (healthy, checked at)
+        self._lock = threading.Lock()
+
+    def healthy(self, aliases):
+        interval = config().get('HEALTH_CHECK_INTERVAL', 5)
+        now = time.monotonic()
+        result = []
+        for alias in aliases:
+            with self._lock:
+                state = self._checked.get(alias)
+            if state is None or now - state[1] >= interval:
+                state = (self.check(alias), now)
+                with self._lock:
+                    self._checked[alias] = state
+            if state[0]:
+                result.append(alias)
+        return result
+
+    def check(self, alias):
+        try:
+            connection = connections[alias]
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                max_lag = config().get('MAX_LAG_SECONDS')
+                if connection.vendor == 'postgresql' and max_lag is not None:
+                    # Caught up when everything received has been replayed, whatever the last commit time
+                    cursor.execute(
+                        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                        "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+                    )
+                    lag = cursor.fetchone()[0]
+                    if lag > max_lag:
+                        logger.warning("Replica %s is %.1fs behind, reading from the primary", alias, lag)
+                        return False
+            return True
+        except (ConnectionDoesNotExist, DatabaseError) as exc:
+            logger.warning("Replica %s failed its health check, reading from the primary: %s", alias, exc)
+            return False
+
+    def reset(self):
+        with self._lock:
+            self._checked.clear()
+
+
+health = ReplicaHealth()
+
+
+@receiver(setting_changed)
+def _reset_health(setting, **kwargs):
+    if setting == 'DATABASE_REPLICAS':
+        health.reset()
+
+
+class ReplicaRouter:
+    """
+    Sends reads of safe-method requests (see ReplicaRoutingMiddleware) to a random healthy
+    replica and everything else to the primary. Reads inside a transaction stay on the
+    primary, so they see the transaction's own writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        replicas = health.healthy(replica_aliases())
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
@@ -0,0 +1,51 @@
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+
+POST_TABLE = Post._meta.db_table
+FTS_TABLE = f'{POST_TABLE}_fts'
+TSQUERY = "websearch_to_tsquery('english', %s)"
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _fts5_query(text):
+    # Quote every word so user input can never be parsed as FTS5 syntax; words are ANDed
+    words = _WORD_RE.findall(text)
+    return ' '.join(f'"{word}"' for word in words)
+
+
+def search_posts(queryset, text):
+    """
+    Filter a Post queryset down to posts matching `text`, annotated with `search_rank`
+    (higher is more relevant). Uses the tsvector/GIN index on PostgreSQL and the FTS5
+    table on SQLite, and falls back to icontains on other databases.
+    """
+    vendor = connections[queryset.db].vendor
+
+    if vendor == 'postgresql':
+        return queryset.annotate(
+            search_rank=RawSQL(f'ts_rank({POST_TABLE}.search_vector, {TSQUERY})', [text], output_field=FloatField()),
+        ).filter(
+            RawSQL(f'{POST_TABLE}.search_vector @@ {TSQUERY}', [text], output_field=BooleanField()),
+        )
+
+    if vendor == 'sqlite':
+        match = _fts5_query(text)
+        if not match:
+            return queryset.none()
+        # Join the FTS5 table so MATCH drives the query; bm25() is lower for better
+        # matches, so it is negated to rank descending
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = {POST_TABLE}.id', f'{FTS_TABLE} MATCH %s'],
+            params=[match],
+        ).annotate(
+            search_rank=RawSQL(f'-bm25({FTS_TABLE})', [], output_field=FloatField()),
+        )
+
+    return queryset.filter(content__icontains=text).annotate(search_rank=Value(0.0, output_field=FloatField()))
@@ -1,14 +1,41 @@
-from rest_framework import serializers
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from django.conf import settings
 from django.contrib.auth.models import User
-from .models import Post, Follow, Profile, Comment, Like, Notification, Message, Hashtag  # Add missing imports
+from .models import Post, Follow, Profile, Comment, Like, Notification, Message, Hashtag, Repost, ConversationMember, MediaAsset  # Add missing imports
+
+# Media Asset Serializer
+class MediaAssetSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = MediaAsset
+        fields = ['id', 'sha256', 'content_type', 'size', 'width', 'height', 'status', 'variants', 'created_at']
+        read_only_fields = fields
+
+
+def validate_own_asset(serializer, asset, current=None):
+    # An upload can be attached only by a user who uploaded that content (or kept where it is)
+    if asset is None or asset == current:
+        return asset
+    request = serializer.context.get('request')
+    if request is None or not asset.uploaders.filter(pk=request.user.pk).exists():
+        raise serializers.ValidationError("Upload the file before attaching it")
+    return asset
+
 
 # Post Serializer
 class PostSerializer(serializers.ModelSerializer):
     author = serializers.ReadOnlyField(source='author.username')
+    # Variant URLs of the attached upload; empty until processed, null without one
+    media_variants = serializers.JSONField(source='media_asset.variants', read_only=True, default=None)
 
     class Meta:
         model = Post
-        fields = ['id', 'author', 'content', 'media', 'created_at']
+        fields = ['id', 'author', 'content', 'media', 'media_asset', 'media_variants', 'created_at',
+                  'like_count', 'comment_count', 'repost_count']
+        read_only_fields = ['like_count', 'comment_count', 'repost_count']
+
+    def validate_media_asset(self, asset):
+        return validate_own_asset(self, asset, self.instance.media_asset if self.instance else None)
 
 
 # Follow Serializer
@@ -23,9 +50,18 @@ class FollowSerializer(serializers.ModelSerializer):
 
 # Profile Serializer
 class ProfileSerializer(serializers.ModelSerializer):
+    profile_picture_variants = serializers.JSONField(source='profile_picture_asset.variants', read_only=True,
+                                                     default=None)
+
     class Meta:
         model = Profile
-        fields = ['bio', 'profile_picture']
+        fields = ['bio', 'profile_picture', 'profile_picture_asset', 'profile_picture_variants',
+                  'follower_count', 'following_count', 'post_count']
+        read_only_fields = ['follower_count', 'following_count', 'post_count']
+
+    def validate_profile_picture_asset(self, asset):
+        user = self.parent.instance if self.parent is not None else None
+        return validate_own_asset(self, asset, user.profile.profile_picture_asset if user else None)
 
 
 # User Serializer
@@ -60,7 +96,8 @@ class UserSerializer(serializers.ModelSerializer):
             profile = instance.profile
             profile.bio = profile_data.get('bio', profile.bio)
             profile.profile_picture = profile_data.get('profile_picture', profile.profile_picture)
-            profile.save()
+            profile.profile_picture_asset = profile_data.get('profile_picture_asset', profile.profile_picture_asset)
+            profile.save(update_fields=['bio', 'profile_picture', 'profile_picture_asset'])
         return instance
 
 
@@ -70,7 +107,22 @@ class CommentSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Comment
-        fields = ['id', 'author', 'content', 'created_at']
+        fields = ['id', 'post', 'parent', 'author', 'content', 'depth', 'reply_count', 'created_at']
+        read_only_fields = ['depth', 'reply_count']
+
+    def validate(self, attrs):
+        post, parent = attrs.get('post'), attrs.get('parent')
+        if self.instance is not None:
+            # Editing changes the content only
+            if (post and post != self.instance.post) or ('parent' in attrs and parent != self.instance.parent):
+                raise serializers.ValidationError("A comment cannot be moved to another post or thread")
+            return attrs
+        if parent is not None:
+            if parent.post_id != post.pk:
+                raise serializers.ValidationError({"parent": "The parent comment belongs to another post"})
+            if parent.depth + 1 > settings.COMMENT_MAX_DEPTH:
+                raise serializers.ValidationError({"parent": f"Replies are limited to {settings.COMMENT_MAX_DEPTH} levels"})
+        return attrs
 
 
 # Like Serializer
@@ -95,11 +147,128 @@ class MessageSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Message
-        fields = ['id', 'sender', 'recipient', 'content', 'created_at', 'is_read']
+        fields = ['id', 'sender', 'recipient', 'conversation', 'content', 'created_at', 'is_read']
+        read_only_fields = ['conversation']
+
+
+# Conversation (inbox entry) Serializer, one per thread the user takes part in
+class ConversationSerializer(serializers.ModelSerializer):
+    id = serializers.ReadOnlyField(source='conversation_id')
+    participants = serializers.SerializerMethodField()
+    last_message = MessageSerializer(source='conversation.last_message', read_only=True)
+
+    class Meta:
+        model = ConversationMember
+        fields = ['id', 'participants', 'last_message', 'last_message_at', 'unread_count']
+
+    def get_participants(self, member):
+        return [other.user.username for other in member.conversation.members.all()]
 
 
 # Hashtag Serializer
 class HashtagSerializer(serializers.ModelSerializer):
     class Meta:
         model = Hashtag
-        fields = ['name', 'posts']
+        fields = ['name']
+
+
+# Repost Serializer
+class RepostSerializer(serializers.ModelSerializer):
+    user = serializers.ReadOnlyField(source='user.username')
+
+    class Meta:
+        model = Repost
+        fields = ['id', 'user', 'original_post', 'created_at']
+
+
+# Read-only fast path for list endpoints
+def _iso_datetime_converter(field):
+    # Same output as DateTimeField.to_representation with the ISO 8601 format, with the
+    # timezone resolved once per batch instead of once per value
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if field_timezone is None:
+        return field.to_representation
+
+    def convert(value):
+        if isinstance(value, str) or value.tzinfo is None:
+            return field.to_representation(value)
+        value = value.astimezone(field_timezone).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return convert
+
+
+class ValuesSerializer:
+    """
+    Builds the same representation as a ModelSerializer straight from values() rows.
+
+    Field sources and to_representation callables are resolved up front, so serializing
+    a row is a plain loop over tuples with no serializer or field instantiation. Only
+    plain model fields, dotted ReadOnlyFields and primary-key relations are supported.
+    """
+
+    # Builtins equivalent to common to_representation implementations (for non-null values)
+    FAST_CONVERTERS = {
+        serializers.CharField.to_representation: str,
+        serializers.IntegerField.to_representation: int,
+    }
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        compiled = []
+        for name, field in serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if field.source == '*' or isinstance(field, (
+                serializers.SerializerMethodField, serializers.BaseSerializer,
+                serializers.ManyRelatedField, serializers.HiddenField,
+            )):
+                raise TypeError(f"{serializer_class.__name__}.{name} is not supported by ValuesSerializer")
+            if isinstance(field, serializers.RelatedField):
+                if not isinstance(field, serializers.PrimaryKeyRelatedField) or field.pk_field is not None:
+                    raise TypeError(f"{serializer_class.__name__}.{name} is not supported by ValuesSerializer")
+                convert = None  # values() already yields the primary key
+            elif isinstance(field, serializers.ReadOnlyField):
+                convert = None
+            elif type(field).to_representation is serializers.DateTimeField.to_representation and \
+                    getattr(field, 'format', api_settings.DATETIME_FORMAT) == ISO_8601:
+                convert = _iso_datetime_converter  # bound per batch, see _bind()
+            else:
+                convert = self.FAST_CONVERTERS.get(type(field).to_representation, field.to_representation)
+            compiled.append((name, '__'.join(field.source_attrs), convert, field))
+        self.fields = tuple(compiled)
+        self.lookups = tuple(lookup for _, lookup, _, _ in compiled)
+
+    def values(self, queryset, *extra):
+        # extra: additional columns the caller needs, e.g. keyset pagination fields
+        lookups = self.lookups + tuple(name for name in extra if name not in self.lookups)
+        return queryset.values(*lookups)
+
+    def _bind(self):
+        return tuple(
+            (name, lookup, convert(field) if convert is _iso_datetime_converter else convert)
+            for name, lookup, convert, field in self.fields
+        )
+
+    def serialize(self, rows):
+        fields = self._bind()
+        data = []
+        for row in rows:
+            item = {}
+            for name, lookup, convert in fields:
+                value = row[lookup]
+                if value is not None and convert is not None:
+                    value = convert(value)
+                item[name] = value
+            data.append(item)
+        return data
+
+    def to_representation(self, row):
+        return self.serialize([row])[0]
+
+
+fast_post_serializer = ValuesSerializer(PostSerializer)
+fast_comment_serializer = ValuesSerializer(CommentSerializer)
+fast_notification_serializer = ValuesSerializer(NotificationSerializer)
+fast_message_serializer = ValuesSerializer(MessageSerializer)
@@ -1,3 +1,1426 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from PIL import Image
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connection, connections, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase, APITransactionTestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .authentication import cached_principal, principal_cache
+from .caching import current_version, get_backend, invalidate
+from .checks import check_comment_depth
+from .comments import create_comment, delete_comment, thread_queryset
+from .compression import choose_encoding
+from .conversations import get_or_create_conversation, record_message
+from .graph import Adjacency, FollowGraph, get_graph, record_follow, reset_graph
+from .hashtags import (
+    MAX_LENGTH as MAX_HASHTAG_LENGTH, extract_hashtags, normalize as normalize_hashtag, sync_post_hashtags,
+)
+from .models import (
+    Comment, Conversation, ConversationMember, Follow, Like, MediaAsset, Message, Notification, NotificationEvent, Post,
+    Profile, Repost, TimelineEntry, TrendingScore,
+)
+from .notifications import enqueue, process_batch
+from .pagination import KeysetPagination
+from .performance import reset_stats, stats as performance_stats
+from .realtime import Hub
+from .renderers import ORJSONRenderer
+from .routers import PIN_COOKIE, PIN_SALT, health
+from .serializers import (
+    CommentSerializer, MediaAssetSerializer, MessageSerializer, NotificationSerializer, PostSerializer, ValuesSerializer,
+    fast_comment_serializer, fast_message_serializer, fast_notification_serializer, fast_post_serializer,
+)
+from .timeline import fan_out_post, trim_timeline
+from .trending import recompute_window
+from .views import RepostViewSet, bump_profile_counters
+
+
+class QueryBudgetTests(APITestCase):
+    """
+    Every list and detail endpoint must run a fixed number of queries, however many
+    rows it returns. Each test measures an endpoint, adds more data, and measures it
+    again; both runs must match the budget.
+    """
+
+    def setUp(self):
+        cache.clear()
+        get_backend().clear()
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'password')
+        self.client.force_authenticate(self.user)
+        self.authors = []
+
+    def add_activity(self, count):
+        # Posts by fresh authors the reader follows, each with a like, comment and repost
+        for _ in range(count):
+            author = User.objects.create(username=f'author{len(self.authors)}')
+            self.authors.append(author)
+            Follow.objects.create(follower=self.user, following=author)
+            post = Post.objects.create(author=author, content=f'post #tag by {author.username}')
+            sync_post_hashtags([post])
+            fan_out_post(post)
+            Like.objects.create(user=author, post=post)
+            Like.objects.create(user=self.user, post=post)
+            Comment.objects.create(post=post, author=author, content='comment')
+            Repost.objects.create(user=author, original_post=post)
+            Repost.objects.create(user=self.user, original_post=post)
+            conversation = get_or_create_conversation(author.id, self.user.id)
+            record_message(Message.objects.create(sender=author, recipient=self.user, conversation=conversation,
+                                                  content='hello'))
+            Notification.objects.create(recipient=self.user, message='ping')
+        # Rank the activity just written, which is newer than the settle lag
+        recompute_window('24h', now=timezone.now() + settings.TRENDING_SETTLE_LAG, full=True)
+
+    def assertQueryBudget(self, url, budget):
+        # Measured with a cold response cache
+        self.add_activity(2)
+        get_backend().clear()
+        with CaptureQueriesContext(connection) as small:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.data)
+
+        self.add_activity(8)
+        get_backend().clear()
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.data)
+
+        self.assertEqual(len(small), budget, [q['sql'] for q in small.captured_queries])
+        self.assertEqual(len(large), budget, [q['sql'] for q in large.captured_queries])
+
+    def first_post_url(self):
+        self.add_activity(1)
+        return f'/posts/{Post.objects.order_by("id").first().id}/'
+
+    def test_post_list(self):
+        self.assertQueryBudget('/posts/', 1)
+
+    def test_post_detail(self):
+        self.assertQueryBudget(self.first_post_url(), 1)
+
+    def test_cached_post_detail(self):
+        url = self.first_post_url()
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_post_search(self):
+        self.assertQueryBudget('/posts/search/?q=post', 1)
+
+    def test_feed(self):
+        # The high-fan-out author set is cached, so only the timeline page and the comment previews are queried
+        self.assertQueryBudget('/feed/', 2)
+
+    def test_feed_by_popularity(self):
+        self.assertQueryBudget('/feed/?sort_by=popularity', 2)
+
+    def test_comment_list(self):
+        self.assertQueryBudget('/comments/', 1)
+
+    def test_post_comments(self):
+        # post lookup + page
+        self.assertQueryBudget(f'{self.first_post_url()}comments/?threaded=1', 2)
+
+    def test_follow_list(self):
+        # page number pagination: count + page
+        self.assertQueryBudget('/follows/', 2)
+
+    def test_like_list(self):
+        self.assertQueryBudget('/likes/', 2)
+
+    def test_repost_list(self):
+        self.assertQueryBudget('/reposts/', 2)
+
+    def test_message_list(self):
+        self.assertQueryBudget('/messages/', 1)
+
+    def test_inbox(self):
+        # memberships + prefetched participants
+        self.assertQueryBudget('/conversations/', 2)
+
+    def test_conversation_messages(self):
+        # membership check + page
+        self.add_activity(1)
+        conversation_id = self.user.conversation_memberships.first().conversation_id
+        self.assertQueryBudget(f'/conversations/{conversation_id}/messages/', 2)
+
+    def test_notification_list(self):
+        self.assertQueryBudget('/notifications/', 1)
+
+    def test_user_detail(self):
+        self.assertQueryBudget(f'/users/{self.user.id}/', 1)
+
+    def test_user_list(self):
+        self.user.is_superuser = True
+        self.user.save()
+        self.assertQueryBudget('/users/', 2)
+
+    def test_hashtag_list(self):
+        self.assertQueryBudget('/hashtags/?prefix=ta', 1)
+
+    def test_hashtag_posts(self):
+        # hashtag lookup + page
+        self.assertQueryBudget('/hashtags/tag/posts/', 2)
+
+    def test_trending(self):
+        # ranking + posts
+        self.assertQueryBudget('/trending/', 2)
+
+
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        get_backend().clear()
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'password')
+        self.client.force_authenticate(self.user)
+        posts = [Post.objects.create(author=self.user, content=f'coffee post {i}') for i in range(5)]
+        # Ties on created_at are broken by id
+        Post.objects.filter(pk__in=[post.pk for post in posts[1:4]]).update(created_at=posts[1].created_at)
+        self.ids = [post.pk for post in posts][::-1]
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            data = self.client.get(url).data
+            pages.append([post['id'] for post in data['results']])
+            url = data[link]
+        return pages
+
+    def test_next_and_previous_round_trip(self):
+        pages = self.walk('/posts/?page_size=2', 'next')
+        self.assertEqual(pages, [self.ids[0:2], self.ids[2:4], self.ids[4:5]])
+
+        last = self.client.get('/posts/?page_size=2').data
+        while last['next']:
+            last = self.client.get(last['next']).data
+        self.assertEqual(self.walk(last['previous'], 'previous'), [self.ids[2:4], self.ids[0:2]])
+
+    def test_invalid_cursors(self):
+        pagination = KeysetPagination()
+        for position in (['not a date', 1], [None, 1], ['2024-01-01T00:00:00Z'], ['2024-01-01T00:00:00Z', 'x']):
+            cursor = pagination.make_cursor(position)
+            self.assertEqual(self.client.get('/posts/', {'cursor': cursor}).status_code, 404, position)
+        self.assertEqual(self.client.get('/posts/', {'cursor': 'garbage!'}).status_code, 404)
+
+        # Annotation positions (the search rank) are converted by the annotation's field
+        search = self.walk('/posts/search/?q=coffee&page_size=2', 'next')
+        self.assertEqual(sorted(sum(search, [])), sorted(self.ids))
+        cursor = pagination.make_cursor(['x', 13])
+        self.assertEqual(self.client.get('/posts/search/', {'q': 'coffee', 'cursor': cursor}).status_code, 404)
+
+
+class ValuesSerializerTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='reader')
+        self.other = User.objects.create(username='other')
+        asset = MediaAsset.objects.create(sha256='0' * 64, uploaded_by=self.user, original='a.png',
+                                          content_type='image/png', size=1, width=1, height=1,
+                                          variants={'feed': {'url': '/media/a.png', 'width': 1}})
+        self.post = Post.objects.create(author=self.user, content='with media', media='https://example.com/a.png',
+                                        media_asset=asset)
+        Post.objects.create(author=self.other, content='plain')  # null media and media_asset
+        top = Comment.objects.create(post=self.post, author=self.other, content='top')
+        Comment.objects.create(post=self.post, author=self.user, content='reply', parent=top)
+        Notification.objects.create(recipient=self.user, message='ping')
+        Notification.objects.create(recipient=self.user, message='read', is_read=True)
+        conversation = get_or_create_conversation(self.user.id, self.other.id)
+        Message.objects.create(sender=self.user, recipient=self.other, conversation=conversation, content='hi')
+
+    def test_same_output_as_model_serializers(self):
+        for fast, serializer_class, queryset in [
+            (fast_post_serializer, PostSerializer, Post.objects.select_related('author', 'media_asset')),
+            (fast_comment_serializer, CommentSerializer, Comment.objects.select_related('author')),
+            (fast_notification_serializer, NotificationSerializer, Notification.objects.all()),
+            (fast_message_serializer, MessageSerializer, Message.objects.select_related('sender')),
+        ]:
+            queryset = queryset.order_by('id')
+            expected = serializer_class(queryset, many=True).data
+            data = fast.serialize(fast.values(queryset))
+            self.assertEqual(data, expected, serializer_class.__name__)
+            self.assertEqual(JSONRenderer().render(data), JSONRenderer().render(expected), serializer_class.__name__)
+
+    def test_unsupported_fields_are_rejected(self):
+        class MethodSerializer(PostSerializer):
+            summary = serializers.SerializerMethodField()
+
+            class Meta(PostSerializer.Meta):
+                fields = PostSerializer.Meta.fields + ['summary']
+
+        class NestedSerializer(PostSerializer):
+            media_asset = MediaAssetSerializer(read_only=True)
+
+        class SlugSerializer(PostSerializer):
+            media_asset = serializers.SlugRelatedField(slug_field='sha256', read_only=True)
+
+        for serializer_class in (MethodSerializer, NestedSerializer, SlugSerializer):
+            with self.assertRaises(TypeError):
+                ValuesSerializer(serializer_class)
+
+
+class NotificationPipelineTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('author', 'author@example.com', 'password')
+        self.post = Post.objects.create(author=self.user, content='hello')
+
+    def like_as(self, username):
+        fan = User.objects.create(username=username)
+        self.client.force_authenticate(fan)
+        self.assertEqual(self.client.post('/likes/', {'post': self.post.id}).status_code, 201)
+
+    def test_events_are_coalesced(self):
+        self.like_as('fan0')
+        process_batch()
+        for i in range(1, 4):
+            self.like_as(f'fan{i}')
+        self.assertEqual(Notification.objects.count(), 1)
+        self.assertEqual(process_batch(), 3)
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.message, 'fan3 and 3 others liked your post')
+        self.assertFalse(NotificationEvent.objects.exists())
+
+    def test_returning_actors_are_counted_once(self):
+        self.like_as('fan0')
+        process_batch()
+        self.like_as('fan1')
+        process_batch()
+        fan0 = User.objects.get(username='fan0')
+        self.client.force_authenticate(fan0)
+        self.assertEqual(self.client.delete(f'/likes/{self.post.id}/').status_code, 200)
+        self.assertEqual(self.client.post('/likes/', {'post': self.post.id}).status_code, 201)
+        process_batch()
+        self.assertEqual(Notification.objects.get().message, 'fan0 and 1 others liked your post')
+
+    def test_unread_count_and_mark_all_read(self):
+        self.like_as('fan')
+        process_batch()
+        self.client.force_authenticate(self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/notifications/unread_count/').data, {'unread_count': 1})
+
+        self.assertEqual(self.client.post('/notifications/mark_all_read/').data, {'marked_read': 1})
+        self.assertEqual(self.client.get('/notifications/unread_count/').data, {'unread_count': 0})
+
+    def test_unread_counter_follows_every_write(self):
+        fan = User.objects.create(username='fan')
+        for i in range(3):
+            post = Post.objects.create(author=self.user, content=f'post {i}')
+            enqueue(self.user.id, fan.id, NotificationEvent.LIKE, post.id)
+        process_batch()
+        self.client.force_authenticate(self.user)
+
+        def unread():
+            return self.client.get('/notifications/unread_count/').data['unread_count']
+
+        self.assertEqual(unread(), 3)
+        first, second, _ = Notification.objects.order_by('id').values_list('id', flat=True)
+        for is_read, expected in ((True, 2), (True, 2), (False, 3), (True, 2)):
+            self.assertEqual(self.client.patch(f'/notifications/{first}/', {'is_read': is_read}).status_code, 200)
+            self.assertEqual(unread(), expected)
+        self.assertEqual(self.client.delete(f'/notifications/{first}/').status_code, 204)
+        self.assertEqual(self.client.delete(f'/notifications/{second}/').status_code, 204)
+        self.assertEqual(unread(), 1)
+        self.assertEqual(self.client.post('/notifications/mark_all_read/').data, {'marked_read': 1})
+        self.assertEqual(unread(), 0)
+
+        Profile.objects.filter(user=self.user).update(unread_notification_count=7)  # drift
+        call_command('reconcile_profile_counters', stdout=StringIO())
+        self.assertEqual(unread(), 0)
+
+    def test_unread_count_sees_other_processes_writes(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/notifications/unread_count/').data, {'unread_count': 0})
+        # The worker is another process, with a cache of its own
+        self.like_as('fan')
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                                   'LOCATION': 'worker'}}):
+            process_batch()
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/notifications/unread_count/').data, {'unread_count': 1})
+
+
+class ConversationTests(APITestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'password')
+        self.bob = User.objects.create_user('bob', 'bob@example.com', 'password')
+
+    def send(self, sender, recipient, content):
+        self.client.force_authenticate(sender)
+        response = self.client.post('/messages/', {'recipient': recipient.id, 'content': content})
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data
+
+    def test_messages_are_threaded(self):
+        first = self.send(self.alice, self.bob, 'hi')
+        second = self.send(self.bob, self.alice, 'hello')
+        self.send(self.alice, self.bob, 'how are you?')
+        self.assertEqual(first['conversation'], second['conversation'])
+
+        self.client.force_authenticate(self.bob)
+        inbox = self.client.get('/conversations/').data['results']
+        self.assertEqual(len(inbox), 1)
+        self.assertEqual(inbox[0]['last_message']['content'], 'how are you?')
+        self.assertEqual(inbox[0]['unread_count'], 2)
+        self.assertEqual(sorted(inbox[0]['participants']), ['alice', 'bob'])
+
+        thread = self.client.get(f"/conversations/{inbox[0]['id']}/messages/").data['results']
+        self.assertEqual([message['content'] for message in thread], ['how are you?', 'hello', 'hi'])
+
+        self.assertEqual(self.client.post(f"/conversations/{inbox[0]['id']}/read/").data, {'marked_read': 2})
+        self.assertEqual(self.client.get('/conversations/').data['results'][0]['unread_count'], 0)
+
+    def test_inbox_pages_through_threads_without_messages(self):
+        carol = User.objects.create(username='carol')
+        get_or_create_conversation(self.alice.id, carol.id)  # started, no message yet
+        self.send(self.alice, self.bob, 'hi')
+        get_or_create_conversation(self.alice.id, self.alice.id)
+
+        seen, url = [], '/conversations/?page_size=1'
+        while url:
+            page = self.client.get(url)
+            self.assertEqual(page.status_code, 200, page.data)
+            seen += [sorted(conversation['participants']) for conversation in page.data['results']]
+            url = page.data['next']
+        self.assertEqual(seen, [['alice'], ['alice', 'bob'], ['alice', 'carol']])
+
+    def test_other_threads_are_hidden(self):
+        self.send(self.alice, self.bob, 'hi')
+        conversation_id = Message.objects.get().conversation_id
+        self.client.force_authenticate(User.objects.create(username='carol'))
+        self.assertEqual(self.client.get(f'/conversations/{conversation_id}/messages/').status_code, 404)
+        self.assertEqual(self.client.get('/messages/').data['results'], [])
+
+
+class RealtimeTests(APITestCase):
+    def test_hub_delivers_to_channel_subscribers(self):
+        hub = Hub()
+
+        async def scenario():
+            queue = hub.subscribe('user:1')
+            other = hub.subscribe('user:2')
+            # Published from another thread, as sync views do
+            await asyncio.to_thread(hub.dispatch, 'user:1', {'type': 'message', 'data': {'id': 1}})
+            message = await asyncio.wait_for(queue.get(), 1)
+            hub.unsubscribe('user:1', queue)
+            return message, other.empty(), hub.connection_count()
+
+        self.assertEqual(async_to_sync(scenario)(), ({'type': 'message', 'data': {'id': 1}}, True, 1))
+
+    def test_stream_requires_a_valid_token(self):
+        self.assertEqual(async_to_sync(self.async_client.get)('/stream/').status_code, 401)
+        self.assertEqual(async_to_sync(self.async_client.get)('/stream/?token=invalid').status_code, 401)
+
+    def test_stream_is_refused_under_wsgi(self):
+        user = User.objects.create_user('reader', 'reader@example.com', 'password')
+        self.assertEqual(self.client.get(f'/stream/?token={AccessToken.for_user(user)}').status_code, 501)
+
+    @override_settings(REALTIME={**settings.REALTIME, 'BROKER': 'mingx_media_app.realtime.LocalBroker'})
+    def test_worker_refuses_a_process_local_broker(self):
+        with self.assertRaisesMessage(CommandError, 'LocalBroker'):
+            call_command('process_notifications', once=True, stdout=StringIO())
+        out = StringIO()
+        call_command('process_notifications', once=True, without_stream=True, stdout=out)
+        self.assertIn('Processed 0 notification events', out.getvalue())
+
+
+class AsyncViewTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        get_backend().clear()
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'password')
+        Profile.objects.get_or_create(user=self.user)
+        author = User.objects.create(username='author')
+        Follow.objects.create(follower=self.user, following=author)
+        for i in range(3):
+            fan_out_post(Post.objects.create(author=author, content=f'post {i}'))
+        Notification.objects.create(recipient=self.user, message='ping')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_same_output_as_sync_views(self):
+        post_id = Post.objects.first().id
+        for sync_url, async_url in [
+            ('/feed/?page_size=2', '/async/feed/?page_size=2'),
+            (f'/posts/{post_id}/', f'/async/posts/{post_id}/'),
+            (f'/users/{self.user.id}/', f'/async/users/{self.user.id}/'),
+            ('/notifications/', '/async/notifications/'),
+        ]:
+            sync_response, async_response = self.client.get(sync_url), self.client.get(async_url)
+            self.assertEqual(async_response.status_code, 200, async_url)
+            expected = sync_response.json()
+            if 'next' in expected and expected['next']:
+                expected['next'] = expected['next'].replace(sync_url.split('?')[0], async_url.split('?')[0])
+            self.assertEqual(async_response.json(), expected, async_url)
+
+    def test_requires_authentication(self):
+        self.client.credentials()
+        self.assertEqual(self.client.get('/async/feed/').status_code, 401)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer invalid')
+        self.assertEqual(self.client.get('/async/notifications/').status_code, 401)
+
+
+class BatchEndpointTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        get_backend().clear()
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'password')
+        self.author = User.objects.create(username='author')
+        self.posts = [Post.objects.create(author=self.author, content=f'post {i}') for i in range(3)]
+        self.client.force_authenticate(self.user)
+
+    def test_multi_get(self):
+        ids = [self.posts[2].id, 999, self.posts[0].id]
+        with self.assertNumQueries(1):
+            response = self.client.get(f"/posts/batch/?ids={','.join(map(str, ids))}")
+        self.assertEqual([post['id'] for post in response.data['results']], [self.posts[2].id, self.posts[0].id])
+        self.assertEqual(response.data['not_found'], [999])
+
+    @override_settings(BATCH_MAX_ITEMS=2)
+    def test_size_limit(self):
+        response = self.client.get('/posts/batch/?ids=1,2,3')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/likes/batch/', {'like': [1], 'unlike': [2, 3]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_like_and_unlike(self):
+        Like.objects.create(user=self.user, post=self.posts[1])
+        Post.objects.filter(pk=self.posts[1].pk).update(like_count=1)
+        response = self.client.post('/likes/batch/', {'like': [self.posts[0].id, self.posts[1].id, 999],
+                                                      'unlike': [self.posts[1].id, self.posts[2].id]}, format='json')
+        self.assertEqual([result['status'] for result in response.data['results']],
+                         ['liked', 'already_liked', 'not_found', 'unliked', 'not_liked'])
+        self.assertEqual(list(Post.objects.order_by('id').values_list('like_count', flat=True)), [1, 0, 0])
+        self.assertEqual(list(Like.objects.values_list('post_id', flat=True)), [self.posts[0].id])
+        self.assertEqual(NotificationEvent.objects.get().recipient, self.author)
+
+    def test_bulk_follow_import(self):
+        User.objects.create(username='other')
+        Follow.objects.create(follower=self.user, following=self.author)
+        response = self.client.post('/follows/import/', {'usernames': ['author', 'other', 'ghost', 'reader']},
+                                    format='json')
+        self.assertEqual([result['status'] for result in response.data['results']],
+                         ['already_following', 'followed', 'not_found', 'self'])
+        self.assertEqual(sorted(self.user.following.values_list('following__username', flat=True)), ['author', 'other'])
+
+
+    def test_double_submits_keep_counters_exact(self):
+        for _ in range(2):
+            self.client.post('/follows/import/', {'usernames': ['author']}, format='json')
+            self.client.post('/likes/batch/', {'like': [self.posts[0].id]}, format='json')
+        self.client.post('/likes/', {'post': self.posts[0].id})
+        self.assertEqual(Profile.objects.get(user=self.author).follower_count, 1)
+        self.assertEqual(Profile.objects.get(user=self.user).following_count, 1)
+        self.assertEqual(Post.objects.get(pk=self.posts[0].pk).like_count, 1)
+
+        for _ in range(2):
+            self.client.post('/likes/batch/', {'unlike': [self.posts[0].id]}, format='json')
+        self.client.delete(f'/likes/{self.posts[0].id}/')
+        self.assertEqual(Post.objects.get(pk=self.posts[0].pk).like_count, 0)
+
+class FollowGraphTests(APITestCase):
+    def setUp(self):
+        reset_graph()
+        self.addCleanup(reset_graph)
+        self.users = {name: User.objects.create(username=name) for name in ['me', 'ann', 'bob', 'cat', 'dan']}
+        for follower, following in [('me', 'ann'), ('me', 'bob'), ('ann', 'cat'), ('bob', 'cat'),
+                                    ('bob', 'dan'), ('ann', 'me'), ('bob', 'ann')]:
+            Follow.objects.create(follower=self.users[follower], following=self.users[following])
+        self.client.force_authenticate(self.users['me'])
+
+    def test_adjacency(self):
+        adjacency = Adjacency([(1, 2), (1, 3), (1, 3), (4, 1)])
+        self.assertEqual(list(adjacency.neighbors(1)), [2, 3])
+        self.assertEqual(list(adjacency.neighbors(2)), [])
+        self.assertTrue(adjacency.contains(4, 1))
+        self.assertFalse(adjacency.contains(4, 2))
+
+    def test_mutuals_and_suggestions(self):
+        response = self.client.get(f"/users/{self.users['ann'].id}/mutuals/")
+        self.assertEqual(response.data, {'count': 1, 'results': [{'id': self.users['bob'].id, 'username': 'bob'}]})
+        response = self.client.get('/suggestions/')
+        self.assertEqual([(user['username'], user['mutual_count']) for user in response.data['results']],
+                         [('cat', 2), ('dan', 1)])
+
+    def test_follow_signals_update_loaded_graph(self):
+        graph = get_graph()
+        self.assertFalse(graph.is_following(self.users['me'].id, self.users['cat'].id))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/follows/', {'following': 'cat'})
+        self.assertTrue(graph.is_following(self.users['me'].id, self.users['cat'].id))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete('/follows/cat/')
+        self.assertFalse(graph.is_following(self.users['me'].id, self.users['cat'].id))
+        self.assertIs(get_graph(), graph)
+
+    def test_stale_graph_is_rebuilt_in_the_background(self):
+        graph = get_graph()
+        loading, release = threading.Event(), threading.Event()
+
+        def slow_load():
+            loading.set()
+            release.wait(5)
+            return FollowGraph(Adjacency([(1, 2)]), Adjacency([(2, 1)]))
+
+        self.addCleanup(setattr, FollowGraph, 'load', FollowGraph.__dict__['load'])
+        FollowGraph.load = slow_load
+        with override_settings(GRAPH_RELOAD_INTERVAL=-1):
+            self.assertIs(get_graph(), graph)  # served while the rebuild runs
+            self.assertTrue(loading.wait(5))
+            self.assertIs(get_graph(), graph)  # no second rebuild
+            record_follow(3, 1)  # committed after the table was read
+            release.set()
+            for thread in threading.enumerate():
+                if thread.name == 'graph-reload':
+                    thread.join(5)
+        rebuilt = get_graph()
+        self.assertIsNot(rebuilt, graph)
+        self.assertTrue(rebuilt.is_following(1, 2))
+        self.assertEqual(list(rebuilt.follower_ids(1)), [3])
+
+
+class EngagementTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        get_backend().clear()
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'password')
+        self.other = User.objects.create_user('other', 'other@example.com', 'password')
+        self.post = Post.objects.create(author=self.other, content='hello')
+        self.client.force_authenticate(self.user)
+
+    def counters(self):
+        return Post.objects.filter(pk=self.post.pk).values_list('like_count', 'repost_count').get()
+
+    def test_like_and_repost_counters(self):
+        self.assertEqual(self.client.post('/likes/', {'post': self.post.id}).status_code, 201)
+        self.assertEqual(self.client.post('/likes/', {'post': self.post.id}).status_code, 400)
+        self.assertEqual(self.client.post('/reposts/', {'post_id': self.post.id}).status_code, 201)
+        self.assertEqual(self.counters(), (1, 1))
+
+        self.assertEqual(self.client.delete(f'/likes/{self.post.id}/').status_code, 200)
+        repost_id = Repost.objects.get().id
+        self.assertEqual(self.client.delete(f'/reposts/{repost_id}/').status_code, 204)
+        self.assertEqual(self.counters(), (0, 0))
+
+    def test_repeated_repost_delete_decrements_once(self):
+        self.assertEqual(self.client.post('/reposts/', {'post_id': self.post.id}).status_code, 201)
+        repost = Repost.objects.get()
+        stale = Repost.objects.get()
+        RepostViewSet().perform_destroy(repost)
+        RepostViewSet().perform_destroy(stale)  # a second DELETE that loaded the row before the first committed
+        self.assertEqual(self.counters(), (0, 0))
+
+    def test_reconcile_repairs_post_counters_and_cached_responses(self):
+        url = f'/posts/{self.post.id}/'
+        Like.objects.create(user=self.user, post=self.post)
+        self.assertEqual(self.client.get(url).data['like_count'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('reconcile_post_counters', stdout=StringIO())
+        self.assertEqual(self.counters(), (1, 0))
+        self.assertEqual(self.client.get(url).data['like_count'], 1)
+
+    def test_bad_post_ids(self):
+        for data in ({}, {'post_id': 'x'}):
+            self.assertEqual(self.client.post('/reposts/', data).status_code, 400)
+        self.assertEqual(self.client.post('/reposts/', {'post_id': self.post.id + 100}).status_code, 404)
+        self.assertEqual(self.client.post('/likes/', {'post': self.post.id + 100}).status_code, 404)
+
+    def test_other_users_likes_and_reposts_are_out_of_reach(self):
+        other_post = Post.objects.create(author=self.other, content='other')
+        like = Like.objects.create(user=self.other, post=self.post)
+        repost = Repost.objects.create(user=self.other, original_post=self.post)
+        Post.objects.filter(pk=self.post.pk).update(like_count=1, repost_count=1)
+
+        self.assertEqual(self.client.delete(f'/reposts/{repost.id}/').status_code, 404)
+        self.assertEqual(self.client.get(f'/likes/{like.id}/').status_code, 404)
+        self.assertEqual(self.client.put(f'/likes/{like.id}/', {'post': other_post.id}).status_code, 405)
+        self.assertEqual(self.client.patch(f'/reposts/{repost.id}/', {'original_post': other_post.id}).status_code,
+                         405)
+        self.assertEqual(self.client.get('/likes/').data['count'], 0)
+        self.assertEqual(self.client.get('/reposts/').data['count'], 0)
+        self.assertEqual((Like.objects.get().post_id, Repost.objects.get().original_post_id),
+                         (self.post.id, self.post.id))
+        self.assertEqual(self.counters(), (1, 1))
+
+
+class ProfileCounterTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        get_backend().clear()
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'password')
+        self.author = User.objects.create(username='author')
+        self.client.force_authenticate(self.user)
+
+    def counters(self, user):
+        return Profile.objects.filter(user=user).values_list('follower_count', 'following_count', 'post_count').get()
+
+    def test_counters_follow_writes(self):
+        self.client.post('/follows/', {'following': 'author'})
+        self.client.post('/posts/', {'content': 'hello'})
+        self.assertEqual(self.counters(self.user), (0, 1, 1))
+        self.assertEqual(self.counters(self.author), (1, 0, 0))
+        self.assertEqual(self.client.get(f'/users/{self.user.id}/').data['profile']['following_count'], 1)
+
+        self.client.delete('/follows/author/')
+        self.client.delete(f'/posts/{Post.objects.get().id}/')
+        self.assertEqual(self.counters(self.user), (0, 0, 0))
+        self.assertEqual(self.counters(self.author), (0, 0, 0))
+
+    def test_cached_profile_is_expired_when_the_counters_commit(self):
+        url = f'/users/{self.user.id}/'
+        self.assertEqual(self.client.get(url).data['profile']['follower_count'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                bump_profile_counters([self.user.id], follower_count=1)
+                version = current_version('user', self.user.id)
+        self.assertGreater(current_version('user', self.user.id), version)
+        self.assertEqual(self.client.get(url).data['profile']['follower_count'], 1)
+
+    def test_reconcile_repairs_drift(self):
+        Follow.objects.create(follower=self.user, following=self.author)
+        Post.objects.create(author=self.author, content='hello')
+        out = StringIO()
+        call_command('reconcile_profile_counters', dry_run=True, stdout=out)
+        self.assertIn('Checked 2 profiles, 2 drifted', out.getvalue())
+        self.assertEqual(self.counters(self.author), (0, 0, 0))
+        call_command('reconcile_profile_counters', chunk_size=1, stdout=StringIO())
+        self.assertEqual(self.counters(self.author), (1, 0, 1))
+        self.assertEqual(self.counters(self.user), (0, 1, 0))
+
+
+class AuthenticationTests(APITestCase):
+    def setUp(self):
+        principal_cache().clear()
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'password')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def user_queries(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return sum('FROM "auth_user"' in query['sql'] for query in queries.captured_queries)
+
+    def test_cached_principal_skips_user_query(self):
+        self.assertEqual(self.user_queries('/notifications/'), 1)
+        self.assertEqual(self.user_queries('/notifications/'), 0)
+        self.assertEqual(self.user_queries('/async/notifications/'), 0)
+        self.assertIsNot(cached_principal(self.user.id), cached_principal(self.user.id))
+
+    def test_deactivation_evicts_principal(self):
+        self.client.get('/notifications/')
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(cached_principal(self.user.id))
+        self.assertEqual(self.client.get('/notifications/').status_code, 401)
+        self.assertEqual(self.client.get('/async/notifications/').status_code, 401)
+
+    @override_settings(AUTH_PRINCIPAL_CACHE={'TIMEOUT': 0})
+    def test_zero_timeout_disables_cache(self):
+        self.client.get('/notifications/')
+        self.assertEqual(self.user_queries('/notifications/'), 1)
+
+
+class BenchmarkCommandTests(APITestCase):
+    def test_generate_data_and_benchmark_api(self):
+        call_command('generate_data', users=20, posts_per_user=3, stdout=StringIO())
+        self.assertEqual(User.objects.filter(username__startswith='user').count(), 20)
+        post = Post.objects.order_by('-like_count').first()
+        self.assertEqual(post.like_count, Like.objects.filter(post=post).count())
+        self.assertTrue(TimelineEntry.objects.exists())
+
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = os.path.join(directory, 'baseline.json')
+            call_command('benchmark_api', requests=2, warmup=0, endpoint=['post-'], save=baseline, stdout=StringIO())
+            out = StringIO()
+            call_command('benchmark_api', requests=2, warmup=0, endpoint=['post-'], compare=baseline, stdout=out)
+        self.assertIn('post-list POST', out.getvalue())
+        self.assertIn('queries vs base', out.getvalue())
+        self.assertEqual(Post.objects.filter(content__startswith='Benchmark post').count(), 0)
+
+    def test_generate_data_keeps_timestamps_without_disabling_auto_now_add(self):
+        started = timezone.now()
+        call_command('generate_data', users=10, posts_per_user=3, days=30, stdout=StringIO())
+        self.assertTrue(Post.objects.filter(created_at__lt=started - timedelta(days=1)).exists())
+        self.assertTrue(Post._meta.get_field('created_at').auto_now_add)
+        self.assertFalse(Conversation.objects.filter(last_message__isnull=True).exists())
+        author = User.objects.create_user('writer', 'writer@example.com', 'password')
+        self.assertGreaterEqual(Post.objects.create(author=author, content='Fresh').created_at, started)
+
+    def test_benchmark_connections_restores_settings(self):
+        settings_dict = dict(connection.settings_dict)
+        out = StringIO()
+        call_command('benchmark_connections', requests=3, stdout=out)
+        self.assertIn('persistent + health checks', out.getvalue())
+        self.assertIn('Connection overhead per request', out.getvalue())
+        self.assertEqual(connection.settings_dict, settings_dict)
+
+
+class PerformanceMiddlewareTests(APITestCase):
+    def setUp(self):
+        reset_stats()
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'password')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def server_timing(self, response):
+        return dict(part.split(';', 1)[0:2] for part in response['Server-Timing'].split(', '))
+
+    def test_server_timing_and_histograms(self):
+        Post.objects.create(author=self.user, content='hello')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/posts/')
+        timing = self.server_timing(response)
+        self.assertEqual(set(timing), {'db', 'auth', 'view', 'render', 'total'})
+        self.assertIn(f'desc="{len(queries)} queries"', timing['db'])
+        self.assertIn('db;', self.client.get('/async/notifications/')['Server-Timing'])
+
+        self.user.is_staff = True
+        self.user.save()
+        data = self.client.get('/stats/performance/').data
+        self.assertEqual(data['endpoints']['GET post-list']['count'], 1)
+        self.assertEqual(sum(data['endpoints']['GET post-list']['histogram_ms'].values()), 1)
+        self.assertIn('GET async_notifications', data['endpoints'])
+
+    @override_settings(PERFORMANCE={'SLOW_REQUEST_MS': 0, 'SLOW_QUERY_LIMIT': 2})
+    def test_slow_requests_log_their_sql(self):
+        with self.assertLogs('mingx_media_app.performance', 'WARNING') as logs:
+            self.client.get('/notifications/')
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual(entry['endpoint'], 'GET notification-list')
+        self.assertLessEqual(len(entry['sql']), 2)
+        self.assertIn('SELECT', entry['sql'][0]['sql'])
+        self.assertEqual(performance_stats()['slow_requests'][0]['path'], '/notifications/')
+
+    def test_sampled_profiles_are_dumped(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(PERFORMANCE={'PROFILE_SAMPLE_RATE': 1.0, 'PROFILE_DIR': directory}):
+                self.client.get('/notifications/')
+            [name] = os.listdir(directory)
+        self.assertTrue(name.endswith('.prof'))
+        self.assertIn('notification-list', name)
+
+
+class IndexUsageTests(APITestCase):
+    # EXPLAIN each hot query and check the plan reads the index meant for it
+
+    def assertUsesIndex(self, queryset, *names):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                # Test tables are tiny, so the planner would rather scan them
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = queryset.explain()
+        self.assertTrue(any(name in plan for name in names), f"None of {names} in the plan:\n{plan}")
+
+    def test_hot_queries_use_indexes(self):
+        user_id = 1
+        self.assertUsesIndex(Post.objects.filter(author_id=user_id).order_by('-created_at', '-id'),
+                             'post_author_created_idx')
+        self.assertUsesIndex(Notification.objects.filter(recipient_id=user_id).order_by('-created_at', '-id'),
+                             'notification_recipient_idx')
+        self.assertUsesIndex(Notification.objects.filter(recipient_id=user_id, is_read=False),
+                             'notification_unread_idx')
+        self.assertUsesIndex(TimelineEntry.objects.filter(user_id=user_id).order_by('-created_at', '-post_id'),
+                             'timeline_user_created_post_idx')
+        self.assertUsesIndex(ConversationMember.objects.filter(user_id=user_id).order_by('-last_message_at', '-id'),
+                             'member_inbox_idx')
+        self.assertUsesIndex(Message.objects.filter(conversation_id=1).order_by('-created_at', '-id'),
+                             'message_conversation_idx')
+        self.assertUsesIndex(TrendingScore.objects.filter(window='24h').order_by('-score'), 'trending_window_score_idx')
+        self.assertUsesIndex(Profile.objects.filter(follower_count__gt=100), 'profile_follower_count_idx')
+
+    def test_thread_is_a_range_on_the_path_index(self):
+        queryset = thread_queryset(Comment(post_id=1, path='1'.zfill(Comment.PATH_WIDTH))).order_by('path')
+        self.assertUsesIndex(queryset, 'comment_post_path_idx')
+        plan = queryset.explain()
+        # SQLite: (post_id=? AND path>? AND path<?); PostgreSQL: Index Cond on (path)::text >= and <
+        self.assertTrue('path>?' in plan or '(path)::text >=' in plan, plan)
+
+    def test_unique_lookups_use_constraint_indexes(self):
+        # SQLite names the index of a table-level UNIQUE constraint sqlite_autoindex_<table>_N
+        self.assertUsesIndex(Like.objects.filter(user_id=1, post_id=2),
+                             'unique_like', 'sqlite_autoindex_mingx_media_app_like')
+        self.assertUsesIndex(Repost.objects.filter(user_id=1, original_post_id=2),
+                             'unique_repost', 'sqlite_autoindex_mingx_media_app_repost')
+        self.assertUsesIndex(Follow.objects.filter(follower_id=1, following_id=2),
+                             'unique_followers', 'sqlite_autoindex_mingx_media_app_follow')
+
+    def test_duplicate_like_and_repost_are_rejected(self):
+        user = User.objects.create(username='reader')
+        post = Post.objects.create(author=user, content='hello')
+        Like.objects.create(user=user, post=post)
+        Repost.objects.create(user=user, original_post=post)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Like.objects.create(user=user, post=post)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Repost.objects.create(user=user, original_post=post)
+
+
+class RenderingTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'password')
+        self.client.force_authenticate(self.user)
+
+    def test_orjson_renderer_matches_drf(self):
+        Post.objects.create(author=self.user, content='caf\u00e9 \u2028 \U0001F600 </script>')
+        data = self.client.get('/posts/').data
+        data['extra'] = {'amount': Decimal('1.50'), 'at': datetime(2024, 1, 2, 3, 4, 5, 678, tzinfo=dt_timezone.utc),
+                         'day': date(2024, 1, 2), 1: ('a', None)}
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(ORJSONRenderer().render(data, 'application/json; indent=2'),
+                         JSONRenderer().render(data, 'application/json; indent=2'))
+
+        response = self.client.post('/posts/', '{"content": "parsed"', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/posts/', '{"content": "parsed \u00e9"}', content_type='application/json')
+        self.assertEqual(response.data['content'], 'parsed \u00e9')
+
+    def test_compression_is_negotiated_above_the_threshold(self):
+        response = self.client.get('/posts/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))  # under MIN_SIZE
+
+        Post.objects.bulk_create(Post(author=self.user, content=f'post number {n} ' * 10) for n in range(10))
+        plain = self.client.get('/posts/')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', plain['Vary'])
+        response = self.client.get('/posts/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertLess(int(response['Content-Length']), len(plain.content))
+
+        self.assertEqual(choose_encoding('gzip;q=0.5, br', ('br', 'gzip')), 'br')
+        self.assertEqual(choose_encoding('br;q=0.1, gzip', ('br', 'gzip')), 'gzip')
+        self.assertEqual(choose_encoding('*', ('br', 'gzip')), 'br')
+        self.assertIsNone(choose_encoding('gzip;q=0, identity', ('gzip',)))
+
+
+@override_settings(TIMELINE_FANOUT_WORKERS=0)
+class ReplicaRoutingTests(APITransactionTestCase):
+    # A second SQLite file stands in for the replica; rows written only to it show where reads went
+
+    def setUp(self):
+        cache.clear()
+        get_backend().clear()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.add_database('replica', os.path.join(self.directory, 'replica.sqlite3'))
+        call_command('migrate', database='replica', verbosity=0)
+
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'password')
+        Post.objects.create(author=self.user, content='on the primary')
+        User.objects.using('replica').bulk_create([User(id=self.user.id, username='reader', password=self.user.password)])
+        Post.objects.using('replica').bulk_create([Post(author_id=self.user.id, content='on the replica')])
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def add_database(self, alias, name):
+        connections.settings[alias] = connections.configure_settings({
+            DEFAULT_DB_ALIAS: dict(connections.settings[DEFAULT_DB_ALIAS]),
+            alias: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': name},
+        })[alias]
+        self.addCleanup(self.remove_database, alias)
+
+    def remove_database(self, alias):
+        connections[alias].close()
+        del connections[alias]
+        del connections.settings[alias]
+
+    def contents(self):
+        return [post['content'] for post in self.client.get('/posts/').data['results']]
+
+    @override_settings(DATABASE_REPLICAS={'ALIASES': ['replica'], 'STICKY_SECONDS': 60})
+    def test_reads_use_replica_until_the_user_writes(self):
+        self.assertEqual(self.contents(), ['on the replica'])
+        # Outside requests (commands, workers) reads stay on the primary
+        self.assertEqual(Post.objects.get().content, 'on the primary')
+
+        self.assertEqual(self.client.post('/posts/', {'content': 'just written'}).status_code, 201)
+        self.assertEqual(self.contents(), ['just written', 'on the primary'])
+
+        cache.clear()  # the pin does not live in Django's local cache
+        self.assertEqual(self.contents(), ['just written', 'on the primary'])
+        del self.client.cookies[PIN_COOKIE]  # a client that keeps no cookies
+        self.assertEqual(self.contents(), ['just written', 'on the primary'])
+        get_backend().clear()  # the pin expires
+        self.assertEqual(self.contents(), ['on the replica'])
+
+    @override_settings(DATABASE_REPLICAS={'ALIASES': ['replica'], 'STICKY_SECONDS': 60})
+    def test_pin_falls_back_to_the_cookie(self):
+        self.assertEqual(self.client.post('/posts/', {'content': 'just written'}).status_code, 201)
+        get_backend().clear()  # a per-process backend on another worker
+        self.assertEqual(self.contents(), ['just written', 'on the primary'])
+        del self.client.cookies[PIN_COOKIE]
+        self.assertEqual(self.contents(), ['on the replica'])
+
+    @override_settings(DATABASE_REPLICAS={'ALIASES': ['replica'], 'STICKY_SECONDS': 60})
+    def test_pin_cookie_is_signed_and_per_user(self):
+        self.assertEqual(self.client.post('/posts/', {'content': 'just written'}).status_code, 201)
+        cookie = self.client.cookies[PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], 60)
+        self.assertTrue(cookie['httponly'])
+
+        self.assertEqual(self.contents(), ['just written', 'on the primary'])
+
+        get_backend().clear()  # only the cookie is left
+        self.client.cookies[PIN_COOKIE] = str(self.user.id)  # unsigned
+        self.assertEqual(self.contents(), ['on the replica'])
+        self.client.cookies[PIN_COOKIE] = signing.get_cookie_signer(salt=PIN_COOKIE + PIN_SALT).sign(
+            str(self.user.id + 1))  # another user's pin
+        self.assertEqual(self.contents(), ['on the replica'])
+
+    @override_settings(DATABASE_REPLICAS={'ALIASES': ['broken', 'replica'], 'HEALTH_CHECK_INTERVAL': 60})
+    def test_unhealthy_replica_is_skipped(self):
+        self.add_database('broken', os.path.join(self.directory, 'missing', 'db.sqlite3'))
+        with self.assertLogs('mingx_media_app.routers', 'WARNING'):
+            self.assertEqual(self.contents(), ['on the replica'])
+        self.assertEqual(health.healthy(['broken', 'replica']), ['replica'])
+
+        with override_settings(DATABASE_REPLICAS={'ALIASES': ['broken']}), \
+                self.assertLogs('mingx_media_app.routers', 'WARNING'):
+            self.assertEqual(self.contents(), ['on the primary'])
+
+
+class MediaUploadTests(APITestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        media = override_settings(MEDIA_ROOT=directory, MEDIA_PROCESSING={
+            'WORKERS': 0, 'MAX_UPLOAD_BYTES': 100_000, 'VARIANTS': {
+                'thumbnail': {'size': 150, 'crop': True}, 'feed': {'size': 640}, 'full': {'size': 1600},
+            },
+        })
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = User.objects.create_user('uploader', 'uploader@example.com', 'password')
+        self.client.force_authenticate(self.user)
+
+    def image(self):
+        buffer = BytesIO()
+        Image.new('RGBA', (800, 600), (200, 30, 30, 128)).save(buffer, 'PNG')
+        return SimpleUploadedFile('photo.png', buffer.getvalue(), content_type='image/png')
+
+    def upload(self, file):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/uploads/', {'file': file}, format='multipart')
+
+    def test_upload_is_deduplicated_and_resized(self):
+        response = self.upload(self.image())
+        self.assertEqual(response.status_code, 201)
+        asset = MediaAsset.objects.get(pk=response.data['id'])
+        self.assertEqual(asset.status, MediaAsset.READY)
+        self.assertEqual({name: (variant['width'], variant['height']) for name, variant in asset.variants.items()},
+                         {'thumbnail': (150, 150), 'feed': (640, 480), 'full': (800, 600)})  # never upscaled
+        self.assertTrue(asset.variants['feed']['url'].startswith('/media/assets/'))
+
+        again = self.upload(self.image())
+        self.assertEqual((again.status_code, again.data['id']), (200, asset.id))
+        self.assertEqual(MediaAsset.objects.count(), 1)
+
+        self.assertEqual(self.upload(SimpleUploadedFile('notes.png', b'not an image')).status_code, 400)
+        self.assertEqual(self.upload(SimpleUploadedFile('huge.png', b'0' * 200_000)).status_code, 413)
+
+    def test_variants_in_post_and_profile_representations(self):
+        asset_id = self.upload(self.image()).data['id']
+        response = self.client.post('/posts/', {'content': 'with a photo', 'media_asset': asset_id}, format='json')
+        self.assertEqual(response.data['media_variants']['thumbnail']['width'], 150)
+        self.client.post('/posts/', {'content': 'text only'}, format='json')
+
+        listed = {post['content']: post for post in self.client.get('/posts/').data['results']}
+        self.assertEqual(listed['with a photo']['media_variants'], response.data['media_variants'])
+        self.assertIsNone(listed['text only']['media_variants'])
+
+        Profile.objects.filter(user=self.user).update(profile_picture_asset=asset_id)
+        profile = self.client.get(f'/users/{self.user.id}/').data['profile']
+        self.assertEqual(profile['profile_picture_variants']['feed']['height'], 480)
+
+    def test_only_uploaders_attach_an_asset_and_it_outlives_them(self):
+        asset_id = self.upload(self.image()).data['id']
+        other = User.objects.create_user('other', 'other@example.com', 'password')
+        self.client.force_authenticate(other)
+        response = self.client.post('/posts/', {'content': 'borrowed', 'media_asset': asset_id}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.patch(f'/users/{other.id}/', {'profile': {'profile_picture_asset': asset_id}},
+                                     format='json')
+        self.assertEqual(response.status_code, 400)
+
+        self.assertEqual(self.upload(self.image()).data['id'], asset_id)  # the same content, deduplicated
+        response = self.client.post('/posts/', {'content': 'mine too', 'media_asset': asset_id}, format='json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.patch(f'/users/{other.id}/', {'profile': {'profile_picture_asset': asset_id}},
+                                     format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+
+        self.user.delete()  # the first uploader leaves
+        self.assertEqual(Post.objects.get(content='mine too').media_asset_id, asset_id)
+        self.assertEqual(Profile.objects.get(user=other).profile_picture_asset_id, asset_id)
+
+
+class CommentThreadTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        get_backend().clear()
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'password')
+        self.author = User.objects.create(username='author')
+        Follow.objects.create(follower=self.user, following=self.author)
+        self.post = Post.objects.create(author=self.author, content='post')
+        fan_out_post(self.post)
+        self.client.force_authenticate(self.user)
+
+    def comment(self, content, parent=None, post=None):
+        url = f'/posts/{(post or self.post).id}/comments/'
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {'content': content, 'parent': parent}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+
+    def test_threaded_order_and_counters(self):
+        first = self.comment('first')
+        second = self.comment('second')
+        reply = self.comment('reply', parent=first)
+        self.comment('nested', parent=reply)
+        self.assertEqual(Comment.objects.get(pk=reply).depth, 1)
+
+        url = f'/posts/{self.post.id}/comments/'
+        threaded = [comment['content'] for comment in self.client.get(url, {'threaded': 1}).data['results']]
+        self.assertEqual(threaded, ['first', 'reply', 'nested', 'second'])
+        flat = [comment['content'] for comment in self.client.get(url).data['results']]
+        self.assertEqual(flat, ['first', 'second', 'reply', 'nested'])
+        thread = self.client.get(f'/comments/{first}/thread/').data['results']
+        self.assertEqual([comment['depth'] for comment in thread], [0, 1, 2])
+
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.comment_count, Comment.objects.get(pk=first).reply_count), (4, 1))
+        self.assertEqual(self.client.delete(f'/comments/{first}/').status_code, 204)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+        self.assertEqual(list(Comment.objects.values_list('id', flat=True)), [second])
+        self.assertEqual(self.client.get(f'/posts/{self.post.id + 100}/comments/').status_code, 404)
+
+    def test_only_the_author_edits_or_deletes_a_comment(self):
+        first = self.comment('first')
+        self.comment('reply', parent=first)
+        self.client.force_authenticate(self.author)
+        self.assertEqual(self.client.patch(f'/comments/{first}/', {'content': 'edited'}).status_code, 403)
+        self.assertEqual(self.client.delete(f'/comments/{first}/').status_code, 403)
+        self.assertEqual(Comment.objects.count(), 2)
+
+    def test_delete_counts_the_rows_removed(self):
+        first = self.comment('first')
+        stale = Comment.objects.get(pk=first)
+        delete_comment(Comment.objects.get(pk=first))
+        delete_comment(stale)  # a second DELETE that loaded the comment before the first committed
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 0)
+
+        parent = self.comment('parent')
+        reply = CommentSerializer(data={'post': self.post.id, 'parent': parent, 'content': 'late'})
+        self.assertTrue(reply.is_valid(), reply.errors)
+        delete_comment(Comment.objects.get(pk=parent))
+        with self.assertRaises(serializers.ValidationError):
+            create_comment(reply, self.user)  # validated before the delete, saved after it
+
+    def test_reply_validation(self):
+        other = Post.objects.create(author=self.author, content='other')
+        elsewhere = self.comment('elsewhere', post=other)
+        response = self.client.post(f'/posts/{self.post.id}/comments/', {'content': 'x', 'parent': elsewhere},
+                                    format='json')
+        self.assertEqual(response.status_code, 400)
+
+        parent = None
+        with override_settings(COMMENT_MAX_DEPTH=2):
+            for depth in range(3):
+                parent = self.comment(f'depth {depth}', parent=parent)
+            response = self.client.post(f'/posts/{self.post.id}/comments/', {'content': 'x', 'parent': parent},
+                                        format='json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_max_depth_must_fit_the_path(self):
+        self.assertEqual(check_comment_depth(None), [])
+        with override_settings(COMMENT_MAX_DEPTH=255 // Comment.PATH_WIDTH - 1):
+            self.assertEqual(check_comment_depth(None), [])
+        with override_settings(COMMENT_MAX_DEPTH=255 // Comment.PATH_WIDTH):
+            self.assertEqual([error.id for error in check_comment_depth(None)], ['mingx_media_app.E001'])
+
+    def test_feed_previews(self):
+        for i in range(4):
+            self.comment(f'comment {i}')
+        self.comment('reply', parent=Comment.objects.order_by('id').first().id)
+        with override_settings(FEED_COMMENT_PREVIEWS=3):
+            feed = self.client.get('/feed/').json()
+            self.assertEqual([comment['content'] for comment in feed['results'][0]['comment_preview']],
+                             ['comment 3', 'comment 2', 'comment 1'])
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+            self.assertEqual(self.client.get('/async/feed/').json(), feed)
+
+
+@override_settings(TIMELINE_FANOUT_WORKERS=0)
+class TimelineTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        get_backend().clear()
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'password')
+        self.authors = [User.objects.create_user(f'author{i}', f'author{i}@example.com', 'password') for i in range(2)]
+        self.client.force_authenticate(self.user)
+
+    def follow(self, author):
+        self.assertEqual(self.client.post('/follows/', {'following': author.username}, format='json').status_code, 200)
+
+    def publish(self, author, count):
+        self.client.force_authenticate(author)
+        with self.captureOnCommitCallbacks(execute=True):
+            ids = [self.client.post('/posts/', {'content': f'{author.username} {i}'}, format='json').data['id']
+                   for i in range(count)]
+        self.client.force_authenticate(self.user)
+        return ids
+
+    def feed_ids(self, page_size=2):
+        ids, url = [], f'/feed/?page_size={page_size}'
+        while url:
+            data = self.client.get(url).data
+            ids += [post['id'] for post in data['results']]
+            url = data['next']
+        return ids
+
+    def test_fan_out_backfill_and_unfollow(self):
+        earlier = self.publish(self.authors[0], 2)
+        self.follow(self.authors[0])
+        self.follow(self.authors[1])
+        later = self.publish(self.authors[1], 2) + self.publish(self.authors[0], 1)
+        self.assertEqual(TimelineEntry.objects.filter(user=self.user).count(), 5)
+        self.assertEqual(self.feed_ids(), (earlier + later)[::-1])
+
+        self.assertEqual(self.client.delete(f'/follows/{self.authors[1].username}/').status_code, 200)
+        self.assertEqual(self.feed_ids(), (earlier + later[2:])[::-1])
+
+    def test_high_fan_out_authors_are_merged_at_read_time(self):
+        self.follow(self.authors[0])
+        self.follow(self.authors[1])
+        with override_settings(TIMELINE_FANOUT_MAX_FOLLOWERS=0):
+            Profile.objects.filter(user=self.authors[0]).update(follower_count=0)
+            cache.clear()
+            pushed = self.publish(self.authors[0], 2)
+            pulled = self.publish(self.authors[1], 3)
+            pushed += self.publish(self.authors[0], 1)
+            self.assertFalse(TimelineEntry.objects.filter(post_id__in=pulled).exists())
+            self.assertEqual(self.feed_ids(), sorted(pushed + pulled, reverse=True))
+
+    def test_fan_out_trims_timelines(self):
+        self.follow(self.authors[0])
+        with override_settings(TIMELINE_MAX_LENGTH=3, TIMELINE_TRIM_SAMPLE_RATE=1.0):
+            ids = self.publish(self.authors[0], 5)
+        self.assertEqual(sorted(TimelineEntry.objects.filter(user=self.user).values_list('post_id', flat=True)),
+                         ids[2:])
+
+    def test_trim_keeps_entries_tied_with_the_last_kept(self):
+        self.follow(self.authors[0])
+        ids = self.publish(self.authors[0], 5)
+        TimelineEntry.objects.filter(user=self.user).update(created_at=timezone.now())
+        with override_settings(TIMELINE_MAX_LENGTH=3):
+            trim_timeline(self.user.id)
+        self.assertEqual(sorted(TimelineEntry.objects.filter(user=self.user).values_list('post_id', flat=True)),
+                         ids[2:])
+
+    def test_fan_out_waits_for_the_commit(self):
+        self.follow(self.authors[0])
+        self.client.force_authenticate(self.authors[0])
+        with self.captureOnCommitCallbacks() as callbacks:
+            post_id = self.client.post('/posts/', {'content': 'hello'}, format='json').data['id']
+        self.assertFalse(TimelineEntry.objects.filter(post_id=post_id).exists())
+        for callback in callbacks:
+            callback()
+        self.assertTrue(TimelineEntry.objects.filter(user=self.user, post_id=post_id).exists())
+
+
+class TrendingTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='reader')
+        self.posts = [Post.objects.create(author=self.user, content=f'post {i}') for i in range(3)]
+        self.start = timezone.now()
+
+    def engage(self, model, post, minutes):
+        if model is Comment:
+            instance = Comment.objects.create(author=self.user, post=post, content='comment')
+        elif model is Like:
+            instance = Like.objects.create(user=self.user, post=post)
+        else:
+            instance = Repost.objects.create(user=self.user, original_post=post)
+        model.objects.filter(pk=instance.pk).update(created_at=self.start + timedelta(minutes=minutes))
+        instance.refresh_from_db()
+        return instance
+
+    def scores(self):
+        return dict(TrendingScore.objects.filter(window='1h').values_list('post_id', 'score'))
+
+    def test_incremental_runs_match_a_full_recompute(self):
+        early = self.engage(Like, self.posts[0], -50)
+        self.engage(Comment, self.posts[1], -30)
+        self.engage(Repost, self.posts[2], -5)
+        deleted = self.engage(Comment, self.posts[2], -20)
+        recompute_window('1h', now=self.start)
+
+        # Stamped before the run but committed after it
+        self.engage(Like, self.posts[1], -0.5)
+        with self.captureOnCommitCallbacks(execute=True):
+            deleted.delete()
+        recompute_window('1h', now=self.start + timedelta(minutes=10))
+        self.engage(Like, self.posts[2], 12)
+        with self.captureOnCommitCallbacks(execute=True):
+            early.delete()
+        # The -30 comment slides out of the window
+        end = self.start + timedelta(minutes=40)
+        recompute_window('1h', now=end)
+
+        incremental = self.scores()
+        recompute_window('1h', now=end, full=True)
+        full = self.scores()
+        self.assertEqual(incremental.keys(), full.keys())
+        self.assertEqual(set(full), {self.posts[1].id, self.posts[2].id})
+        for post_id, score in full.items():
+            self.assertAlmostEqual(incremental[post_id], score, places=9)
+
+
+class SearchTests(APITestCase):
+    def setUp(self):
+        get_backend().clear()
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'password')
+        author = User.objects.create(username='author')
+        Follow.objects.create(follower=self.user, following=author)
+        self.posts = {}
+        for content in ('coffee and a morning walk', 'coffee coffee coffee', 'tea time', 'a new coffee release'):
+            self.posts[content] = Post.objects.create(author=author, content=content)
+            fan_out_post(self.posts[content])
+        self.client.force_authenticate(self.user)
+
+    def search(self, query, **params):
+        return [post['content'] for post in self.client.get('/posts/search/', {'q': query, **params}).data['results']]
+
+    def test_matching_and_ranking(self):
+        found = self.search('coffee')
+        self.assertEqual(found[0], 'coffee coffee coffee')
+        self.assertEqual(sorted(found), sorted(content for content in self.posts if 'coffee' in content))
+        self.assertEqual(self.search('morning coffee'), ['coffee and a morning walk'])
+        self.assertEqual(sorted(self.search('coffee" (')), sorted(found))  # stray syntax is not an error
+
+        post = self.posts['tea time']
+        post.content = 'tea and coffee'
+        post.save()
+        self.assertIn('tea and coffee', self.search('coffee'))
+        self.assertEqual(self.search('time'), [])
+        post.delete()
+        self.assertNotIn('tea and coffee', self.search('coffee'))
+
+    def test_cursor_pages(self):
+        pages, url = [], '/posts/search/?q=coffee&page_size=2'
+        while url:
+            data = self.client.get(url).data
+            pages.append([post['content'] for post in data['results']])
+            url = data['next']
+        self.assertEqual([len(page) for page in pages], [2, 1])
+        self.assertEqual(sum(pages, []), self.search('coffee', page_size=10))
+
+    def test_feed_keyword_filter(self):
+        feed = self.client.get('/feed/', {'keyword': 'coffee', 'page_size': 2}).data
+        second = self.client.get(feed['next']).data
+        found = [post['content'] for post in feed['results'] + second['results']]
+        self.assertEqual(found, [content for content in reversed(self.posts) if 'coffee' in content])
+
+
+class HashtagTests(APITestCase):
+    def setUp(self):
+        get_backend().clear()
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'password')
+        self.client.force_authenticate(self.user)
+
+    def tags(self, post):
+        return sorted(post.hashtags.values_list('name', flat=True))
+
+    def test_extraction_and_normalisation(self):
+        too_long = 'x' * (MAX_HASHTAG_LENGTH + 1)
+        self.assertEqual(extract_hashtags(f'#Python and #python, #Django_5! a#b ##twice #{too_long} #'),
+                         ['python', 'django_5'])
+        self.assertEqual(normalize_hashtag('#Travel'), 'travel')
+
+    def test_sync_links_and_unlinks(self):
+        post = Post.objects.create(author=self.user, content='#Coffee #morning')
+        self.assertEqual(sync_post_hashtags([post]), {'coffee', 'morning'})
+        self.assertEqual(self.tags(post), ['coffee', 'morning'])
+
+        post.content = 'just #coffee #News'
+        self.assertEqual(sync_post_hashtags([post]), {'morning', 'news'})
+        self.assertEqual(self.tags(post), ['coffee', 'news'])
+        self.assertEqual(sync_post_hashtags([post]), set())
+
+    def test_backfill_command(self):
+        posts = [Post.objects.create(author=self.user, content=f'#tag{i % 2} post') for i in range(5)]
+        call_command('backfill_hashtags', chunk_size=2, stdout=StringIO())
+        self.assertEqual([self.tags(post) for post in posts], [['tag0'], ['tag1'], ['tag0'], ['tag1'], ['tag0']])
+        response = self.client.get('/hashtags/tag0/posts/')
+        self.assertEqual([post['id'] for post in response.data['results']], [posts[4].id, posts[2].id, posts[0].id])
+
+    def test_hashtags_are_read_only(self):
+        sync_post_hashtags([Post.objects.create(author=self.user, content='#python')])
+        self.assertEqual(self.client.patch('/hashtags/python/', {'name': 'hacked'}).status_code, 405)
+        self.assertEqual(self.client.delete('/hashtags/python/').status_code, 405)
+        self.assertEqual(self.client.post('/hashtags/', {'name': 'new'}).status_code, 405)
+        self.assertEqual(self.client.get('/hashtags/python/').data['name'], 'python')
+
+
+class ResponseCacheTests(APITestCase):
+    def setUp(self):
+        get_backend().clear()
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'password', is_staff=True)
+        self.post = Post.objects.create(author=self.user, content='hello')
+        self.url = f'/posts/{self.post.id}/'
+        self.client.force_authenticate(self.user)
+
+    def write(self, method, url, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return getattr(self.client, method)(url, data, format='json')
+
+    def test_writes_invalidate_the_cached_post(self):
+        self.client.get(self.url)
+        self.write('post', '/likes/', {'post': self.post.id})
+        self.assertEqual(self.client.get(self.url).data['like_count'], 1)
+        self.write('post', f'/posts/{self.post.id}/comments/', {'content': 'nice'})
+        self.assertEqual(self.client.get(self.url).data['comment_count'], 1)
+        self.write('patch', self.url, {'content': 'edited'})
+        self.assertEqual(self.client.get(self.url).data['content'], 'edited')
+
+    def test_version_is_bumped_on_commit(self):
+        version = current_version('post', self.post.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                Post.objects.filter(pk=self.post.pk).update(like_count=5)
+                invalidate('post', self.post.id)
+                self.assertEqual(current_version('post', self.post.id), version)
+        self.assertGreater(current_version('post', self.post.id), version)
+
+    def test_conditional_get_and_stats(self):
+        first = self.client.get(self.url)
+        etag = first['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Last-Modified has whole-second precision, so it is never used to answer 304
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified']).status_code, 200)
+
+        self.write('patch', self.url, {'content': 'edited'})
+        changed = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((changed.status_code, changed.data['content']), (200, 'edited'))
+        self.assertNotEqual(changed['ETag'], etag)
+
+        stats = self.client.get('/stats/cache/').data
+        self.assertEqual((stats['misses'], stats['hits'], stats['not_modified']), (2, 2, 1))
+        self.assertEqual(stats['hit_ratio'], 0.5)
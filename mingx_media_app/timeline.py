@@ -0,0 +1,181 @@
+import logging
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import OuterRef, Q, Subquery
+
+from .models import Follow, Post, Profile, TimelineEntry
+
+logger = logging.getLogger(__name__)
+
+PULL_AUTHORS_CACHE_KEY = 'timeline:pull_authors'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def pull_author_ids():
+    # Authors with more followers than the fan-out limit are not pushed into
+    # timelines; their posts are merged in when the feed is read instead.
+    def compute():
+        # Read from the denormalized follower counter (indexed) instead of grouping Follow
+        limit = _setting('TIMELINE_FANOUT_MAX_FOLLOWERS', 10000)
+        return frozenset(Profile.objects.filter(follower_count__gt=limit).values_list('user_id', flat=True))
+    return cache.get_or_set(PULL_AUTHORS_CACHE_KEY, compute, _setting('TIMELINE_PULL_AUTHORS_TTL', 300))
+
+
+def _entries(user_id, posts):
+    return [TimelineEntry(user_id=user_id, post_id=post_id, created_at=created_at) for post_id, created_at in posts]
+
+
+def _recent_posts(author_ids):
+    limit = _setting('TIMELINE_MAX_LENGTH', 800)
+    return Post.objects.filter(author_id__in=author_ids).order_by('-created_at').values_list('id', 'created_at')[:limit]
+
+
+def fan_out_post(post):
+    # Push a freshly written post into the timeline of every follower
+    if post.author_id in pull_author_ids():
+        return 0
+    batch_size = _setting('TIMELINE_FANOUT_BATCH_SIZE', 1000)
+    follower_ids = Follow.objects.filter(following_id=post.author_id).values_list('follower_id', flat=True)
+    created = 0
+    batch = []
+    for follower_id in follower_ids.iterator(chunk_size=batch_size):
+        batch.append(TimelineEntry(user_id=follower_id, post_id=post.id, created_at=post.created_at))
+        if len(batch) >= batch_size:
+            created += _push(batch)
+            batch = []
+    if batch:
+        created += _push(batch)
+    return created
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = None
+
+
+def executor():
+    # Created on first use, i.e. in each worker process after gunicorn forks
+    global _executor, _pending
+    with _executor_lock:
+        if _executor is None:
+            workers = _setting('TIMELINE_FANOUT_WORKERS', 2)
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='fanout')
+            _pending = threading.BoundedSemaphore(_setting('TIMELINE_FANOUT_MAX_PENDING', 1000))
+        return _executor
+
+
+def _fan_out_in_background(post):
+    try:
+        fan_out_post(post)
+    except Exception:
+        logger.exception("Fanning out post %s failed", post.id)
+    finally:
+        connections.close_all()  # the pool thread's own
+
+
+def submit_fan_out(post):
+    """
+    Queue a committed post for fan-out, so the request that created it does not wait for
+    one row per follower. With TIMELINE_FANOUT_WORKERS = 0 it is fanned out inline (tests
+    and development), as it is when TIMELINE_FANOUT_MAX_PENDING posts are already queued.
+    """
+    if not _setting('TIMELINE_FANOUT_WORKERS', 2):
+        fan_out_post(post)
+        return None
+    pool = executor()
+    if not _pending.acquire(blocking=False):
+        logger.warning("Timeline fan-out queue is full, post %s fanned out inline", post.id)
+        fan_out_post(post)
+        return None
+    future = pool.submit(_fan_out_in_background, post)
+    future.add_done_callback(lambda _: _pending.release())
+    return future
+
+
+def _push(batch):
+    TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+    # Trimming every timeline on every post would read each one in full, so a sample of the
+    # followers is trimmed instead; a timeline overshoots TIMELINE_MAX_LENGTH by about
+    # 1 / TIMELINE_TRIM_SAMPLE_RATE entries
+    rate = _setting('TIMELINE_TRIM_SAMPLE_RATE', 0.05)
+    trim_timelines([entry.user_id for entry in batch if random.random() < rate])
+    return len(batch)
+
+
+def backfill_follow(follower_id, following_ids):
+    # Copy the recent posts of newly followed authors into the follower's timeline
+    push_ids = [author_id for author_id in following_ids if author_id not in pull_author_ids()]
+    if not push_ids:
+        return
+    TimelineEntry.objects.bulk_create(_entries(follower_id, _recent_posts(push_ids)), ignore_conflicts=True)
+
+
+def prune_follow(follower_id, following_id):
+    TimelineEntry.objects.filter(user_id=follower_id, post__author_id=following_id).delete()
+
+
+def trim_timeline(user_id):
+    trim_timelines([user_id])
+
+
+def trim_timelines(user_ids):
+    # Keep only the newest TIMELINE_MAX_LENGTH entries of each timeline, in one statement.
+    # The cutoff is the first dropped entry's (created_at, post) key, so entries sharing its
+    # timestamp are kept or dropped in the same order the feed pages through them.
+    if not user_ids:
+        return
+    limit = _setting('TIMELINE_MAX_LENGTH', 800)
+    cutoff = (
+        TimelineEntry.objects.filter(user_id=OuterRef('user_id'))
+        .order_by('-created_at', '-post_id')[limit:limit + 1]
+    )
+    cutoff_at = Subquery(cutoff.values('created_at'))
+    TimelineEntry.objects.filter(
+        Q(created_at__lt=cutoff_at) | Q(created_at=cutoff_at, post_id__lte=Subquery(cutoff.values('post_id'))),
+        user_id__in=user_ids,
+    ).delete()
+
+
+def rebuild_timeline(user_id):
+    pull_ids = pull_author_ids()
+    following_ids = [
+        author_id
+        for author_id in Follow.objects.filter(follower_id=user_id).values_list('following_id', flat=True)
+        if author_id not in pull_ids
+    ]
+    TimelineEntry.objects.filter(user_id=user_id).delete()
+    if following_ids:
+        TimelineEntry.objects.bulk_create(_entries(user_id, _recent_posts(following_ids)), ignore_conflicts=True)
+
+
+def timeline_posts(user, bound=None):
+    """
+    Posts pushed into the user's timeline plus posts from followed high-fan-out authors.
+
+    `bound(queryset, columns=None)` narrows a source to one feed page (see
+    KeysetPagination.bound_queryset). With it, the page is sought on the timeline's
+    (user, created_at, post) index, and on the authors' (author, created_at) index for
+    pulled posts, so only that page of posts is read rather than the whole timeline.
+    """
+    entries = TimelineEntry.objects.filter(user=user).values('post_id')
+    if bound is not None:
+        entries = bound(entries, {'id': 'post_id'})
+    pushed = Q(id__in=entries)
+    pull_ids = pull_author_ids()
+    if pull_ids:
+        pulled = list(
+            Follow.objects.filter(follower=user, following_id__in=pull_ids).values_list('following_id', flat=True)
+        )
+        if pulled:
+            if bound is None:
+                return Post.objects.filter(pushed | Q(author_id__in=pulled))
+            return Post.objects.filter(pushed | Q(id__in=bound(Post.objects.filter(author_id__in=pulled).values('id'))))
+    return Post.objects.filter(pushed)
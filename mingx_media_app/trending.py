@@ -0,0 +1,128 @@
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Comment, Like, Repost, TrendingScore, TrendingWindow
+
+# (weight key, model, post foreign key) of every engagement that counts towards trending
+EVENT_SOURCES = (
+    ('like', Like, 'post_id'),
+    ('comment', Comment, 'post_id'),
+    ('repost', Repost, 'original_post_id'),
+)
+
+# Scores that decayed below this are dropped to keep the ranking table compact
+MIN_SCORE = 1e-3
+
+CHUNK_SIZE = 500
+
+
+def window_names():
+    return list(settings.TRENDING_WINDOWS)
+
+
+def _decay_rate(name):
+    half_life = settings.TRENDING_WINDOWS[name]['half_life']
+    return math.log(2) / half_life.total_seconds()
+
+
+def _event_scores(start, end, now, rate):
+    # Sum of weight * exp(-rate * age) per post for events in (start, end]
+    weights = settings.TRENDING_WEIGHTS
+    scores = defaultdict(float)
+    for kind, model, fk in EVENT_SOURCES:
+        weight = weights.get(kind, 0)
+        if not weight:
+            continue
+        events = model.objects.filter(created_at__gt=start, created_at__lte=end).values_list(fk, 'created_at')
+        for post_id, created_at in events.iterator(chunk_size=2000):
+            scores[post_id] += weight * math.exp(-rate * (now - created_at).total_seconds())
+    return scores
+
+
+def _apply(name, deltas):
+    post_ids = list(deltas)
+    for i in range(0, len(post_ids), CHUNK_SIZE):
+        chunk = post_ids[i:i + CHUNK_SIZE]
+        current = dict(TrendingScore.objects.filter(window=name, post_id__in=chunk).values_list('post_id', 'score'))
+        rows = [
+            TrendingScore(window=name, post_id=post_id, score=current.get(post_id, 0.0) + deltas[post_id])
+            for post_id in chunk
+        ]
+        TrendingScore.objects.bulk_create(
+            rows, update_conflicts=True, unique_fields=['window', 'post'], update_fields=['score'],
+        )
+
+
+def recompute_window(name, now=None, full=False):
+    """
+    Bring the scores of one window up to date.
+
+    score(t) = sum(weight * exp(-rate * (t - event_time))) over events in (t - length, t].
+    An incremental run decays the stored scores to t, adds events created since the
+    last run and subtracts events that slid out of the window, so only the events in
+    those two narrow time ranges are read. A full run (or a stale window) rescans it.
+
+    Events are stamped before their transaction commits, so t trails `now` by
+    TRENDING_SETTLE_LAG: an event committed up to that long after its timestamp is still
+    added by the next run rather than skipped (and later subtracted when it expires).
+    """
+    length = settings.TRENDING_WINDOWS[name]['length']
+    rate = _decay_rate(name)
+    now = (now or timezone.now()) - settings.TRENDING_SETTLE_LAG
+
+    with transaction.atomic():
+        state, _ = TrendingWindow.objects.select_for_update().get_or_create(name=name)
+        last = state.computed_at
+
+        if full or last is None or now - last >= length:
+            TrendingScore.objects.filter(window=name).delete()
+            deltas = _event_scores(now - length, now, now, rate)
+        else:
+            decay = math.exp(-rate * (now - last).total_seconds())
+            TrendingScore.objects.filter(window=name).update(score=F('score') * decay)
+            deltas = _event_scores(last, now, now, rate)
+            for post_id, expired in _event_scores(last - length, now - length, now, rate).items():
+                deltas[post_id] -= expired
+
+        _apply(name, deltas)
+        TrendingScore.objects.filter(window=name, score__lt=MIN_SCORE).delete()
+
+        state.computed_at = now
+        state.save(update_fields=['computed_at'])
+    return TrendingScore.objects.filter(window=name).count()
+
+
+def forget_event(instance):
+    """
+    Subtract a deleted like, comment or repost from the windows whose scores include it,
+    so removed engagement does not linger in the rankings until it would have expired.
+    A run racing with the delete can leave that one event off until the next full run.
+    """
+    for kind, model, fk in EVENT_SOURCES:
+        if isinstance(instance, model):
+            break
+    else:
+        return
+    weight = settings.TRENDING_WEIGHTS.get(kind, 0)
+    if not weight:
+        return
+    for name, computed_at in TrendingWindow.objects.filter(computed_at__isnull=False).values_list('name', 'computed_at'):
+        if name not in settings.TRENDING_WINDOWS:
+            continue
+        if computed_at - settings.TRENDING_WINDOWS[name]['length'] < instance.created_at <= computed_at:
+            # Stored scores are decayed to the last run
+            score = weight * math.exp(-_decay_rate(name) * (computed_at - instance.created_at).total_seconds())
+            TrendingScore.objects.filter(window=name, post_id=getattr(instance, fk)).update(score=F('score') - score)
+
+
+def top_post_ids(name, limit):
+    return list(
+        TrendingScore.objects.filter(window=name)
+        .order_by('-score', 'post_id')
+        .values_list('post_id', flat=True)[:limit]
+    )
@@ -1,24 +1,127 @@
+from collections import Counter
+
 from django.shortcuts import render
-from rest_framework import viewsets, permissions, status
+from rest_framework import mixins, viewsets, permissions, status
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
-from .models import Post, Follow, Comment, Like, Notification, Message, Repost, Hashtag  # Ensure all models are imported
-from .serializers import PostSerializer, FollowSerializer, UserSerializer, CommentSerializer, LikeSerializer, NotificationSerializer, MessageSerializer, HashtagSerializer  # Import the missing serializers
+from rest_framework.views import APIView
+from .models import Post, Follow, Comment, Like, Notification, NotificationEvent, Message, Repost, Hashtag, ConversationMember, Profile, MediaAsset, invalidate_post_responses  # Ensure all models are imported
+from .serializers import PostSerializer, FollowSerializer, UserSerializer, CommentSerializer, LikeSerializer, NotificationSerializer, MessageSerializer, HashtagSerializer, RepostSerializer, ConversationSerializer, MediaAssetSerializer  # Import the missing serializers
+from .serializers import fast_comment_serializer, fast_message_serializer, fast_notification_serializer, fast_post_serializer
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.http import Http404
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
 from django.db.models import Q
-from rest_framework.pagination import PageNumberPagination
-from django.db.models import Count
-
-
-class PostViewSet(viewsets.ModelViewSet):
-    queryset = Post.objects.all().order_by('-created_at')
+from django.db import transaction
+from django.db.models import F, Prefetch
+from .conversations import get_or_create_conversation, mark_conversation_read, record_message
+from .caching import cached_response, invalidate, stats as cache_stats
+from .comments import add_comment_previews, create_comment, delete_comment, thread_queryset
+from .pagination import KeysetPagination
+from .performance import stats as performance_stats
+from .realtime import publish
+from .graph import get_graph, record_follow
+from .hashtags import normalize, sync_post_hashtags
+from .media import HashingUploadHandler, InvalidImage, store_upload
+from .notifications import bump_unread, enqueue, enqueue_many, mark_all_read, unread_count
+from .search import search_posts
+from .trending import top_post_ids
+from .timeline import backfill_follow, prune_follow, submit_fan_out, timeline_posts
+
+
+def fast_page(paginator, fast_serializer, queryset, request, ordering, view=None):
+    # Paginate values() rows and serialize them without instantiating DRF serializers
+    rows = fast_serializer.values(queryset, *(field.lstrip('-') for field in ordering))
+    page = paginator.paginate_queryset(rows, request, view=view, ordering=ordering)
+    return paginator.get_paginated_response(fast_serializer.serialize(page))
+
+
+def batch_items(values, name, cast=int):
+    # Validate the list of a batch request: unique items, in order, at most BATCH_MAX_ITEMS.
+    # Returns (items, None) or (None, error response)
+    if isinstance(values, str):
+        values = [value for value in values.split(',') if value]
+    if not isinstance(values, list):
+        return None, Response({"error": f"'{name}' must be a list"}, status=status.HTTP_400_BAD_REQUEST)
+    if len(values) > settings.BATCH_MAX_ITEMS:
+        return None, Response({"error": f"At most {settings.BATCH_MAX_ITEMS} items per request in '{name}'"},
+                              status=status.HTTP_400_BAD_REQUEST)
+    try:
+        items = list(dict.fromkeys(cast(value) for value in values))
+    except (TypeError, ValueError):
+        return None, Response({"error": f"Invalid value in '{name}'"}, status=status.HTTP_400_BAD_REQUEST)
+    return items, None
+
+
+def post_from_request(data, name):
+    # The post whose id is in data[name]. Returns (post, None) or (None, error response)
+    try:
+        return Post.objects.get(id=int(data[name])), None
+    except (KeyError, TypeError, ValueError):
+        return None, Response({"error": f"'{name}' must be a post id"}, status=status.HTTP_400_BAD_REQUEST)
+    except Post.DoesNotExist:
+        return None, Response({"error": "Post not found"}, status=status.HTTP_404_NOT_FOUND)
+
+
+def lock_user_writes(user_id):
+    # Serialize a user's follow, like and repost writes on their profile row: every path takes this
+    # lock first, so the follows/likes it reads stay exact until it commits and no
+    # concurrent request or double submit can insert, delete or count the same row twice
+    list(Profile.objects.select_for_update().filter(user_id=user_id).values_list('pk', flat=True))
+
+
+def bump_profile_counters(user_ids, **deltas):
+    # Atomic F() updates of Profile counters; update() sends no signals, so cached profiles are
+    # expired here. Callers hold a transaction: invalidate() waits for it to commit, so a
+    # concurrent profile read cannot re-cache the old counters under the new version
+    Profile.objects.filter(user_id__in=user_ids).update(**{field: F(field) + delta for field, delta in deltas.items()})
+    for user_id in user_ids:
+        invalidate('user', user_id)
+
+
+class FastListMixin:
+    # Serve list() through a read-only ValuesSerializer; writes and detail views are unchanged
+    fast_serializer = None
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return fast_page(self.paginator, self.fast_serializer, queryset, request,
+                         self.paginator.get_ordering(self), view=self)
+
+
+class PostViewSet(FastListMixin, viewsets.ModelViewSet):
+    queryset = Post.objects.select_related('author', 'media_asset').order_by('-created_at')
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    fast_serializer = fast_post_serializer
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        with transaction.atomic():
+            post = serializer.save(author=self.request.user)
+            bump_profile_counters([post.author_id], post_count=1)
+            transaction.on_commit(lambda: submit_fan_out(post))
+        self.invalidate_hashtags(sync_post_hashtags([post]))
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            bump_profile_counters([instance.author_id], post_count=-1)
+
+    def perform_update(self, serializer):
+        post = serializer.save()
+        self.invalidate_hashtags(sync_post_hashtags([post]))
+
+    def invalidate_hashtags(self, names):
+        for name in names:
+            invalidate('hashtag', name)
+
+    @cached_response('post')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
     def update(self, request, *args, **kwargs):
         post = self.get_object()
@@ -32,9 +135,47 @@ class PostViewSet(viewsets.ModelViewSet):
             return Response({"error": "You can only delete your own posts"}, status=403)
         return super().destroy(request, *args, **kwargs)
 
+    @action(detail=False, methods=['get'])
+    def batch(self, request):
+        # Multi-get: /posts/batch/?ids=1,2,3 answered with one id__in query, in request order
+        ids, error = batch_items(request.query_params.get('ids', ''), 'ids')
+        if error:
+            return error
+        rows = {row['id']: row for row in self.fast_serializer.values(self.get_queryset().filter(id__in=ids))}
+        return Response({
+            "results": self.fast_serializer.serialize([rows[post_id] for post_id in ids if post_id in rows]),
+            "not_found": [post_id for post_id in ids if post_id not in rows],
+        })
+
+    @action(detail=True, methods=['get', 'post'], serializer_class=CommentSerializer)
+    def comments(self, request, pk=None):
+        # GET: the post's comments, oldest first, or depth-first as a tree with ?threaded=true.
+        # POST: comment on the post, or reply with 'parent'
+        post = get_object_or_404(Post.objects.only('id'), pk=pk)
+        if request.method == 'POST':
+            data = request.data.copy()
+            data['post'] = post.pk
+            serializer = CommentSerializer(data=data, context=self.get_serializer_context())
+            serializer.is_valid(raise_exception=True)
+            create_comment(serializer, request.user)
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+        comments = Comment.objects.filter(post=post)
+        ordering = ('path',) if request.query_params.get('threaded') in ('1', 'true') else ('created_at', 'id')
+        return fast_page(self.paginator, fast_comment_serializer, comments, request, ordering, view=self)
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"error": "The 'q' parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
+        # Ranked full-text search; most relevant first
+        posts = search_posts(self.get_queryset(), query)
+        return fast_page(self.paginator, self.fast_serializer, posts, request, ('-search_rank', '-id'), view=self)
+
 
 class FollowViewSet(viewsets.ModelViewSet):
-    queryset = Follow.objects.all()
+    queryset = Follow.objects.select_related('follower', 'following')
     serializer_class = FollowSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -50,12 +191,57 @@ class FollowViewSet(viewsets.ModelViewSet):
             return Response({"error": "You cannot follow yourself"}, status=status.HTTP_400_BAD_REQUEST)
 
         # Create the follow relationship if not already existing
-        follow, created = Follow.objects.get_or_create(follower=request.user, following=following)
+        with transaction.atomic():
+            lock_user_writes(request.user.id)
+            follow, created = Follow.objects.get_or_create(follower=request.user, following=following)
+            if created:
+                bump_profile_counters([request.user.id], following_count=1)
+                bump_profile_counters([following.id], follower_count=1)
         if created:
+            backfill_follow(request.user.id, [following.id])
+            enqueue(following.id, request.user.id, NotificationEvent.FOLLOW)
             return Response(FollowSerializer(follow).data)
         else:
             return Response({"message": "Already following this user"}, status=status.HTTP_200_OK)
 
+    @action(detail=False, methods=['post'], url_path='import')
+    def bulk_import(self, request):
+        # Follow a list of usernames; they are resolved with one query
+        usernames, error = batch_items(request.data.get('usernames'), 'usernames', cast=str)
+        if error:
+            return error
+        user_ids = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+
+        with transaction.atomic():
+            lock_user_writes(request.user.id)
+            following = set(Follow.objects.filter(follower=request.user, following_id__in=user_ids.values())
+                            .values_list('following_id', flat=True))
+
+            results, new_ids = [], []
+            for username in usernames:
+                user_id = user_ids.get(username)
+                if user_id is None:
+                    result = 'not_found'
+                elif user_id == request.user.id:
+                    result = 'self'
+                elif user_id in following:
+                    result = 'already_following'
+                else:
+                    result = 'followed'
+                    new_ids.append(user_id)
+                results.append({"username": username, "status": result})
+
+            Follow.objects.bulk_create([Follow(follower=request.user, following_id=user_id) for user_id in new_ids])
+            if new_ids:
+                bump_profile_counters([request.user.id], following_count=len(new_ids))
+                bump_profile_counters(new_ids, follower_count=1)
+            enqueue_many((user_id, request.user.id, NotificationEvent.FOLLOW, None) for user_id in new_ids)
+            # bulk_create sends no post_save signal for the follow graph
+            transaction.on_commit(lambda: [record_follow(request.user.id, user_id) for user_id in new_ids])
+        if new_ids:
+            backfill_follow(request.user.id, new_ids)
+        return Response({"results": results})
+
     def destroy(self, request, *args, **kwargs):
         try:
             # Ensure the user to be unfollowed exists
@@ -64,20 +250,55 @@ class FollowViewSet(viewsets.ModelViewSet):
             return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
 
         # Remove the follow relationship
-        Follow.objects.filter(follower=request.user, following=following).delete()
+        with transaction.atomic():
+            lock_user_writes(request.user.id)
+            deleted, _ = Follow.objects.filter(follower=request.user, following=following).delete()
+            if deleted:
+                bump_profile_counters([request.user.id], following_count=-deleted)
+                bump_profile_counters([following.id], follower_count=-deleted)
+        prune_follow(request.user.id, following.id)
         return Response({"message": "Unfollowed the user"}, status=status.HTTP_200_OK)
 
 
+def graph_limit(request, default=20, maximum=100):
+    try:
+        return max(0, min(int(request.query_params.get('limit', default)), maximum))
+    except ValueError:
+        return default
+
+
 class UserViewSet(viewsets.ModelViewSet):
-    queryset = User.objects.all()
+    queryset = User.objects.select_related('profile__profile_picture_asset')
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         # Only allow users to see their own information
         if self.request.user.is_superuser:
-            return User.objects.all()
-        return User.objects.filter(id=self.request.user.id)
+            return self.queryset.all()
+        return self.queryset.filter(id=self.request.user.id)
+
+    @cached_response('user')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @action(detail=True, methods=['get'])
+    def mutuals(self, request, pk=None):
+        # Accounts the requesting user follows that also follow this user, from the in-memory graph
+        try:
+            user_id = int(pk)
+        except ValueError:
+            raise Http404
+        mutual_ids = get_graph().mutuals(request.user.id, user_id)
+        shown = mutual_ids[:graph_limit(request)]
+        usernames = dict(User.objects.filter(id__in=shown + [user_id]).values_list('id', 'username'))
+        if user_id not in usernames:
+            raise Http404
+        return Response({
+            "count": len(mutual_ids),
+            "results": [{"id": mutual_id, "username": usernames[mutual_id]} for mutual_id in shown
+                        if mutual_id in usernames],
+        })
 
     def create(self, request, *args, **kwargs):
         # Creating a new user (could use a public endpoint with custom permissions)
@@ -98,40 +319,48 @@ class UserViewSet(viewsets.ModelViewSet):
             return Response({"error": "You can only delete your own profile"}, status=status.HTTP_403_FORBIDDEN)
         return super().destroy(request, *args, **kwargs)
 
+def feed_queryset(user, params):
+    # Feed posts and their ordering; shared by FeedViewSet and the async feed view
+    keyword = params.get('keyword', None)
+    start_date = params.get('start_date', None)
+    end_date = params.get('end_date', None)
+    # Sorting by 'date' or 'popularity'
+    sort_by = params.get('sort_by', 'date')
+    if sort_by == 'popularity':  # Uses the stored like counter instead of joining likes
+        ordering = ('-like_count', '-created_at', '-id')
+    else:
+        ordering = ('-created_at', '-id')
+
+    # Read the materialized timeline instead of scanning every followed author's posts. The
+    # plain date-ordered feed seeks the requested page on the timeline index first; filters
+    # and other orderings drop or reorder rows, so they page over the whole timeline
+    bound = None
+    if sort_by != 'popularity' and not keyword and not (start_date and end_date):
+        paginator = KeysetPagination()
+
+        def bound(queryset, columns=None):
+            return paginator.bound_queryset(queryset, params, ordering, columns)
+    posts = timeline_posts(user, bound).select_related('author')
+
+    # This is Optional: Filter by keyword (full-text search)
+    if keyword:
+        posts = search_posts(posts, keyword)
+
+    # This is Optional: Filter by date range
+    if start_date and end_date:
+        posts = posts.filter(created_at__range=[start_date, end_date])
+
+    return posts, ordering
+
+
 class FeedViewSet(viewsets.ViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def list(self, request):
-        user = request.user
-        # Get all users the current user is following
-        followed_users = Follow.objects.filter(follower=user).values_list('following', flat=True)
-
-        # Filter posts by followed users
-        posts = Post.objects.filter(author__in=followed_users).order_by('-created_at')
-
-        # This is Optional: Filter by keyword (search)
-        keyword = request.query_params.get('keyword', None)
-        if keyword:
-            posts = posts.filter(content__icontains=keyword)
-
-        # This is Optional: Filter by date range
-        start_date = request.query_params.get('start_date', None)
-        end_date = request.query_params.get('end_date', None)
-        if start_date and end_date:
-            posts = posts.filter(created_at__range=[start_date, end_date])
-
-        # Sorting by 'date' or 'popularity'
-        sort_by = request.query_params.get('sort_by', 'date')
-        if sort_by == 'popularity':  # This could be based on the number of likes or comments
-            posts = posts.annotate(like_count=Count('likes')).order_by('-like_count', '-created_at')
-        else:
-            posts = posts.order_by('-created_at')
-
-        paginator = PageNumberPagination()
-        paginated_posts = paginator.paginate_queryset(posts, request)
-
-        serializer = PostSerializer(paginated_posts, many=True)
-        return paginator.get_paginated_response(serializer.data)
+        posts, ordering = feed_queryset(request.user, request.query_params)
+        response = fast_page(KeysetPagination(), fast_post_serializer, posts, request, ordering)
+        add_comment_previews(response.data['results'])
+        return response
 
 
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
@@ -141,91 +370,356 @@ class FeedViewSet(viewsets.ViewSet):
         return Response(serializer.data)
 
 
-class CommentViewSet(viewsets.ModelViewSet):
-    queryset = Comment.objects.all()
+class CommentViewSet(FastListMixin, viewsets.ModelViewSet):
+    queryset = Comment.objects.select_related('author')
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    fast_serializer = fast_comment_serializer
+
+    def filter_queryset(self, queryset):
+        # The list shows one post's comments (?post=) or, by default, the user's own
+        if self.action != 'list':
+            return queryset
+        post_id = self.request.query_params.get('post')
+        if post_id:
+            try:
+                return queryset.filter(post_id=int(post_id))
+            except ValueError:
+                return queryset.none()
+        return queryset.filter(author=self.request.user)
+
+    def update(self, request, *args, **kwargs):
+        comment = self.get_object()
+        if comment.author != request.user:
+            return Response({"error": "You can only update your own comments"}, status=status.HTTP_403_FORBIDDEN)
+        return super().update(request, *args, **kwargs)
+
+    def destroy(self, request, *args, **kwargs):
+        comment = self.get_object()
+        if comment.author != request.user:
+            return Response({"error": "You can only delete your own comments"}, status=status.HTTP_403_FORBIDDEN)
+        return super().destroy(request, *args, **kwargs)
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        create_comment(serializer, self.request.user)
+
+    def perform_destroy(self, instance):
+        delete_comment(instance)
+
+    @action(detail=True, methods=['get'])
+    def thread(self, request, pk=None):
+        # The comment and every reply below it, depth-first, in one ordered query
+        comment = self.get_object()
+        return fast_page(self.paginator, self.fast_serializer, thread_queryset(comment), request, ('path',), view=self)
 
 
-class LikeViewSet(viewsets.ModelViewSet):
-    queryset = Like.objects.all()
+class LikeViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    # Likes are created and removed through create/destroy/batch only, never edited
+    queryset = Like.objects.select_related('user')
     serializer_class = LikeSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_queryset(self):
+        return self.queryset.filter(user=self.request.user)
+
     def create(self, request, *args, **kwargs):
-        post = Post.objects.get(id=request.data['post'])
-        like, created = Like.objects.get_or_create(user=request.user, post=post)
+        post, error = post_from_request(request.data, 'post')
+        if error:
+            return error
+        with transaction.atomic():
+            lock_user_writes(request.user.id)
+            like, created = Like.objects.get_or_create(user=request.user, post=post)
+            if created:
+                Post.objects.filter(pk=post.pk).update(like_count=F('like_count') + 1)
+                enqueue(post.author_id, request.user.id, NotificationEvent.LIKE, post.pk)
         if not created:
             return Response({"message": "Post already liked"}, status=status.HTTP_400_BAD_REQUEST)
         return Response({"message": "Post liked"}, status=status.HTTP_201_CREATED)
 
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        # Like and unlike many posts in one transaction, e.g. when a client syncs offline taps
+        like_ids, error = batch_items(request.data.get('like', []), 'like')
+        if error:
+            return error
+        unlike_ids, error = batch_items(request.data.get('unlike', []), 'unlike')
+        if error:
+            return error
+        if len(like_ids) + len(unlike_ids) > settings.BATCH_MAX_ITEMS:
+            return Response({"error": f"At most {settings.BATCH_MAX_ITEMS} items per request"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        user = request.user
+        authors = dict(Post.objects.filter(id__in=like_ids + unlike_ids).values_list('id', 'author_id'))
+        with transaction.atomic():
+            # Under the lock, to_like rows cannot exist yet and to_unlike rows cannot be gone,
+            # so the counters move by exactly the rows written
+            lock_user_writes(user.id)
+            liked = set(Like.objects.filter(user=user, post_id__in=authors).values_list('post_id', flat=True))
+            to_like = [post_id for post_id in like_ids if post_id in authors and post_id not in liked]
+            to_unlike = [post_id for post_id in unlike_ids if post_id in liked]
+
+            Like.objects.bulk_create([Like(user=user, post_id=post_id) for post_id in to_like])
+            Post.objects.filter(id__in=to_like).update(like_count=F('like_count') + 1)
+            Like.objects.filter(user=user, post_id__in=to_unlike).delete()
+            Post.objects.filter(id__in=to_unlike).update(like_count=F('like_count') - 1)
+            enqueue_many((authors[post_id], user.id, NotificationEvent.LIKE, post_id) for post_id in to_like)
+
+        # bulk_create sends no post_save signal, so cached post responses are expired here
+        for post_id in to_like:
+            invalidate_post_responses(post_id)
+
+        results = []
+        for post_id in like_ids:
+            result = 'not_found' if post_id not in authors else 'already_liked' if post_id in liked else 'liked'
+            results.append({"post": post_id, "action": "like", "status": result})
+        for post_id in unlike_ids:
+            result = 'not_found' if post_id not in authors else 'unliked' if post_id in liked else 'not_liked'
+            results.append({"post": post_id, "action": "unlike", "status": result})
+        return Response({"results": results})
+
     def destroy(self, request, *args, **kwargs):
         like = Like.objects.filter(user=request.user, post_id=kwargs['pk'])
-        if like.exists():
-            like.delete()
+        with transaction.atomic():
+            lock_user_writes(request.user.id)
+            deleted, _ = like.delete()
+            if deleted:
+                Post.objects.filter(pk=kwargs['pk']).update(like_count=F('like_count') - deleted)
+        if deleted:
             return Response({"message": "Like removed"}, status=status.HTTP_200_OK)
         return Response({"message": "Like not found"}, status=status.HTTP_404_NOT_FOUND)
 
 
-class NotificationViewSet(viewsets.ModelViewSet):
+class NotificationViewSet(FastListMixin, viewsets.ModelViewSet):
     queryset = Notification.objects.all()
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    fast_serializer = fast_notification_serializer
 
     def get_queryset(self):
         return self.queryset.filter(recipient=self.request.user)
 
-
-class MessageViewSet(viewsets.ModelViewSet):
+    # Writes keep Profile.unread_notification_count in step with the unread rows; the row is
+    # locked first, so concurrent requests for one notification count it once
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            notification = serializer.save()
+            bump_unread({notification.recipient_id: int(not notification.is_read)})
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            before = Notification.objects.select_for_update().values('recipient_id', 'is_read') \
+                .get(pk=serializer.instance.pk)
+            notification = serializer.save()
+            deltas = Counter({before['recipient_id']: -int(not before['is_read'])})
+            deltas[notification.recipient_id] += int(not notification.is_read)
+            bump_unread(deltas)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            was_read = Notification.objects.select_for_update().filter(pk=instance.pk) \
+                .values_list('is_read', flat=True).first()
+            deleted, _ = instance.delete()
+            if deleted and was_read is False:
+                bump_unread({instance.recipient_id: -1})
+
+    @action(detail=False, methods=['get'])
+    def unread_count(self, request):
+        return Response({"unread_count": unread_count(request.user.id)})
+
+    @action(detail=False, methods=['post'])
+    def mark_all_read(self, request):
+        return Response({"marked_read": mark_all_read(request.user.id)})
+
+
+class MessageViewSet(FastListMixin, viewsets.ModelViewSet):
     queryset = Message.objects.all()
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    fast_serializer = fast_message_serializer
 
     def get_queryset(self):
-        user = self.request.user
-        return Message.objects.filter(Q(sender=user) | Q(recipient=user))
+        # Messages of the user's threads, found through the membership index instead of
+        # an OR over sender and recipient
+        threads = ConversationMember.objects.filter(user=self.request.user).values('conversation')
+        return Message.objects.filter(conversation__in=threads).select_related('sender')
 
     def perform_create(self, serializer):
-        serializer.save(sender=self.request.user)
-
-
+        sender, recipient = self.request.user, serializer.validated_data['recipient']
+        with transaction.atomic():
+            conversation = get_or_create_conversation(sender.id, recipient.id)
+            message = serializer.save(sender=sender, conversation=conversation)
+            record_message(message)
+            publish(message.recipient_id, 'message', MessageSerializer(message).data)
+        enqueue(message.recipient_id, message.sender_id, NotificationEvent.MESSAGE)
+
+
+class ConversationViewSet(viewsets.ReadOnlyModelViewSet):
+    # The inbox: one entry per thread, most recently active first
+    serializer_class = ConversationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-last_message_at', '-id')
+    lookup_field = 'conversation'
+    lookup_url_kwarg = 'pk'
 
-class RepostViewSet(viewsets.ModelViewSet):
-    queryset = Repost.objects.all()
-    serializer_class = PostSerializer
+    def get_queryset(self):
+        return ConversationMember.objects.filter(user=self.request.user).select_related(
+            'conversation__last_message__sender',
+        ).prefetch_related(
+            Prefetch('conversation__members', queryset=ConversationMember.objects.select_related('user')),
+        )
+
+    @action(detail=True, methods=['get'])
+    def messages(self, request, pk=None):
+        # Served from the (conversation, created_at) index, newest first
+        if not ConversationMember.objects.filter(user=request.user, conversation_id=pk).exists():
+            raise Http404
+        messages = Message.objects.filter(conversation_id=pk).select_related('sender')
+        return fast_page(KeysetPagination(), fast_message_serializer, messages, request, ('-created_at', '-id'))
+
+    @action(detail=True, methods=['post'])
+    def read(self, request, pk=None):
+        membership = self.get_object()
+        return Response({"marked_read": mark_conversation_read(membership.conversation_id, request.user.id)})
+
+
+
+class RepostViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, mixins.DestroyModelMixin,
+                    viewsets.GenericViewSet):
+    # Users see and undo only their own reposts; reposts are never edited
+    queryset = Repost.objects.select_related('user')
+    serializer_class = RepostSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_queryset(self):
+        return self.queryset.filter(user=self.request.user)
+
     def create(self, request, *args, **kwargs):
-        original_post = Post.objects.get(id=request.data['post_id'])
-        repost, created = Repost.objects.get_or_create(user=request.user, original_post=original_post)
+        original_post, error = post_from_request(request.data, 'post_id')
+        if error:
+            return error
+        with transaction.atomic():
+            lock_user_writes(request.user.id)
+            repost, created = Repost.objects.get_or_create(user=request.user, original_post=original_post)
+            if created:
+                Post.objects.filter(pk=original_post.pk).update(repost_count=F('repost_count') + 1)
         if not created:
             return Response({"message": "Post already reposted"}, status=status.HTTP_400_BAD_REQUEST)
         return Response({"message": "Post reposted"}, status=status.HTTP_201_CREATED)
 
+    def perform_destroy(self, instance):
+        # A concurrent DELETE of the same repost removes nothing here and must not decrement again
+        with transaction.atomic():
+            lock_user_writes(instance.user_id)
+            deleted, _ = instance.delete()
+            if deleted:
+                Post.objects.filter(pk=instance.original_post_id).update(repost_count=F('repost_count') - deleted)
+
 
-class HashtagViewSet(viewsets.ModelViewSet):
+class HashtagViewSet(viewsets.ReadOnlyModelViewSet):
+    # Hashtags are written only by sync_post_hashtags as posts change
     queryset = Hashtag.objects.all()
     serializer_class = HashtagSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('name',)
+    lookup_field = 'name'
+    lookup_value_regex = '[^/]+'
 
     def list(self, request):
-        keyword = request.query_params.get('keyword', None)
-        if keyword:
-            hashtags = Hashtag.objects.filter(name__icontains=keyword)
-        else:
-            hashtags = Hashtag.objects.all()
-        serializer = HashtagSerializer(hashtags, many=True)
-        return Response(serializer.data)
+        # Prefix lookup for autocomplete; 'keyword' is kept as an alias of 'prefix'
+        prefix = request.query_params.get('prefix', request.query_params.get('keyword', None))
+        hashtags = Hashtag.objects.all()
+        if prefix:
+            hashtags = hashtags.filter(name__startswith=normalize(prefix))
+        page = self.paginate_queryset(hashtags)
+        serializer = HashtagSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @cached_response('hashtag', lookup='name')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @action(detail=True, methods=['get'])
+    @cached_response('hashtag', lookup='name')
+    def posts(self, request, name=None):
+        hashtag = self.get_object()
+        posts = Post.objects.filter(hashtags=hashtag)
+        return fast_page(KeysetPagination(), fast_post_serializer, posts, request, ('-created_at', '-id'))
+
+
+class MediaAssetViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    queryset = MediaAsset.objects.all()
+    serializer_class = MediaAssetSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def create(self, request):
+        # Multipart upload of one image in 'file'. The same content is stored once: uploading it
+        # again returns the existing asset. Poll the asset until its status is 'ready'
+        hasher = HashingUploadHandler(request)
+        request.upload_handlers.insert(0, hasher)  # before the body is parsed
+        upload = request.FILES.get('file')
+        if 'file' in hasher.too_large:
+            return Response({"error": f"Files are limited to {settings.MEDIA_PROCESSING['MAX_UPLOAD_BYTES']} bytes"},
+                            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        if upload is None:
+            return Response({"error": "Upload an image in the 'file' field"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            asset, created = store_upload(upload, hasher.digests['file'], request.user)
+        except InvalidImage as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(MediaAssetSerializer(asset).data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
 
 
 class TrendingPostViewSet(viewsets.ViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def list(self, request):
-        # Get posts ordered by the number of likes or reposts within a given time period
-        posts = Post.objects.annotate(like_count=models.Count('likes')).order_by('-like_count', '-created_at')
-        serializer = PostSerializer(posts, many=True)
-        return Response(serializer.data)
+        # Serve the top-N from the ranking precomputed by the compute_trending command
+        window = request.query_params.get('window', settings.TRENDING_DEFAULT_WINDOW)
+        if window not in settings.TRENDING_WINDOWS:
+            return Response({"error": f"Unknown window, choose one of: {', '.join(settings.TRENDING_WINDOWS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(int(request.query_params.get('limit', settings.TRENDING_TOP_N)), settings.TRENDING_TOP_N)
+        except ValueError:
+            limit = settings.TRENDING_TOP_N
+
+        post_ids = top_post_ids(window, max(limit, 0))
+        rows = {row['id']: row for row in fast_post_serializer.values(Post.objects.filter(id__in=post_ids))}
+        ranked = [rows[post_id] for post_id in post_ids if post_id in rows]
+        return Response({"window": window, "results": fast_post_serializer.serialize(ranked)})
+
+
+class SuggestionViewSet(viewsets.ViewSet):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def list(self, request):
+        # "Who to follow": accounts followed by the most of the people you follow
+        ranked = get_graph().suggestions(request.user.id, graph_limit(request))
+        usernames = dict(User.objects.filter(id__in=[user_id for user_id, _ in ranked]).values_list('id', 'username'))
+        return Response({"results": [
+            {"id": user_id, "username": usernames[user_id], "mutual_count": count}
+            for user_id, count in ranked if user_id in usernames
+        ]})
+
+
+class CacheStatsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        # Response cache hit/miss counters
+        return Response(cache_stats())
+
+
+class PerformanceStatsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        # Latency histograms per endpoint and the slowest recent requests, for this process
+        return Response(performance_stats())
@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 import dj_database_url
 import os
 from datetime import timedelta
@@ -45,7 +45,10 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',  # Ensure WhiteNoise is placed after SecurityMiddleware
+    'mingx_media_app.middleware.AsyncWhiteNoiseMiddleware',  # Ensure WhiteNoise is placed after SecurityMiddleware
+    'mingx_media_app.middleware.PerformanceMiddleware',  # After WhiteNoise, so static files are not measured
+    'mingx_media_app.middleware.CompressionMiddleware',  # Inside PerformanceMiddleware, so its time is measured
+    'mingx_media_app.middleware.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -89,10 +92,30 @@ SIMPLE_JWT = {
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Connections are kept open for DATABASE_CONN_MAX_AGE seconds and reused by the following
+# requests of the same thread, instead of paying connection setup (TCP, TLS, auth) on every
+# request. Health checks ping a reused connection once per request, so a connection dropped
+# by the server is replaced instead of failing the request. Use 0 under ASGI, where each
+# request runs in a new thread. Behind a transaction-mode pooler such as PgBouncer, disable
+# server-side cursors
+database_options = {
+    'conn_max_age': config('DATABASE_CONN_MAX_AGE', default=600, cast=int),
+    'conn_health_checks': config('DATABASE_CONN_HEALTH_CHECKS', default=True, cast=bool),
+    'disable_server_side_cursors': config('DATABASE_DISABLE_SERVER_SIDE_CURSORS', default=False, cast=bool),
+}
+
 DATABASES = {
-    'default': dj_database_url.config(default=config('DATABASE_URL'))
+    'default': dj_database_url.config(default=config('DATABASE_URL'), **database_options)
 }
 
+# Read replicas: DATABASE_REPLICA_URLS (comma separated) become the aliases replica1, replica2, ...
+# Test runs point them at the test database
+DATABASES.update({
+    f'replica{index}': dj_database_url.parse(url, test_options={'MIRROR': 'default'}, **database_options)
+    for index, url in enumerate(config('DATABASE_REPLICA_URLS', default='', cast=Csv()), 1)
+})
+DATABASE_ROUTERS = ['mingx_media_app.routers.ReplicaRouter']
+
 
 
 # Password validation
@@ -132,7 +155,19 @@ USE_TZ = True
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STATIC_URL = '/static/'
 
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# Uploaded media go to MEDIA_ROOT by default; set MEDIA_STORAGE_BACKEND to
+# storages.backends.s3.S3Storage (django-storages, needs boto3) to keep them in S3
+STORAGES = {
+    'default': {
+        'BACKEND': config('MEDIA_STORAGE_BACKEND', default='django.core.files.storage.FileSystemStorage'),
+    },
+    'staticfiles': {
+        'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+AWS_STORAGE_BUCKET_NAME = config('AWS_STORAGE_BUCKET_NAME', default=None)
+AWS_S3_CUSTOM_DOMAIN = config('AWS_S3_CUSTOM_DOMAIN', default=None)
+AWS_QUERYSTRING_AUTH = False  # variant URLs are stored with the asset, so they must not expire
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
@@ -142,11 +177,22 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # SimpleJWT with an in-process cache of users (see AUTH_PRINCIPAL_CACHE)
+        'mingx_media_app.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # orjson-backed JSON (same output as DRF's renderer, several times faster to encode)
+    'DEFAULT_RENDERER_CLASSES': (
+        'mingx_media_app.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'mingx_media_app.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
 }
@@ -165,4 +211,164 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 # Media files (Uploads)
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Home timeline (fan-out-on-write)
+# Authors with more followers than this are merged into feeds at read time instead
+TIMELINE_FANOUT_MAX_FOLLOWERS = config('TIMELINE_FANOUT_MAX_FOLLOWERS', default=10000, cast=int)
+TIMELINE_MAX_LENGTH = config('TIMELINE_MAX_LENGTH', default=800, cast=int)
+TIMELINE_FANOUT_BATCH_SIZE = 1000
+# New posts are fanned out after commit by a pool of TIMELINE_FANOUT_WORKERS threads per
+# process; 0 fans out inline. Beyond TIMELINE_FANOUT_MAX_PENDING queued posts, the request
+# fans out inline instead of dropping the post
+TIMELINE_FANOUT_WORKERS = config('TIMELINE_FANOUT_WORKERS', default=2, cast=int)
+TIMELINE_FANOUT_MAX_PENDING = 1000
+TIMELINE_PULL_AUTHORS_TTL = 300
+# Share of followers whose timelines are trimmed to TIMELINE_MAX_LENGTH by each fan-out
+TIMELINE_TRIM_SAMPLE_RATE = config('TIMELINE_TRIM_SAMPLE_RATE', default=0.05, cast=float)
+
+
+# Trending posts
+# Each window scores engagement inside it, decayed exponentially with the given half-life
+TRENDING_WINDOWS = {
+    '1h': {'length': timedelta(hours=1), 'half_life': timedelta(minutes=15)},
+    '24h': {'length': timedelta(hours=24), 'half_life': timedelta(hours=6)},
+    '7d': {'length': timedelta(days=7), 'half_life': timedelta(days=1)},
+}
+TRENDING_DEFAULT_WINDOW = '24h'
+TRENDING_WEIGHTS = {'like': 1.0, 'comment': 2.0, 'repost': 3.0}
+TRENDING_TOP_N = 50
+# Runs read events up to this far behind the clock, so events stamped before a run but
+# committed after it are still counted
+TRENDING_SETTLE_LAG = timedelta(seconds=config('TRENDING_SETTLE_LAG', default=60, cast=int))
+
+
+# Response cache for post, profile and hashtag reads
+# LocMemLRUBackend is per process; use DjangoCacheBackend (backed by a shared CACHES
+# entry such as Redis or Memcached) when running several gunicorn workers
+RESPONSE_CACHE = {
+    'BACKEND': config('RESPONSE_CACHE_BACKEND', default='mingx_media_app.caching.LocMemLRUBackend'),
+    'OPTIONS': {},
+    'TIMEOUT': config('RESPONSE_CACHE_TIMEOUT', default=300, cast=int),
+}
+
+
+# Notification pipeline
+# Write paths enqueue NotificationEvent rows; `manage.py process_notifications` coalesces them
+NOTIFICATION_BATCH_SIZE = config('NOTIFICATION_BATCH_SIZE', default=500, cast=int)
+
+
+# Real-time stream (GET /stream/, served by the ASGI process only)
+# Events are published by the web process and the notification worker and must reach the
+# ASGI process, so on PostgreSQL the default is PostgresBroker (LISTEN/NOTIFY). LocalBroker,
+# the default elsewhere, only reaches connections held by the publishing process;
+# process_notifications refuses to run with it unless given --without-stream
+REALTIME = {
+    'BROKER': config('REALTIME_BROKER', default='mingx_media_app.realtime.PostgresBroker'
+                     if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql'
+                     else 'mingx_media_app.realtime.LocalBroker'),
+    'OPTIONS': {},
+    'QUEUE_SIZE': 100,
+    'KEEPALIVE': config('REALTIME_KEEPALIVE', default=15, cast=int),
+}
+
+
+# Batch endpoints (multi-get posts, batch like/unlike, bulk follow import)
+BATCH_MAX_ITEMS = config('BATCH_MAX_ITEMS', default=100, cast=int)
+
+
+# In-memory follow graph (mutuals and suggestions)
+# Rebuilt in the background from the Follow table when older than this many seconds, so
+# follows written by other processes show up; follows written by this process are applied
+# immediately
+GRAPH_RELOAD_INTERVAL = config('GRAPH_RELOAD_INTERVAL', default=300, cast=int)
+GRAPH_MAX_OVERLAY = 100000
+GRAPH_SUGGESTION_FANOUT = 200
+
+
+# Authenticated users cached per process by CachedJWTAuthentication, so requests skip the
+# User query. Saves and deletes in this process evict immediately; changes made by other
+# processes (e.g. deactivating a user) take effect within TIMEOUT seconds
+AUTH_PRINCIPAL_CACHE = {
+    'TIMEOUT': config('AUTH_PRINCIPAL_CACHE_TIMEOUT', default=60, cast=int),
+    'MAX_ENTRIES': 10000,
+}
+
+
+# Per-request instrumentation (PerformanceMiddleware): Server-Timing headers, per-endpoint
+# histograms at GET /stats/performance/ and a log of requests slower than SLOW_REQUEST_MS
+# with their slowest SQL. PROFILE_SAMPLE_RATE (0..1) of sync requests are cProfiled into PROFILE_DIR
+PERFORMANCE = {
+    'ENABLED': config('PERFORMANCE_ENABLED', default=True, cast=bool),
+    'SLOW_REQUEST_MS': config('PERFORMANCE_SLOW_REQUEST_MS', default=500, cast=int),
+    'SLOW_QUERY_LIMIT': 20,
+    'SLOW_LOG_SIZE': 50,
+    'HISTOGRAM_WINDOW': 1000,
+    'PROFILE_SAMPLE_RATE': config('PERFORMANCE_PROFILE_SAMPLE_RATE', default=0.0, cast=float),
+    'PROFILE_DIR': config('PERFORMANCE_PROFILE_DIR', default=str(BASE_DIR / 'profiles')),
+}
+
+# One JSON line per request at INFO, only slow requests at WARNING
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'mingx_media_app.performance': {
+            'handlers': ['console'],
+            'level': config('PERFORMANCE_LOG_LEVEL', default='WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
+
+# Read replicas (see DATABASE_REPLICA_URLS above). Safe-method requests read from a healthy
+# replica; after a write, the user's reads stay on the primary for STICKY_SECONDS. The pin is
+# kept in the RESPONSE_CACHE backend by user id, with a signed cookie as fallback. On PostgreSQL a
+# replica more than MAX_LAG_SECONDS behind is skipped; keep it below STICKY_SECONDS
+DATABASE_REPLICAS = {
+    'ALIASES': [alias for alias in DATABASES if alias != 'default'],
+    'STICKY_SECONDS': config('DATABASE_REPLICA_STICKY_SECONDS', default=10, cast=int),
+    'MAX_LAG_SECONDS': config('DATABASE_REPLICA_MAX_LAG_SECONDS', default=5, cast=int),
+    'HEALTH_CHECK_INTERVAL': config('DATABASE_REPLICA_HEALTH_CHECK_INTERVAL', default=5, cast=int),
+}
+
+
+# Media uploads (POST /uploads/). Images are stored once per SHA-256 and resized into
+# VARIANTS (longest edge in pixels, or a square crop) by a pool of WORKERS threads per
+# process; WORKERS = 0 processes inline. Assets beyond MAX_PENDING queued ones, or lost in a
+# restart, are picked up by `manage.py process_media`
+MEDIA_PROCESSING = {
+    'WORKERS': config('MEDIA_PROCESSING_WORKERS', default=2, cast=int),
+    'MAX_PENDING': 100,
+    'MAX_UPLOAD_BYTES': config('MEDIA_MAX_UPLOAD_BYTES', default=20 * 1024 * 1024, cast=int),
+    'MAX_PIXELS': 40_000_000,
+    'QUALITY': 85,
+    'VARIANTS': {
+        'thumbnail': {'size': 150, 'crop': True},
+        'feed': {'size': 640},
+        'full': {'size': 1600},
+    },
+}
+
+
+# Compression of API responses (CompressionMiddleware): Brotli when the brotli package is
+# installed and the client accepts it, gzip otherwise. Responses under MIN_SIZE bytes gain
+# too little to be worth the CPU
+RESPONSE_COMPRESSION = {
+    'ENABLED': config('RESPONSE_COMPRESSION_ENABLED', default=True, cast=bool),
+    'MIN_SIZE': config('RESPONSE_COMPRESSION_MIN_SIZE', default=1024, cast=int),
+    'CONTENT_TYPES': ['application/json'],
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 4,
+}
+
+
+# Comments: replies nest at most COMMENT_MAX_DEPTH levels below a top-level comment (at most 20,
+# so thread paths fit Comment.path; checked by mingx_media_app.E001), and each feed item
+# embeds its FEED_COMMENT_PREVIEWS latest top-level comments (0 turns previews off)
+COMMENT_MAX_DEPTH = config('COMMENT_MAX_DEPTH', default=10, cast=int)
+FEED_COMMENT_PREVIEWS = config('FEED_COMMENT_PREVIEWS', default=3, cast=int)
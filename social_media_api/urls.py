@@ -14,9 +14,11 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
+from django.conf.urls.static import static
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from mingx_media_app import views
+from mingx_media_app import async_views, views
 from django.contrib import admin
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
@@ -27,6 +29,15 @@ router.register(r'follows', views.FollowViewSet)
 router.register(r'users', views.UserViewSet)
 router.register(r'feed', views.FeedViewSet, basename='feed')
 router.register(r'comments', views.CommentViewSet)
+router.register(r'messages', views.MessageViewSet)
+router.register(r'conversations', views.ConversationViewSet, basename='conversation')
+router.register(r'notifications', views.NotificationViewSet)
+router.register(r'likes', views.LikeViewSet)
+router.register(r'reposts', views.RepostViewSet)
+router.register(r'hashtags', views.HashtagViewSet)
+router.register(r'trending', views.TrendingPostViewSet, basename='trending')
+router.register(r'suggestions', views.SuggestionViewSet, basename='suggestions')
+router.register(r'uploads', views.MediaAssetViewSet)
 
 
 urlpatterns = [
@@ -34,4 +45,15 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
-]
\ No newline at end of file
+    path('stats/cache/', views.CacheStatsView.as_view(), name='cache_stats'),
+    path('stats/performance/', views.PerformanceStatsView.as_view(), name='performance_stats'),
+    path('stream/', async_views.event_stream, name='event_stream'),
+    # Native async variants of the hot read paths, for ASGI servers
+    path('async/feed/', async_views.feed, name='async_feed'),
+    path('async/posts/<int:pk>/', async_views.post_detail, name='async_post_detail'),
+    path('async/users/<int:pk>/', async_views.user_detail, name='async_user_detail'),
+    path('async/notifications/', async_views.notifications, name='async_notifications'),
+]
+
+# Uploaded media, served by Django only when DEBUG is on
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)